@@ -8,15 +8,47 @@
 
 """
 This is the top-level namespace of the groot_rocker package.
+
+Submodules are imported on first access so that light weight entry points
+(i.e. the :mod:`groot_rocker.client` of ``groot-rocker serve``) don't pay
+for importing docker et al.
 """
 ##############################################################################
 # Imports
 ##############################################################################
 
-from . import cli  # noqa
-from . import console  # noqa
-from . import core  # noqa
-from . import extensions  # noqa
-from . import os_detector  # noqa
+import importlib
+
+__all__ = [
+    'aio',
+    'attach',
+    'batch',
+    'build_events',
+    'cache',
+    'cli',
+    'client',
+    'console',
+    'core',
+    'extensions',
+    'logs',
+    'os_detector',
+    'plugins',
+    'pool',
+    'run_options',
+    'server',
+    'session',
+    'tracing',
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    if name == '__version__':
+        from .version import __version__
+        return __version__
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
-from .version import __version__
+def __dir__():
+    return sorted(list(globals().keys()) + __all__ + ['__version__'])
@@ -0,0 +1,682 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+An asyncio api for embedding groot_rocker in orchestration services.
+
+.. code-block:: python
+
+   from groot_rocker import aio, cli
+
+   async def nightly(configs):
+       launches = [aio.launch(cli.load_arguments(['-c', config])) for config in configs]
+       for result in await asyncio.gather(*launches):
+           print(result.exit_code, result.tail)
+
+Containers are created, run, streamed and cleaned up by an asyncio docker
+api client (:class:`AsyncDockerClient`), i.e. hundreds of concurrent
+launches cost sockets, not threads. Work that is inherently blocking
+(planning and building images, the extensions' hooks, warming pools) is
+delegated to a small, bounded thread pool. Nothing is printed, options are
+copied rather than mutated and every operation returns a structured
+result. Cancelling an awaitable removes any container it created.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import asyncio
+import base64
+import concurrent.futures
+import json
+import shlex
+import ssl
+import time
+import typing
+import urllib.parse
+import weakref
+
+import docker
+
+from . import core
+from . import logs
+from . import os_detector
+from . import pool
+from . import run_options
+
+##############################################################################
+# Constants
+##############################################################################
+
+API_VERSION = 'auto'  # negotiated with the daemon, as docker-py does
+BLOCKING_WORKERS = 4  # builds, hooks and other blocking work
+DEFAULT_TAIL = logs.DEFAULT_LOG_TAIL
+
+##############################################################################
+# Results
+##############################################################################
+
+
+class Result(object):
+    """Base class for the structured results."""
+    def __repr__(self):
+        return "%s(%s)" % (
+            self.__class__.__name__,
+            ", ".join("%s=%r" % (k, v) for k, v in self.__dict__.items() if k != 'generator')
+        )
+
+
+class BuildResult(Result):
+    """
+    Args:
+        exit_code: 0 if the image is ready
+        image_id: the built (or cached) image
+        image_key: content hash of the image
+        cache_hit: whether an existing image with the same key was used
+        duration: seconds
+        error: why the build failed, if it did
+        generator: the :class:`~groot_rocker.core.DockerImageGenerator`, for running the image
+    """
+    def __init__(self, exit_code, image_id=None, image_key=None, cache_hit=False, duration=0.0, error=None, generator=None):
+        self.exit_code = exit_code
+        self.image_id = image_id
+        self.image_key = image_key
+        self.cache_hit = cache_hit
+        self.duration = duration
+        self.error = error
+        self.generator = generator
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class RunResult(Result):
+    """
+    Args:
+        exit_code: of the command (1 if it could not be run)
+        container_id: the container it ran in
+        duration: seconds
+        output_bytes: volume of (combined stdout and stderr) output
+        tail: the last lines of output
+        error: why it could not be run, if it couldn't
+        build: the build, for :func:`launch`
+    """
+    def __init__(self, exit_code, container_id=None, duration=0.0, output_bytes=0, tail=None, error=None, build=None):
+        self.exit_code = exit_code
+        self.container_id = container_id
+        self.duration = duration
+        self.output_bytes = output_bytes
+        self.tail = tail or []
+        self.error = error
+        self.build = build
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class DetectResult(Result):
+    """
+    Args:
+        image: name of the image
+        os: the (name, version, codename) tuple, None if it could not be detected
+        error: why it could not be detected, if it couldn't
+    """
+    def __init__(self, image, os=None, error=None):
+        self.image = image
+        self.os = os
+        self.error = error
+
+##############################################################################
+# Client
+##############################################################################
+
+
+class _Response(object):
+
+    def __init__(self, status, headers, reader, writer):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+        self.complete = False  # the body has been read in full (and the connection can be reused)
+
+    async def chunks(self) -> typing.AsyncIterator[bytes]:
+        """The body, as it arrives."""
+        if self.status in (204, 304):
+            self.complete = True
+        elif self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunk = await self.reader.readexactly(size)
+                await self.reader.readline()
+                yield chunk
+            self.complete = True
+        elif 'content-length' in self.headers:
+            remaining = int(self.headers['content-length'])
+            while remaining > 0:
+                chunk = await self.reader.read(min(remaining, 1 << 16))
+                if not chunk:
+                    raise ConnectionError("the docker daemon closed the connection")
+                remaining -= len(chunk)
+                yield chunk
+            self.complete = True
+        else:  # until closed, e.g. a hijacked (101) stream
+            while True:
+                chunk = await self.reader.read(1 << 16)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def read(self) -> bytes:
+        return b''.join([chunk async for chunk in self.chunks()])
+
+    async def json(self) -> typing.Any:
+        return json.loads(await self.read() or b'null')
+
+
+async def _demultiplex(chunks: typing.AsyncIterator[bytes]) -> typing.AsyncIterator[bytes]:
+    """Payloads of a multiplexed (8 byte header framed) stdout/stderr stream."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= 8:
+            length = int.from_bytes(buffer[4:8], 'big')
+            if len(buffer) < 8 + length:
+                break
+            yield bytes(buffer[8:8 + length])
+            del buffer[:8 + length]
+
+
+def _ssl_context(tls_config) -> ssl.SSLContext:
+    context = ssl.create_default_context(cafile=tls_config.ca_cert if tls_config.verify else None)
+    if not tls_config.verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if tls_config.cert:
+        context.load_cert_chain(*tls_config.cert)
+    return context
+
+
+class AsyncDockerClient(object):
+    """
+    A minimal asyncio client for the parts of the docker api that launching
+    containers needs. Connections are kept alive and reused. Errors are raised
+    as the docker-py exceptions (:class:`docker.errors.NotFound`, ...).
+
+    Args:
+        base_url: e.g. unix:///var/run/docker.sock, tcp://host:2375, default: from the environment (``DOCKER_HOST``)
+        version: api version, 'auto' to negotiate it with the daemon on the first request
+        ssl_context: for https, default: from the environment (``DOCKER_TLS_VERIFY``, ``DOCKER_CERT_PATH``)
+    """
+    def __init__(
+        self,
+        base_url: typing.Optional[str]=None,
+        version: str=API_VERSION,
+        ssl_context: typing.Optional[ssl.SSLContext]=None
+    ):
+        if base_url is None:
+            environment = docker.utils.kwargs_from_env()
+            base_url = environment.get('base_url')
+            if ssl_context is None and environment.get('tls'):
+                ssl_context = _ssl_context(environment['tls'])
+        base_url = docker.utils.parse_host(base_url, False, tls=ssl_context is not None)
+        url = urllib.parse.urlparse(base_url)
+        self.unix_socket = url.path if url.scheme == 'http+unix' else None
+        self.address = (url.hostname, url.port) if self.unix_socket is None else None
+        self.ssl_context = ssl_context if url.scheme == 'https' else None
+        self.version = version
+        self._negotiation = None  # lock, created on the event loop
+        self._idle = []  # (reader, writer) of kept alive connections
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for unused_reader, writer in idle:
+            writer.close()
+
+    async def api_version(self) -> typing.Optional[str]:
+        """The api version, negotiated once if 'auto' (from the ping's API-Version header, else /version)."""
+        if self.version == 'auto':
+            if self._negotiation is None:
+                self._negotiation = asyncio.Lock()
+            async with self._negotiation:
+                if self.version == 'auto':
+                    response = await self.request('GET', '/_ping', versioned=False)
+                    await self._read(response)
+                    version = response.headers.get('api-version')
+                    if not version:
+                        version = (await self.call('GET', '/version', versioned=False)).get('ApiVersion')
+                    self.version = version or docker.constants.DEFAULT_DOCKER_API_VERSION
+        return self.version
+
+    async def _connect(self, reuse: bool=True):
+        """A kept alive connection if there is one (and reuse is set), else a new one."""
+        while reuse and self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        if self.unix_socket is not None:
+            return (*await asyncio.open_unix_connection(self.unix_socket), False)
+        return (*await asyncio.open_connection(*self.address, ssl=self.ssl_context), False)
+
+    def _release(self, response: _Response):
+        if response.complete and response.headers.get('connection', '').lower() != 'close':
+            self._idle.append((response.reader, response.writer))
+        else:
+            response.writer.close()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: typing.Optional[typing.Dict[str, typing.Any]]=None,
+        body: typing.Any=None,
+        upgrade: bool=False,
+        versioned: bool=True
+    ) -> _Response:
+        """
+        Send a request, returning once the response headers have arrived. The caller
+        must consume the body (see :meth:`call` and :meth:`stream`).
+        """
+        version = await self.api_version() if versioned else None
+        target = '/v%s%s' % (version, path) if version else path
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        if params:
+            target += '?' + urllib.parse.urlencode(params)
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = ['Host: docker', 'Content-Length: %d' % len(payload)]
+        if body is not None:
+            headers.append('Content-Type: application/json')
+        if upgrade:
+            headers += ['Connection: Upgrade', 'Upgrade: tcp']
+        request = ('%s %s HTTP/1.1\r\n%s\r\n\r\n' % (method, target, '\r\n'.join(headers))).encode() + payload
+        reader, writer, reused = await self._connect()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line and reused:
+                # the daemon may close a kept alive connection at any time, retry on a new one
+                writer.close()
+                reader, writer, reused = await self._connect(reuse=False)
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("the docker daemon closed the connection")
+            status = int(status_line.split()[1])
+            response_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                response_headers[key.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        response = _Response(status, response_headers, reader, writer)
+        if status >= 400:
+            message = await self._read(response)
+            try:
+                message = json.loads(message).get('message', message)
+            except (ValueError, AttributeError):
+                message = message.decode(errors='replace')
+            if status == 404:
+                raise (docker.errors.ImageNotFound if 'image' in message.lower() else docker.errors.NotFound)(message)
+            raise docker.errors.APIError(message)
+        return response
+
+    async def _read(self, response: _Response) -> bytes:
+        try:
+            return await response.read()
+        finally:
+            self._release(response)
+
+    async def call(self, method, path, params=None, body=None, versioned=True) -> typing.Any:
+        """Request and return the decoded (json) body."""
+        data = await self._read(await self.request(method, path, params, body, versioned=versioned))
+        return json.loads(data) if data else None
+
+    async def stream(self, method, path, params=None, body=None, upgrade=False) -> typing.AsyncIterator[bytes]:
+        response = await self.request(method, path, params, body, upgrade=upgrade)
+        try:
+            async for chunk in response.chunks():
+                yield chunk
+        finally:
+            self._release(response)
+
+    # Api
+
+    async def ping(self) -> bool:
+        return (await self._read(await self.request('GET', '/_ping'))) == b'OK'
+
+    async def inspect_image(self, image: str) -> typing.Dict[str, typing.Any]:
+        return await self.call('GET', '/images/%s/json' % image)
+
+    def create_host_config(self, **kwargs) -> typing.Dict[str, typing.Any]:
+        """
+        As per docker-py's, e.g. for :meth:`~groot_rocker.run_options.RunOptions.create_kwargs`.
+        The options depend on the api version, await :meth:`api_version` first.
+        """
+        if self.version == 'auto':
+            raise docker.errors.InvalidVersion("the api version has not been negotiated yet, await api_version() first")
+        return docker.types.HostConfig(self.version, **kwargs)
+
+    async def create_container(self, image, command=None, name=None, **kwargs) -> typing.Dict[str, typing.Any]:
+        """As per docker-py's (same keyword arguments)."""
+        config = docker.types.ContainerConfig(await self.api_version(), image, command, **kwargs)
+        return await self.call('POST', '/containers/create', {'name': name}, config)
+
+    async def start(self, container: str):
+        await self.call('POST', '/containers/%s/start' % container)
+
+    async def wait(self, container: str) -> typing.Dict[str, typing.Any]:
+        return await self.call('POST', '/containers/%s/wait' % container)
+
+    async def kill(self, container: str):
+        await self.call('POST', '/containers/%s/kill' % container)
+
+    async def remove_container(self, container: str, force: bool=False):
+        await self.call('DELETE', '/containers/%s' % container, {'force': 'true' if force else None})
+
+    async def logs(self, container: str, tty: bool=False) -> typing.AsyncIterator[bytes]:
+        """Follow the (combined) output of a container."""
+        chunks = self.stream('GET', '/containers/%s/logs' % container, {'stdout': 1, 'stderr': 1, 'follow': 1})
+        try:
+            async for chunk in (chunks if tty else _demultiplex(chunks)):
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    async def exec_create(self, container: str, command: typing.List[str]) -> typing.Dict[str, typing.Any]:
+        return await self.call('POST', '/containers/%s/exec' % container, body={
+            'AttachStdin': False, 'AttachStdout': True, 'AttachStderr': True, 'Tty': False, 'Cmd': command
+        })
+
+    async def exec_start(self, exec_id: str) -> typing.AsyncIterator[bytes]:
+        """The (combined) output of the exec."""
+        chunks = self.stream('POST', '/exec/%s/start' % exec_id, body={'Detach': False, 'Tty': False}, upgrade=True)
+        try:
+            async for chunk in _demultiplex(chunks):
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    async def exec_inspect(self, exec_id: str) -> typing.Dict[str, typing.Any]:
+        return await self.call('GET', '/exec/%s/json' % exec_id)
+
+    async def get_archive(self, container: str, path: str) -> typing.Tuple[bytes, typing.Dict[str, typing.Any]]:
+        response = await self.request('GET', '/containers/%s/archive' % container, {'path': path})
+        stat = response.headers.get('x-docker-container-path-stat')
+        return await self._read(response), json.loads(base64.b64decode(stat)) if stat else {}
+
+##############################################################################
+# Helpers
+##############################################################################
+
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> client
+_executor = None
+
+
+def get_client() -> AsyncDockerClient:
+    """The shared client of the running event loop (configured from the environment)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        _clients[loop] = AsyncDockerClient()
+    return _clients[loop]
+
+
+async def _blocking(function, *args):
+    """Run blocking work in the (bounded, shared) thread pool."""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix='groot_rocker_aio')
+    return await asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+
+async def _cleanup(client: AsyncDockerClient, container: str):
+    try:
+        await client.remove_container(container, force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+async def _stream_to(chunks: typing.AsyncIterator[bytes], capture: logs.LogCapture, output):
+    try:
+        async for chunk in chunks:
+            capture.write(chunk)
+            if output is not None:
+                output.write(chunk)
+    finally:
+        await chunks.aclose()  # release the connection promptly, e.g. if cancelled
+
+##############################################################################
+# Operations
+##############################################################################
+
+
+def _build(options, extension_manager):
+    start = time.monotonic()
+    try:
+        active_extensions = extension_manager.get_active_extensions(options)
+        generator = core.DockerImageGenerator(active_extensions, options, options['image'])
+        exit_code = generator.build(verbose=False, **options)
+    except (core.RequiredExtensionMissingError, core.DependencyMissing, docker.errors.DockerException) as e:
+        return BuildResult(1, duration=time.monotonic() - start, error=str(e))
+    error = None
+    if exit_code != 0:
+        report = generator.build_report
+        error = report.errors[-1] if report is not None and report.errors else "the build failed"
+    return BuildResult(
+        exit_code, image_id=generator.image_id, image_key=generator.image_key, cache_hit=generator.cache_hit,
+        duration=time.monotonic() - start, error=error, generator=generator
+    )
+
+
+async def build(
+    options: typing.Dict[str, typing.Any],
+    extension_manager: typing.Optional[core.RockerExtensionManager]=None
+) -> BuildResult:
+    """
+    Build (or find the cached) image for a configuration.
+
+    Args:
+        options: as per :func:`groot_rocker.cli.load_arguments` (copied, not modified)
+        extension_manager: shared by many builds to save rediscovering the extensions
+    """
+    options = dict(options)
+    return await _blocking(_build, options, extension_manager or core.RockerExtensionManager())
+
+
+async def run_image(
+    image: str,
+    command: typing.Union[str, typing.List[str]]=(),
+    options: typing.Optional[run_options.RunOptions]=None,
+    output=None,
+    remove: bool=True,
+    tail: int=DEFAULT_TAIL,
+    client: typing.Optional[AsyncDockerClient]=None
+) -> RunResult:
+    """
+    Run a container non-interactively, streaming its output.
+
+    Args:
+        output: a binary file object (or :class:`~groot_rocker.logs.LogCapture`) for the output
+        tail: number of lines of output to keep for the result
+    """
+    client = client or get_client()
+    command = shlex.split(command) if isinstance(command, str) else list(command)
+    options = options or run_options.RunOptions()
+    capture = logs.LogCapture(tail=tail)
+    start = time.monotonic()
+    await client.api_version()  # the host config depends on it
+    container = (await client.create_container(**options.create_kwargs(client, image, command)))['Id']
+    try:
+        await client.start(container)
+        await _stream_to(client.logs(container), capture, output)
+        exit_code = (await client.wait(container)).get('StatusCode', 1)
+    except asyncio.CancelledError:
+        if not remove:
+            await asyncio.shield(client.kill(container))
+        raise
+    finally:
+        if remove:
+            await asyncio.shield(_cleanup(client, container))
+    return RunResult(
+        exit_code, container_id=container, duration=time.monotonic() - start,
+        output_bytes=capture.bytes_written, tail=capture.tail()
+    )
+
+
+async def run(
+    build_result: BuildResult,
+    command: typing.Union[str, typing.List[str], None]=None,
+    output=None,
+    persistent: bool=False,
+    tail: int=DEFAULT_TAIL,
+    client: typing.Optional[AsyncDockerClient]=None
+) -> RunResult:
+    """
+    Run a built configuration (non-interactively), after the extensions' precondition
+    and validate hooks.
+
+    Args:
+        command: default: the configuration's command
+        persistent: keep the container afterwards
+    """
+    generator = build_result.generator
+    if not build_result.ok or generator is None:
+        return RunResult(1, error="cannot run if the build has not passed", build=build_result)
+    if command is None:
+        command = generator.cliargs.get('command') or []
+    error = await _blocking(generator.check_environment)
+    if error is None:
+        try:
+            options = generator.get_run_options()
+        except run_options.UnsupportedRunOption as e:
+            error = "extension arguments are not supported by the api [%s]" % str(e)
+    if error is not None:
+        return RunResult(1, error=error, build=build_result)
+    image = generator.image_name if generator.image_name is not None else generator.image_id
+    try:
+        result = await run_image(image, command, options, output=output, remove=not persistent, tail=tail, client=client)
+    except (docker.errors.DockerException, OSError) as e:
+        return RunResult(1, error=str(e), build=build_result)
+    result.build = build_result
+    return result
+
+
+async def launch(
+    options: typing.Dict[str, typing.Any],
+    output=None,
+    tail: int=DEFAULT_TAIL,
+    extension_manager: typing.Optional[core.RockerExtensionManager]=None,
+    client: typing.Optional[AsyncDockerClient]=None
+) -> RunResult:
+    """Build and run a configuration, the asyncio equivalent of :func:`groot_rocker.cli.build_and_run`."""
+    build_result = await build(options, extension_manager)
+    if not build_result.ok:
+        return RunResult(build_result.exit_code, error=build_result.error, build=build_result)
+    return await run(build_result, output=output, persistent=bool(options.get('persistent')), tail=tail, client=client)
+
+
+async def pool_run(
+    container_pool,
+    command: typing.Union[str, typing.List[str]]=(),
+    output=None,
+    tail: int=DEFAULT_TAIL,
+    client: typing.Optional[AsyncDockerClient]=None
+) -> RunResult:
+    """
+    Execute a command in a warm container of a :class:`~groot_rocker.pool.ContainerPool`.
+    Acquiring (and if need be, warming) the pool is blocking, the exec itself is not.
+    """
+    client = client or get_client()
+    command = shlex.split(command) if isinstance(command, str) else list(command)
+    config = (await client.inspect_image(container_pool.image_id)).get('Config') or {}
+    command = pool.exec_command(config, command)
+    capture = logs.LogCapture(tail=tail)
+    start = time.monotonic()
+    container = await _blocking(container_pool.acquire)
+    exec_id = (await client.exec_create(container, command))['Id']
+    await _stream_to(client.exec_start(exec_id), capture, output)
+    exit_code = (await client.exec_inspect(exec_id)).get('ExitCode')
+    return RunResult(
+        exit_code if exit_code is not None else 1, container_id=container, duration=time.monotonic() - start,
+        output_bytes=capture.bytes_written, tail=capture.tail()
+    )
+
+
+async def _read_container_file(client, container, path, max_symlinks=8):
+    for unused_i in range(max_symlinks):
+        try:
+            data, stat = await client.get_archive(container, path)
+        except docker.errors.NotFound:
+            return None
+        content, path = os_detector.read_archive_file(path, data, stat)
+        if path is None:
+            return content
+    return None
+
+
+async def detect(image: str, client: typing.Optional[AsyncDockerClient]=None) -> DetectResult:
+    """
+    Detect the os of an image from its os-release file (see :func:`groot_rocker.os_detector.read_os_release`).
+    Results share the detector's cache (keyed by image id). Images without an os-release file
+    (or that need pulling) fall back to the blocking detector.
+    """
+    client = client or get_client()
+    try:
+        try:
+            image_id = (await client.inspect_image(image))['Id']
+        except docker.errors.ImageNotFound:
+            image_id = None
+        if image_id is not None:
+            result = await _blocking(os_detector.cached_os, image_id)
+            if result is not None:
+                return DetectResult(image, result)
+            container = (await client.create_container(image_id, ['/bin/true']))['Id']
+            try:
+                for path in os_detector.OS_RELEASE_PATHS:
+                    content = await _read_container_file(client, container, path)
+                    if content is not None:
+                        result = os_detector.os_release_to_distro(os_detector.parse_os_release(content))
+                        if result is not None:
+                            await _blocking(os_detector.cache_os, image_id, result)
+                        return DetectResult(image, result)
+            finally:
+                await asyncio.shield(_cleanup(client, container))
+        result = await _blocking(os_detector.detect_os, image)
+    except (docker.errors.DockerException, OSError, ValueError) as e:
+        return DetectResult(image, error=str(e))
+    return DetectResult(image, result, error=None if result is not None else "could not detect the os")
+
+
+async def detect_many(images: typing.Iterable[str], concurrency: int=32, client: typing.Optional[AsyncDockerClient]=None) -> typing.List[DetectResult]:
+    """Detect the os of many images, at most concurrency at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(image):
+        async with semaphore:
+            return await detect(image, client)
+
+    return await asyncio.gather(*[bounded(image) for image in images])
@@ -0,0 +1,341 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Interactive containers, attached directly to the container's tty via the
+docker api.
+
+The terminal is put in raw mode and bytes are relayed between it and the
+attach socket by an epoll loop that reads into a preallocated buffer and
+writes memoryview slices of it, i.e. no per chunk allocations or copies.
+Window size changes are forwarded through the api.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import contextlib
+import fcntl
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import termios
+import tty
+import typing
+
+import docker
+
+from . import tracing
+
+##############################################################################
+# Constants
+##############################################################################
+
+RELAY_BUFFER_SIZE = 256 * 1024
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def terminal_size(fd: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """(rows, columns) of the terminal, None if fd isn't a terminal."""
+    try:
+        rows, columns, unused_x, unused_y = struct.unpack(
+            'HHHH', fcntl.ioctl(fd, termios.TIOCGWINSZ, struct.pack('HHHH', 0, 0, 0, 0))
+        )
+    except OSError:
+        return None
+    return rows, columns
+
+
+@contextlib.contextmanager
+def raw_terminal(fd: int):
+    """Raw mode (if fd is a terminal) for the duration of the context."""
+    if not os.isatty(fd):
+        yield
+        return
+    attributes = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+
+
+def _write_all(fd: int, view: memoryview):
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class TerminalRelay(object):
+    """
+    Relays bytes between a terminal (or any pair of file descriptors) and a
+    connected socket until the socket is closed by the other end.
+
+    Args:
+        connection: the (attach) socket
+        stdin: file descriptor to read input from
+        stdout: file descriptor to write output to
+        on_resize: called when the window size changes (see :meth:`resize`)
+        buffer_size: size of each of the (preallocated) relay buffers
+    """
+    def __init__(
+        self,
+        connection: socket.socket,
+        stdin: int,
+        stdout: int,
+        on_resize: typing.Optional[typing.Callable[[], None]]=None,
+        buffer_size: int=RELAY_BUFFER_SIZE
+    ):
+        self.connection = connection
+        self.stdin = stdin
+        self.stdout = stdout
+        self.on_resize = on_resize
+        self.input_buffer = bytearray(buffer_size)
+        self.output_buffer = bytearray(buffer_size)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+
+    def resize(self):
+        """Request a call to on_resize from the relay loop (safe to call from a signal handler)."""
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            pass  # one is already pending
+
+    def close(self):
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def run(self):
+        """
+        Relay until the connection is closed. The connection is made non-blocking so a
+        peer that isn't reading can't stall the output, input is paused until it drains.
+        """
+        input_view = memoryview(self.input_buffer)
+        output_view = memoryview(self.output_buffer)
+        connection_fd = self.connection.fileno()
+        self.connection.setblocking(False)
+        poller = select.epoll()
+        poller.register(connection_fd, select.EPOLLIN)
+        poller.register(self._wakeup_read, select.EPOLLIN)
+        try:
+            poller.register(self.stdin, select.EPOLLIN)
+            pollable_stdin = True
+        except PermissionError:  # e.g. a regular file or /dev/null, which are always readable
+            pollable_stdin = False
+        polling_stdin = pollable_stdin  # registered with the poller
+        reading_stdin = True
+        pending = None  # unsent input
+
+        def poll_stdin(enable):
+            nonlocal polling_stdin
+            if enable == polling_stdin:
+                return
+            if enable:
+                poller.register(self.stdin, select.EPOLLIN)
+            else:
+                poller.unregister(self.stdin)
+            polling_stdin = enable
+
+        def send(data):
+            try:
+                sent = self.connection.send(data)
+            except BlockingIOError:
+                sent = 0
+            if sent == len(data):
+                return None
+            if pollable_stdin:
+                poll_stdin(False)
+            poller.modify(connection_fd, select.EPOLLIN | select.EPOLLOUT)
+            return data[sent:]
+
+        def drained():
+            poller.modify(connection_fd, select.EPOLLIN)
+            if not reading_stdin:
+                self.connection.shutdown(socket.SHUT_WR)
+            elif pollable_stdin:
+                poll_stdin(True)
+
+        try:
+            while True:
+                stdin_ready = reading_stdin and not pollable_stdin and pending is None
+                events = poller.poll(0 if stdin_ready else -1)
+                if stdin_ready:
+                    events.append((self.stdin, select.EPOLLIN))
+                for fd, event in events:
+                    if fd == connection_fd:
+                        if event & select.EPOLLOUT and pending is not None:
+                            pending = send(pending)
+                            if pending is None:
+                                drained()
+                        if event & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+                            try:
+                                received = self.connection.recv_into(output_view)
+                            except BlockingIOError:
+                                continue
+                            if not received:
+                                return
+                            self.bytes_out += received
+                            _write_all(self.stdout, output_view[:received])
+                    elif fd == self.stdin and reading_stdin and pending is None:
+                        received = os.readv(self.stdin, [input_view])
+                        if not received:
+                            reading_stdin = False
+                            if pollable_stdin:
+                                poll_stdin(False)
+                            self.connection.shutdown(socket.SHUT_WR)
+                            continue
+                        self.bytes_in += received
+                        pending = send(input_view[:received])
+                    elif fd == self._wakeup_read:
+                        try:
+                            while os.read(self._wakeup_read, 64):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        if self.on_resize is not None:
+                            self.on_resize()
+        finally:
+            poller.close()
+
+
+def relay(
+    connection: socket.socket,
+    resize: typing.Callable[[typing.Optional[typing.Tuple[int, int]]], None],
+    stdin: typing.Optional[int]=None,
+    stdout: typing.Optional[int]=None
+) -> TerminalRelay:
+    """
+    Relay the terminal to the connection (until it is closed) in raw mode,
+    calling resize with the terminal size initially and on every SIGWINCH.
+
+    Args:
+        stdin: input file descriptor (default: sys.stdin)
+        stdout: output file descriptor (default: sys.stdout)
+
+    Returns:
+        the (closed) relay, e.g. for its byte counts
+    """
+    stdin = sys.stdin.fileno() if stdin is None else stdin
+    stdout = sys.stdout.fileno() if stdout is None else stdout
+
+    def on_resize():
+        size = terminal_size(stdout)
+        if size is not None:
+            try:
+                resize(size)
+            except docker.errors.APIError:
+                pass  # e.g. it already exited
+
+    terminal_relay = TerminalRelay(connection, stdin, stdout, on_resize=on_resize)
+    previous_handler = None
+    try:
+        on_resize()
+        if os.isatty(stdout):
+            previous_handler = signal.signal(signal.SIGWINCH, lambda unused_signal, unused_frame: terminal_relay.resize())
+        with raw_terminal(stdin):
+            terminal_relay.run()
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGWINCH, previous_handler)
+        terminal_relay.close()
+    return terminal_relay
+
+
+def docker_interactive_run(
+    docker_client,
+    image: str,
+    command: typing.List[str],
+    options,
+    remove: bool=True,
+    stdin: typing.Optional[int]=None,
+    stdout: typing.Optional[int]=None
+) -> int:
+    """
+    Run a container with a tty, attached to this terminal.
+
+    Args:
+        options: :class:`~groot_rocker.run_options.RunOptions`
+        stdin: input file descriptor (default: sys.stdin)
+        stdout: output file descriptor (default: sys.stdout)
+
+    Returns:
+        the exit code of the container
+    """
+    kwargs = options.create_kwargs(docker_client, image, command, tty=True, stdin_open=True)
+    container = docker_client.create_container(**kwargs)['Id']
+    try:
+        return docker_interactive_start(docker_client, container, stdin, stdout)
+    finally:
+        if remove:
+            try:
+                docker_client.remove_container(container, force=True)
+            except docker.errors.NotFound:
+                pass
+
+
+def docker_interactive_start(
+    docker_client,
+    container: str,
+    stdin: typing.Optional[int]=None,
+    stdout: typing.Optional[int]=None
+) -> int:
+    """
+    Start a created (or stopped) container with a tty, attached to this terminal.
+
+    Returns:
+        the exit code of the container
+    """
+    with tracing.span('attach'):
+        # before starting, so no output is missed
+        wrapper = docker_client.attach_socket(container, params={'stdin': 1, 'stdout': 1, 'stderr': 1, 'stream': 1})
+    connection = getattr(wrapper, '_sock', wrapper)
+    try:
+        docker_client.start(container)
+        relay(connection, lambda size: docker_client.resize(container, height=size[0], width=size[1]), stdin, stdout)
+    finally:
+        connection.close()
+    return docker_client.wait(container).get('StatusCode', 1)
+
+
+def docker_interactive_exec(
+    docker_client,
+    container: str,
+    command: typing.List[str],
+    stdin: typing.Optional[int]=None,
+    stdout: typing.Optional[int]=None
+) -> int:
+    """
+    Execute a command with a tty in a running container, attached to this terminal.
+
+    Returns:
+        the exit code of the command
+    """
+    exec_id = docker_client.exec_create(container, command, stdin=True, tty=True)['Id']
+    wrapper = docker_client.exec_start(exec_id, tty=True, socket=True)
+    connection = getattr(wrapper, '_sock', wrapper)
+    try:
+        relay(connection, lambda size: docker_client.exec_resize(exec_id, height=size[0], width=size[1]), stdin, stdout)
+    finally:
+        connection.close()
+    exit_code = docker_client.exec_inspect(exec_id).get('ExitCode')
+    return exit_code if exit_code is not None else 1
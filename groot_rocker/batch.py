@@ -0,0 +1,212 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Build and run many configurations at once.
+
+A manifest lists yaml configurations (as accepted by ``groot-rocker -c``),
+optionally with extra command line arguments for each:
+
+.. code-block:: yaml
+
+   jobs: 4
+   configs:
+     - foo.yaml
+     - config: bar.yaml
+       args: ["--container-name", "bar"]
+
+Configurations that generate an identical image (same image key) are built
+only once, unique images are built concurrently and the containers are then
+run concurrently in non-interactive mode.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+import typing
+
+import docker
+import yaml
+
+from . import cli
+from . import console
+from . import core
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class BatchJob(object):
+    """
+    Plan, timing and results for one configuration in the batch.
+
+    Args:
+        config: path to the yaml configuration
+        args: additional command line arguments
+    """
+    def __init__(self, config: str, args: typing.List[str]):
+        self.config = config
+        self.args = args
+        self.options = None
+        self.generator = None
+        self.image_key = None
+        self.build_status = 'pending'  # built, cached, shared, failed or skipped
+        self.build_time = 0.0
+        self.run_time = 0.0
+        self.exit_code = None
+        self.error = None
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def load_manifest(path: str) -> typing.Tuple[typing.List[BatchJob], typing.Optional[int]]:
+    """
+    Load the jobs (and number of workers, if specified) from a manifest.
+    Configuration paths are relative to the manifest.
+    """
+    with open(path, 'r') as stream:
+        manifest = yaml.load(stream, yaml.loader.FullLoader)
+    max_workers = None
+    if isinstance(manifest, dict):
+        max_workers = manifest.get('jobs', None)
+        manifest = manifest.get('configs', [])
+    jobs = []
+    root = os.path.dirname(os.path.abspath(path))
+    for entry in manifest:
+        if isinstance(entry, str):
+            entry = {'config': entry}
+        jobs.append(BatchJob(os.path.join(root, entry['config']), [str(a) for a in entry.get('args', [])]))
+    return jobs, max_workers
+
+
+def plan(job: BatchJob, extension_manager: core.RockerExtensionManager):
+    job.options = cli.load_arguments(['-c', job.config] + job.args)
+    if job.options['mode'] == core.OPERATIONS_INTERACTIVE:
+        job.options['mode'] = core.OPERATIONS_NON_INTERACTIVE  # there's only one terminal
+    active_extensions = extension_manager.get_active_extensions(job.options)
+    job.generator = core.DockerImageGenerator(active_extensions, job.options, job.options['image'])
+    job.image_key = job.generator.get_image_key()
+
+
+def build(jobs: typing.List[BatchJob]):
+    """Build the image for the first job, share it with the remaining jobs (all have the same image key)."""
+    leader = jobs[0]
+    start = time.monotonic()
+    try:
+        exit_code = leader.generator.build(verbose=False, **leader.options)
+    except (docker.errors.DockerException, core.DependencyMissing) as e:
+        exit_code = 1
+        leader.error = str(e)
+    leader.build_time = time.monotonic() - start
+    report = leader.generator.build_report
+    if exit_code != 0 and leader.error is None and report is not None and report.errors:
+        leader.error = report.errors[-1]
+    if exit_code != 0:
+        for job in jobs:
+            job.build_status = 'failed'
+            job.exit_code = exit_code
+        return
+    leader.build_status = 'cached' if leader.generator.cache_hit else 'built'
+    for job in jobs[1:]:
+        job.generator.use_image(leader.generator.image_id, job.options.get('image_name'))
+        job.build_status = 'shared'
+
+
+def run(job: BatchJob):
+    start = time.monotonic()
+    try:
+        job.exit_code = job.generator.run(**job.options)
+    except (docker.errors.DockerException, core.DependencyMissing) as e:
+        job.exit_code = 1
+        job.error = str(e)
+    job.run_time = time.monotonic() - start
+
+
+def run_batch(jobs: typing.List[BatchJob], max_workers: int=4, execute: bool=True) -> typing.List[BatchJob]:
+    """Plan all jobs, build each unique image once and then run every job."""
+    extension_manager = core.RockerExtensionManager()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for job in jobs:
+            try:
+                plan(job, extension_manager)
+            except (core.RequiredExtensionMissingError, core.DependencyMissing, docker.errors.DockerException, OSError) as e:
+                job.build_status = 'failed'
+                job.exit_code = 1
+                job.error = str(e)
+            except SystemExit:  # argparse rejected the configuration (and printed why)
+                job.build_status = 'failed'
+                job.exit_code = 1
+                job.error = "invalid configuration"
+        groups = {}
+        for job in jobs:
+            if job.image_key is not None:
+                groups.setdefault(job.image_key, []).append(job)
+        console.banner("Batch Build")
+        print(console.green + f"{len(jobs)} configurations, {len(groups)} unique images" + console.reset)
+        list(executor.map(build, groups.values()))
+        if execute:
+            console.banner("Batch Run")
+            list(executor.map(run, [job for job in jobs if job.build_status in ['built', 'cached', 'shared']]))
+    return jobs
+
+
+def print_summary(jobs: typing.List[BatchJob]):
+    console.banner("Batch Summary")
+    rows = [['config', 'image key', 'build', 'build (s)', 'run (s)', 'exit code']]
+    for job in jobs:
+        rows.append([
+            os.path.basename(job.config),
+            job.image_key[:12] if job.image_key else '-',
+            job.build_status,
+            '%.2f' % job.build_time if job.build_status in ['built', 'cached'] else '-',
+            '%.2f' % job.run_time if job.exit_code is not None and job.build_status != 'failed' else '-',
+            '-' if job.exit_code is None else str(job.exit_code)
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for index, row in enumerate(rows):
+        colour = console.cyan if index == 0 else (console.red if row[-1] not in ['0', '-'] else console.yellow)
+        print(colour + "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) + console.reset)
+    for job in jobs:
+        if job.error:
+            console.error(f"{os.path.basename(job.config)}: {job.error}")
+
+##############################################################################
+# Main
+##############################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and run a batch of groot-rocker configurations')
+    parser.add_argument('manifest', help='yaml manifest of configurations')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='maximum number of concurrent builds / runs (default: from the manifest, else 4)'
+    )
+    parser.add_argument(
+        '--build-only', action='store_true', help='build the images, but do not run the containers'
+    )
+    args = parser.parse_args()
+
+    jobs, max_workers = load_manifest(args.manifest)
+    max_workers = args.jobs or max_workers or 4
+    try:
+        run_batch(jobs, max_workers=max_workers, execute=not args.build_only)
+    except core.DependencyMissing as ex:
+        parser.error("DependencyMissing encountered: %s" % ex)
+    print_summary(jobs)
+    if any(job.exit_code not in [None, 0] for job in jobs):
+        sys.exit(1)
@@ -0,0 +1,240 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Typed events parsed from docker build output and a report summarising
+which steps were cached, which were rebuilt and which were slowest.
+
+Both the legacy builder's json stream and BuildKit's plain progress
+output are supported.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import re
+import time
+import typing
+
+from . import console
+
+##############################################################################
+# Events
+##############################################################################
+
+
+class BuildEvent(object):
+    """Base class for all build events."""
+    def __repr__(self):
+        return "%s(%s)" % (
+            self.__class__.__name__,
+            ", ".join("%s=%r" % (k, v) for k, v in self.__dict__.items())
+        )
+
+
+class StepStarted(BuildEvent):
+    def __init__(self, step: str, instruction: str):
+        self.step = step
+        self.instruction = instruction
+
+
+class CacheHit(BuildEvent):
+    def __init__(self, step: str):
+        self.step = step
+
+
+class StepFinished(BuildEvent):
+    def __init__(self, step: str, instruction: str, duration: float, cached: bool):
+        self.step = step
+        self.instruction = instruction
+        self.duration = duration
+        self.cached = cached
+
+
+class ImageBuilt(BuildEvent):
+    def __init__(self, image_id: str):
+        self.image_id = image_id
+
+
+class BuildError(BuildEvent):
+    def __init__(self, message: str):
+        self.message = message
+
+
+class Status(BuildEvent):
+    """Progress that isn't part of a step, e.g. pulling the base image."""
+    def __init__(self, message: str):
+        self.message = message
+
+##############################################################################
+# Parsers
+##############################################################################
+
+
+class LegacyBuildParser(object):
+    """Converts the decoded json lines of the legacy builder's stream into events."""
+    def __init__(self):
+        self.step = None
+        self.instruction = None
+        self.started = None
+        self.cached = False
+        self.image_built = False
+
+    def feed(self, line: typing.Dict[str, typing.Any]) -> typing.List[BuildEvent]:
+        events = []
+        if 'error' in line or 'errorDetail' in line:
+            events.extend(self._finish())
+            events.append(BuildError(line.get('error') or line['errorDetail'].get('message', '')))
+        if 'aux' in line and isinstance(line['aux'], dict) and 'ID' in line['aux']:
+            self.image_built = True
+            events.append(ImageBuilt(line['aux']['ID']))
+        if 'status' in line:
+            events.append(Status(line['status']))
+        output = line.get('stream', '').strip()
+        match = re.match(r'Step (\d+/\d+) : (.*)', output)
+        if match:
+            events.extend(self._finish())
+            self.step, self.instruction = match.group(1), match.group(2)
+            self.started = time.monotonic()
+            self.cached = False
+            events.append(StepStarted(self.step, self.instruction))
+        elif output == '---> Using cache' and self.step is not None:
+            self.cached = True
+            events.append(CacheHit(self.step))
+        elif output.startswith('---> ') and not output.startswith('---> Running in'):
+            events.extend(self._finish())
+        else:
+            match = re.match(r'Successfully built ([a-z0-9]{12})', output)
+            if match and not self.image_built:
+                # older daemons don't send the aux message
+                events.append(ImageBuilt(match.group(1)))
+        return events
+
+    def close(self) -> typing.List[BuildEvent]:
+        return self._finish()
+
+    def _finish(self) -> typing.List[BuildEvent]:
+        if self.step is None:
+            return []
+        event = StepFinished(self.step, self.instruction, time.monotonic() - self.started, self.cached)
+        self.step = None
+        return [event]
+
+
+class BuildKitParser(object):
+    """Converts BuildKit's plain (``--progress=plain``) output into events."""
+    def __init__(self):
+        self.instructions = {}
+        self.cached = set()
+
+    def feed(self, line: str) -> typing.List[BuildEvent]:
+        line = line.strip()
+        # Dockerfile steps, e.g. '#6 [2/3] RUN ...' or '#6 [stage-1 2/3] RUN ...', but not '[internal] ...'
+        match = re.match(r'#(\d+) \[(?:[^\]]*\s)?\d+/\d+\] (.*)', line)
+        if match and match.group(1) not in self.instructions:
+            step, instruction = match.group(1), match.group(2)
+            self.instructions[step] = instruction
+            return [StepStarted(step, instruction)]
+        match = re.match(r'#(\d+) CACHED$', line)
+        if match and match.group(1) in self.instructions:
+            self.cached.add(match.group(1))
+            return [CacheHit(match.group(1)), StepFinished(match.group(1), self.instructions[match.group(1)], 0.0, True)]
+        match = re.match(r'#(\d+) DONE ([0-9.]+)s$', line)
+        if match and match.group(1) in self.instructions and match.group(1) not in self.cached:
+            return [StepFinished(match.group(1), self.instructions[match.group(1)], float(match.group(2)), False)]
+        match = re.match(r'#(\d+) ERROR:? (.*)', line) or re.match(r'(?:ERROR|error): (.*)', line)
+        if match:
+            return [BuildError(match.groups()[-1])]
+        return []
+
+    def close(self) -> typing.List[BuildEvent]:
+        return []
+
+##############################################################################
+# Report
+##############################################################################
+
+
+def attribute_instructions(dockerfile: str) -> typing.Dict[str, str]:
+    """Map each (whitespace normalised) Dockerfile instruction to the extension that contributed it."""
+    attribution = {}
+    extension = None
+    instruction = ''
+    for line in dockerfile.splitlines():
+        match = re.match(r'# (?:Preamble|Snippet) from extension \[(.*)\]', line)
+        if match:
+            extension = match.group(1)
+            continue
+        if not instruction and (not line.strip() or line.strip().startswith('#')):
+            continue
+        instruction += line.rstrip()
+        if instruction.endswith('\\'):
+            instruction = instruction[:-1] + ' '
+            continue
+        attribution.setdefault(_normalise(instruction), extension)
+        instruction = ''
+    return attribution
+
+
+def _normalise(instruction: str) -> str:
+    return ' '.join(instruction.split())
+
+
+class BuildReport(object):
+    """
+    Accumulates build events.
+
+    Args:
+        dockerfile: if provided, steps are attributed to the extensions that contributed them
+    """
+    def __init__(self, dockerfile: typing.Optional[str]=None):
+        self.steps = []
+        self.errors = []
+        self.image_id = None
+        self.attribution = attribute_instructions(dockerfile) if dockerfile else {}
+
+    def add(self, event: BuildEvent):
+        if isinstance(event, StepFinished):
+            self.steps.append(event)
+        elif isinstance(event, BuildError):
+            self.errors.append(event.message)
+        elif isinstance(event, ImageBuilt):
+            self.image_id = event.image_id
+
+    @property
+    def cached_steps(self) -> typing.List[StepFinished]:
+        return [s for s in self.steps if s.cached]
+
+    @property
+    def rebuilt_steps(self) -> typing.List[StepFinished]:
+        return [s for s in self.steps if not s.cached and not s.instruction.upper().startswith('FROM ')]
+
+    def slowest_steps(self, count: int=5) -> typing.List[StepFinished]:
+        return sorted(self.steps, key=lambda s: s.duration, reverse=True)[:count]
+
+    def extension(self, step: StepFinished) -> typing.Optional[str]:
+        return self.attribution.get(_normalise(step.instruction))
+
+    def print(self):
+        console.banner("Build Report")
+        rebuilt = self.rebuilt_steps
+        print(console.green + "Steps" + console.reset + ": " + console.yellow +
+              f"{len(self.steps)} ({len(self.cached_steps)} cached, {len(rebuilt)} rebuilt)" + console.reset)
+        if rebuilt:
+            extension = self.extension(rebuilt[0])
+            print(console.green + "Cache Broken By" + console.reset + ": " + console.yellow +
+                  f"{rebuilt[0].instruction[:80]}" + (f" [{extension}]" if extension else "") + console.reset)
+        print(console.green + "Slowest Steps" + console.reset)
+        for step in self.slowest_steps():
+            extension = self.extension(step)
+            print(console.cyan + f"  {step.duration:8.2f}s " + console.reset +
+                  ("cached  " if step.cached else "rebuilt ") +
+                  (f"[{extension}] " if extension else "") + step.instruction[:80])
+        for error in self.errors:
+            console.error(error)
@@ -0,0 +1,137 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Persistent caches, stored as small json files in the user's cache directory.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import typing
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def cache_directory() -> str:
+    """
+    The directory groot_rocker caches to, i.e. ``$XDG_CACHE_HOME/groot_rocker``,
+    falling back to ``~/.cache/groot_rocker``.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'groot_rocker')
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class PersistentLRUCache(object):
+    """
+    A json backed, size bounded, least recently used cache that can be shared
+    between threads and processes. Failures to read or write the cache file are
+    not errors, the cache simply behaves as if it were empty.
+
+    Args:
+        name: name of the cache file (sans extension) in the cache directory
+        max_entries: least recently used entries are evicted beyond this size
+        directory: override the default cache directory
+    """
+    def __init__(
+        self,
+        name: str,
+        max_entries: int=256,
+        directory: typing.Optional[str]=None
+    ):
+        self.max_entries = max_entries
+        self.path = os.path.join(directory or cache_directory(), name + '.json')
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: typing.Any=None) -> typing.Any:
+        """Lookup a key, marking it as most recently used if found."""
+        with self._locked() as entries:
+            if key not in entries:
+                return default
+            value = entries[key]
+            if next(reversed(entries)) != key:  # only rewrite the file if the order changes
+                entries.move_to_end(key)
+                self._save(entries)
+            return value
+
+    def set(self, key: str, value: typing.Any):
+        """Store a json serialisable value, evicting the least recently used entries if necessary."""
+        with self._locked() as entries:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._save(entries)
+
+    def remove(self, key: str):
+        with self._locked() as entries:
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+    def clear(self):
+        with self._locked() as entries:
+            entries.clear()
+            self._save(entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._locked() as entries:
+            return key in entries
+
+    def __len__(self) -> int:
+        with self._locked() as entries:
+            return len(entries)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold both the thread and the (inter-process) file lock while yielding the loaded entries."""
+        with self._lock:
+            lock_file = None
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                lock_file = open(self.path + '.lock', 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except OSError:
+                pass  # carry on without the file lock, worst case is a lost update
+            try:
+                yield self._load()
+            finally:
+                if lock_file is not None:
+                    lock_file.close()  # also releases the flock
+
+    def _load(self) -> collections.OrderedDict:
+        try:
+            with open(self.path, 'r') as fh:
+                entries = json.load(fh, object_pairs_hook=collections.OrderedDict)
+            if isinstance(entries, collections.OrderedDict):
+                return entries
+        except (OSError, ValueError):
+            pass
+        return collections.OrderedDict()
+
+    def _save(self, entries: collections.OrderedDict):
+        try:
+            fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.' + os.path.basename(self.path))
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(entries, fh)
+            os.replace(temporary_path, self.path)
+        except OSError:
+            pass
@@ -15,13 +15,17 @@ The command line client.
 ##############################################################################
 
 import argparse
+import json
 import sys
+import time
 import typing
 import yaml
 
 from . import console
 from . import core
+from . import logs
 from . import os_detector
+from . import tracing
 from . import version
 
 ##############################################################################
@@ -40,15 +44,22 @@ def set_default(option: str, yaml_defaults: str) -> typing.Any:
 def load_arguments(
     command_line_arguments: typing.Optional[typing.List[str]]=None
 ) -> typing.Dict[str, typing.Any]:
+    start = time.perf_counter()
     config_parser = argparse.ArgumentParser(add_help=False)
     config_parser.add_argument(
         '-c', '--config', type=str, metavar="YAML", default=None, help="pre-load options from a yaml file"
     )
+    config_parser.add_argument(
+        '--trace', type=str, metavar="FILE", default=None,
+        help="record the time spent in each phase to a chrome trace (json) file"
+    )
     config_args, remaining_argv = config_parser.parse_known_args(command_line_arguments)
+    if config_args.trace is not None:
+        tracing.enable()
 
     yaml_defaults = {}
     if config_args.config is not None:
-        with open(config_args.config, 'r') as stream:
+        with tracing.span('load_yaml'), open(config_args.config, 'r') as stream:
             yaml_defaults = yaml.load(stream, yaml.loader.FullLoader)
 
     parser = argparse.ArgumentParser(
@@ -76,12 +87,72 @@ def load_arguments(
         default=set_default("image_name", yaml_defaults),
         help="image names in the form repo:tag"
     )
+    build_options.add_argument(
+        '--buildkit', action='store_true',
+        default=set_default("buildkit", yaml_defaults),
+        help="build with BuildKit (docker buildx), enables cache mounts in extension snippets"
+    )
+    build_options.add_argument(
+        '--cache-dir', type=str, metavar="DIR",
+        default=set_default("cache_dir", yaml_defaults),
+        help="import/export the BuildKit layer cache from/to a local directory"
+    )
 
     run_options = parser.add_argument_group(title="Run Options")
     run_options.add_argument(
         '--persistent', action='store_true',
         default=set_default("persistent", yaml_defaults), help="persist the container post-execution"
     )
+    run_options.add_argument(
+        '--resume', action='store_true',
+        default=set_default("resume", yaml_defaults),
+        help="start the stopped (--persistent) container named by --container-name again if it was created from the same image, implies --persistent"
+    )
+    run_options.add_argument(
+        '--runner', choices=core.RUNNERS,
+        default=set_default("runner", yaml_defaults),
+        help="launch non-interactive containers via the docker cli or directly via the docker api (default: cli)"
+    )
+    run_options.add_argument(
+        '--pool', type=int, metavar="SIZE",
+        default=set_default("pool", yaml_defaults),
+        help="run the command via docker exec in one of SIZE warm containers (see groot-rocker-pool)"
+    )
+    run_options.add_argument(
+        '--pool-max-uses', type=int, metavar="N",
+        default=set_default("pool_max_uses", yaml_defaults),
+        help="recycle pooled containers after N commands (default: 100)"
+    )
+    run_options.add_argument(
+        '--pool-idle-ttl', type=float, metavar="SECONDS",
+        default=set_default("pool_idle_ttl", yaml_defaults),
+        help="remove pooled containers idle for longer than this (default: 600)"
+    )
+    run_options.add_argument(
+        '--log-file', type=str, metavar="FILE",
+        default=set_default("log_file", yaml_defaults),
+        help="write the output of non-interactive runs to FILE instead of stdout, the tail is shown on failure"
+    )
+    run_options.add_argument(
+        '--log-max-bytes', type=logs.parse_size, metavar="SIZE",
+        default=set_default("log_max_bytes", yaml_defaults),
+        help="rotate the log file before it exceeds SIZE, e.g. 100M, 0 disables rotation (default: 64M)"
+    )
+    run_options.add_argument(
+        '--log-backups', type=int, metavar="N",
+        default=set_default("log_backups", yaml_defaults),
+        help="number of rotated log files to keep (default: 5)"
+    )
+    run_options.add_argument(
+        '--log-compress', action='store_true',
+        default=set_default("log_compress", yaml_defaults),
+        help="gzip rotated log files"
+    )
+    run_options.add_argument(
+        '--log-tail', type=int, metavar="N",
+        default=set_default("log_tail", yaml_defaults),
+        help="number of trailing lines of the log to show on failure (default: 100)"
+    )
 
     parser.add_argument(
         'image', nargs='?',
@@ -96,20 +167,30 @@ def load_arguments(
     extensions = parser.add_argument_group(title="Extensions")
 
     try:
-        extension_manager = core.RockerExtensionManager()
-        extension_manager.extend_cli_parser(extensions, yaml_defaults)
+        with tracing.span('extend_cli_parser'):
+            extension_manager = core.RockerExtensionManager()
+            extension_manager.extend_cli_parser(extensions, yaml_defaults)
     except core.DependencyMissing as ex:
         # Catch errors if docker is missing or inaccessible.
         parser.error("DependencyMissing encountered: %s" % ex)
 
-    args = vars(parser.parse_args(remaining_argv))  # work with a dict object from here, not argparse.Namespace
+    with tracing.span('parse_args'):
+        args = vars(parser.parse_args(remaining_argv))  # work with a dict object from here, not argparse.Namespace
     args["command"] = ' '.join(args["command"])  # Convert command into string
+    args["trace"] = config_args.trace
 
+    tracing.record('load_arguments', start, time.perf_counter())
     return args
 
 
 def main():
-    result = build_and_run(load_arguments())
+    options = load_arguments()
+    try:
+        with tracing.span('build_and_run'):
+            result = build_and_run(options)
+    finally:
+        if options.get('trace') is not None:
+            tracing.finish(options['trace'])
     if result:
         sys.exit(result)
 
@@ -122,7 +203,8 @@ def build_and_run(options: typing.Dict[str, typing.Any]):
         print(" - " + console.cyan + str(k) + console.reset + ": " + console.yellow + str(v) + console.reset)
     print(console.green + "\nActive Extensions" + console.reset)
     try:
-        active_extensions = extension_manager.get_active_extensions(options)
+        with tracing.span('get_active_extensions'):
+            active_extensions = extension_manager.get_active_extensions(options)
     except core.RequiredExtensionMissingError as e:
         console.error(f"Aborting, {str(e)}")
         return 1
@@ -130,25 +212,55 @@ def build_and_run(options: typing.Dict[str, typing.Any]):
         print(" - " + console.cyan + e.get_name() + console.reset)
     base_image = options["image"]
     dig = core.DockerImageGenerator(active_extensions, options, base_image)
-    exit_code = dig.build(**options)
-    if exit_code != 0:
-        console.error("Build failed exiting")
-        return exit_code
-    return dig.run(**options)
+    with tracing.span('launch'):
+        return dig.launch(**options)  # the environment is checked while the image builds
 
 
 def detect_image_os():
-    parser = argparse.ArgumentParser(description='Detect the os in an image')
-    parser.add_argument('image')
+    parser = argparse.ArgumentParser(description='Detect the os in one or more images')
+    parser.add_argument('images', nargs='*', metavar='image')
+    parser.add_argument(
+        '--all', action='store_true', help='detect the os of all local images'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=8, help='maximum number of concurrent detections (default: 8)'
+    )
+    parser.add_argument(
+        '--json', action='store_true', help='print results as json lines (implied for multiple images)'
+    )
     parser.add_argument(
         '--verbose', action='store_true', help='Display verbose output of the process'
     )
 
     args = parser.parse_args()
+    if not args.images and not args.all:
+        parser.error("provide at least one image, or --all")
 
-    results = os_detector.detect_os(args.image, print if args.verbose else None)
-    print(results)
-    if results:
-        return 0
-    else:
-        return 1
+    try:
+        docker_client = core.get_docker_client()
+    except core.DependencyMissing as ex:
+        parser.error("DependencyMissing encountered: %s" % ex)
+    images = list(args.images)
+    if args.all:
+        images.extend(i for i in os_detector.list_local_images(docker_client) if i not in images)
+
+    if len(images) == 1 and not args.json:
+        results = os_detector.detect_os(images[0], print if args.verbose else None, docker_client=docker_client)
+        print(results)
+        return 0 if results else 1
+
+    exit_code = 0
+    for image, results, error in os_detector.detect_os_batch(
+        images,
+        output_callback=print if args.verbose else None,
+        max_workers=args.jobs,
+        docker_client=docker_client
+    ):
+        record = {'image': image}
+        if results:
+            record.update(zip(['name', 'version', 'codename'], results))
+        else:
+            record['error'] = error or 'os detection failed'
+            exit_code = 1
+        print(json.dumps(record), flush=True)
+    return exit_code
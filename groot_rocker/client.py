@@ -0,0 +1,189 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+The ``groot-rocker`` entry point.
+
+If a server (``groot-rocker serve``) is listening, the command line,
+working directory, environment and the terminal (stdin, stdout and stderr
+file descriptors) are handed to it and this process merely waits for the
+exit code, forwarding signals. Otherwise it falls back to running in
+process, i.e. :func:`groot_rocker.cli.main`.
+
+The environment and terminal are only ever handed to a server run by the
+same user: the socket must be owned by and private to the user and the
+peer's credentials are checked once connected.
+
+This module is on the hot path of every invocation, so it only imports
+from the standard library.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import array
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import typing
+
+##############################################################################
+# Constants
+##############################################################################
+
+# Messages from the server are a one byte tag followed by a 32 bit integer
+MESSAGE = struct.Struct('!ci')
+MESSAGE_PID = b'P'  # process group of the forked request handler
+MESSAGE_EXIT = b'X'  # exit code of the request
+
+# Signals the terminal would have delivered to the in-process command
+FORWARDED_SIGNALS = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT, signal.SIGWINCH]
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def default_socket_path() -> typing.Optional[str]:
+    """
+    ``$GROOT_ROCKER_SOCKET``, else a per user socket in ``$XDG_RUNTIME_DIR``. None without
+    either, there is no private directory to fall back to (the temp directory is shared).
+    """
+    if os.environ.get('GROOT_ROCKER_SOCKET'):
+        return os.environ['GROOT_ROCKER_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'groot_rocker-%d.sock' % os.getuid())
+    return None
+
+
+def peer_uid(connection: socket.socket) -> typing.Optional[int]:
+    """Uid of the process at the other end of a unix socket, None if the platform can't tell."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = struct.Struct('3i')  # pid, uid, gid
+    unused_pid, uid, unused_gid = credentials.unpack(
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size)
+    )
+    return uid
+
+
+def is_same_user(connection: socket.socket) -> bool:
+    uid = peer_uid(connection)
+    return uid is None or uid == os.getuid()
+
+
+def connect(path: typing.Optional[str]=None) -> typing.Optional[socket.socket]:
+    """Connect to the server, None if it isn't running (or isn't the user's own)."""
+    path = path or default_socket_path()
+    if path is None:
+        return None
+    try:
+        status = os.lstat(path)
+    except OSError:
+        return None
+    if not stat.S_ISSOCK(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        print("groot-rocker: ignoring %s, it is not a socket private to this user" % path, file=sys.stderr)
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None
+    if not is_same_user(connection):
+        print("groot-rocker: ignoring %s, it is served by another user" % path, file=sys.stderr)
+        connection.close()
+        return None
+    return connection
+
+
+def send_request(connection: socket.socket, argv: typing.List[str], fds: typing.List[int]):
+    """Send the request (length prefixed json) with the file descriptors attached."""
+    payload = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode()
+    message = struct.pack('!I', len(payload)) + payload
+    sent = connection.sendmsg([message], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    connection.sendall(message[sent:])
+
+
+def receive_message(connection: socket.socket) -> typing.Optional[typing.Tuple[bytes, int]]:
+    data = b''
+    while len(data) < MESSAGE.size:
+        chunk = connection.recv(MESSAGE.size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return MESSAGE.unpack(data)
+
+
+def run_via_server(connection: socket.socket, argv: typing.List[str]) -> int:
+    """
+    Have the server run the command line, forwarding signals to it.
+
+    Returns:
+        the exit code
+    """
+    send_request(connection, argv, [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+    message = receive_message(connection)
+    if message is None or message[0] != MESSAGE_PID:
+        print("groot-rocker: the server dropped the connection", file=sys.stderr)
+        return 1
+    process_group = message[1]
+
+    def forward(signal_number, unused_frame):
+        try:
+            os.killpg(process_group, signal_number)
+        except ProcessLookupError:
+            pass
+
+    for signal_number in FORWARDED_SIGNALS:
+        signal.signal(signal_number, forward)
+    while True:
+        try:
+            message = receive_message(connection)
+            break
+        except InterruptedError:
+            continue
+    if message is None or message[0] != MESSAGE_EXIT:
+        print("groot-rocker: the server dropped the connection", file=sys.stderr)
+        return 1
+    return message[1]
+
+
+def _has_std_streams() -> bool:
+    try:
+        return all(stream.fileno() >= 0 for stream in [sys.stdin, sys.stdout, sys.stderr])
+    except (AttributeError, ValueError, OSError):
+        return False
+
+##############################################################################
+# Main
+##############################################################################
+
+
+def main():
+    argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        from . import server
+        server.main(argv[1:])
+        return
+    connection = None
+    if os.environ.get('GROOT_ROCKER_SERVER', '1') != '0' and _has_std_streams():
+        connection = connect()
+    if connection is None:
+        from . import cli
+        cli.main()
+        return
+    with connection:
+        exit_code = run_via_server(connection, argv)
+    if exit_code:
+        sys.exit(exit_code)
@@ -14,18 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import OrderedDict
+import collections
+import functools
+import hashlib
 import io
 import os
-import re
 import sys
+import tarfile
+import time
 import typing
 
-import pkg_resources
 from requests.exceptions import ConnectionError
 import shlex
 import subprocess
 import tempfile
+import threading
 
 import docker
 import pexpect
@@ -35,7 +38,13 @@ import signal
 import struct
 import termios
 
+from . import attach
+from . import build_events
 from . import console as console
+from . import logs
+from . import plugins
+from . import run_options
+from . import tracing
 
 SYS_STDOUT = sys.stdout
 
@@ -48,6 +57,22 @@ OPERATION_MODES = [
     OPERATIONS_DRY_RUN
 ]
 
+RUNNER_CLI = 'cli'
+RUNNER_SDK = 'sdk'
+RUNNERS = [RUNNER_CLI, RUNNER_SDK]
+
+# Maximum number of connections to the daemon held open by the shared client
+DOCKER_CLIENT_POOL_SIZE = 16
+
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+# Build contexts larger than this are spooled to a temporary file
+BUILD_CONTEXT_MAX_MEMORY = 64 * 1024 * 1024
+
+# Label stamped on every generated image, its value is the content hash of the build context
+IMAGE_KEY_LABEL = 'groot_rocker.image_key'
+
 
 class DependencyMissing(RuntimeError):
     pass
@@ -61,6 +86,16 @@ class RequiredExtensionMissingError(RuntimeError):
     pass
 
 
+class ResumeError(RuntimeError):
+    pass
+
+
+class CyclicDependencyError(ValueError):
+    def __init__(self, cycle):
+        super().__init__("cyclic dependency detected: %s" % " -> ".join(cycle))
+        self.cycle = cycle
+
+
 class RockerExtension(object):
     """The base class for Rocker extension points"""
 
@@ -113,6 +148,15 @@ class RockerExtension(object):
     def get_docker_args(self, cliargs):
         return ''
 
+    def get_run_options(self, cliargs):
+        """
+        Structured equivalent of get_docker_args() for the sdk runner (--runner sdk).
+        The default parses get_docker_args(), override if it uses unsupported flags.
+
+        @raises run_options.UnsupportedRunOption: if there is no sdk equivalent.
+        """
+        return run_options.parse_docker_args(self.get_docker_args(cliargs))
+
     @classmethod
     def check_args_for_activation(cls, cli_args):
         """ Returns true if the arguments indicate that this extension should be activated otherwise false.
@@ -127,15 +171,14 @@ class RockerExtension(object):
 
 class RockerExtensionManager:
     def __init__(self):
-        self.available_plugins = list_plugins()
+        self.registry = plugins.get_registry()
+
+    @property
+    def available_plugins(self):
+        return self.registry.load_all()
 
     def extend_cli_parser(self, parser, default_args={}):
-        for p in self.available_plugins.values():
-            try:
-                p.register_arguments(parser, default_args)
-            except TypeError as unused_ex:
-                print("Extension %s doesn't support default arguments. Please extend it." % p.get_name())
-                p.register_arguments(parser)
+        self.registry.register_arguments(parser, default_args)
         parser.add_argument(
             '--mode',
             choices=OPERATION_MODES,
@@ -151,10 +194,11 @@ class RockerExtensionManager:
         """
         Checks for missing dependencies (specified by each extension's
         required_extensions() method) and additionally sorts them.
+        Only the active extensions are imported.
         """
         active_extensions = {
-            name: cls for name, cls in self.available_plugins.items()
-            if cls.check_args_for_activation(cli_args) and cls.get_name() not in cli_args['extension_blacklist']
+            name: self.registry.load(name) for name in self.registry.names()
+            if self.registry.check_args_for_activation(name, cli_args) and self.registry.extension_name(name) not in cli_args['extension_blacklist']
         }
         names = set(active_extensions.keys())
         for name, cls in active_extensions.items():
@@ -164,57 +208,103 @@ class RockerExtensionManager:
 
     @staticmethod
     def sort_extensions(extensions: typing.Dict[str, typing.Type[RockerExtension]]) -> typing.List[RockerExtension]:
+        """
+        Instantiate the extensions in dependency order (see :func:`resolve_extension_order`).
 
-        def topological_sort(source: typing.Dict[str, typing.Set[str]]) -> typing.List[str]:
-            """Perform a topological sort on names and dependencies and returns the sorted list of names."""
-            names = set(source.keys())
-            # dependencies are merely desired, not required, so prune them if they are not active
-            pending = [(name, dependencies.intersection(names)) for name, dependencies in source.items()]
-            emitted = []
-            while pending:
-                next_pending = []
-                next_emitted = []
-                for entry in pending:
-                    name, deps = entry
-                    deps.difference_update(emitted)  # remove dependencies already emitted
-                    if deps:  # still has dependencies? recheck during next pass
-                        next_pending.append(entry)
-                    else:  # no more dependencies? time to emit
-                        yield name
-                        next_emitted.append(name)  # remember what was emitted for difference_update()
-                if not next_emitted:
-                    raise ValueError("cyclic dependancy detected: %r" % (next_pending,))
-                pending = next_pending
-                emitted = next_emitted
-        user_extension_graph = {}
-        root_extension_graph = {}
-        for name, cls in extensions.items():
-            if name == "user" or "user" in cls.desired_extensions():
-                user_extension_graph[name] = cls.desired_extensions()
-            elif name == "user" or "user" in cls.required_extensions():
-                user_extension_graph[name] = cls.required_extensions()
-            else:
-                root_extension_graph[name] = cls.desired_extensions()
-        active_extension_list = []
-        for name in topological_sort(root_extension_graph):
-            active_extension_list.append(extensions[name]())
-        for name in topological_sort(user_extension_graph):
-            active_extension_list.append(extensions[name]())
-        return active_extension_list
-
-
-def get_docker_client():
-    """Simple helper function for pre 2.0 imports"""
+        Raises:
+            CyclicDependencyError: if the dependencies form a cycle
+        """
+        return [extensions[name]() for name in resolve_extension_order(tuple(extensions.items()))]
+
+
+@functools.lru_cache(maxsize=64)
+def resolve_extension_order(extensions: typing.Tuple[typing.Tuple[str, typing.Type[RockerExtension]], ...]) -> typing.Tuple[str, ...]:
+    """
+    Order a set of (name, class) pairs so that every extension comes after
+    the extensions it desires. Memoised per set (and order) of extensions.
+
+    Extensions are split into two tiers, 'user' and those depending on it
+    are ordered after all others and dependencies are only honoured within
+    a tier. Within a tier, extensions are ordered by the length of their
+    longest dependency chain, ties retain the order they were given in.
+    """
+    names = [name for name, unused_cls in extensions]
+    index = {name: i for i, name in enumerate(names)}
+    tiers = []
+    edges = []
+    for name, cls in extensions:
+        desired = cls.desired_extensions()
+        if name == "user" or "user" in desired:
+            tiers.append(1)
+            edges.append(desired)
+        elif "user" in cls.required_extensions():
+            tiers.append(1)
+            edges.append(cls.required_extensions())
+        else:
+            tiers.append(0)
+            edges.append(desired)
+    # dependencies are merely desired, not required, so prune them if they are not active (or in another tier)
+    dependencies = [
+        {index[d] for d in edges[i] if d in index and tiers[index[d]] == tiers[i]} for i in range(len(names))
+    ]
+
+    # Kahn's algorithm, tracking the longest path to each extension
+    dependents = [[] for unused_i in names]
+    remaining = [len(deps) for deps in dependencies]
+    for i, deps in enumerate(dependencies):
+        for d in deps:
+            dependents[d].append(i)
+    depth = [0] * len(names)
+    queue = collections.deque(i for i in range(len(names)) if remaining[i] == 0)
+    resolved = 0
+    while queue:
+        i = queue.popleft()
+        resolved += 1
+        for j in dependents[i]:
+            depth[j] = max(depth[j], depth[i] + 1)
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                queue.append(j)
+    if resolved != len(names):
+        raise CyclicDependencyError(_find_cycle([names[i] for i in range(len(names)) if remaining[i]], {
+            names[i]: [names[d] for d in dependencies[i]] for i in range(len(names)) if remaining[i]
+        }))
+
+    # bucket by (tier, depth), insertion order is preserved within a bucket
+    buckets = collections.defaultdict(list)
+    for i in range(len(names)):
+        buckets[(tiers[i], depth[i])].append(names[i])
+    return tuple(name for key in sorted(buckets.keys()) for name in buckets[key])
+
+
+def _find_cycle(names: typing.List[str], dependencies: typing.Dict[str, typing.List[str]]) -> typing.List[str]:
+    """Follow unresolved dependencies from an unresolved extension until one repeats."""
+    path = [names[0]]
+    position = {names[0]: 0}
+    while True:
+        following = next(d for d in dependencies[path[-1]] if d in dependencies)
+        if following in position:
+            return path[position[following]:] + [following]
+        position[following] = len(path)
+        path.append(following)
+
+
+def create_docker_client(max_pool_size=DOCKER_CLIENT_POOL_SIZE):
+    """Create a new docker client and validate the daemon is available (prefer get_docker_client())."""
     try:
         try:
-            docker_client = docker.from_env().api
+            try:
+                docker_client = docker.from_env(max_pool_size=max_pool_size).api
+            except TypeError:
+                # max_pool_size is not supported by older clients
+                docker_client = docker.from_env().api
         except AttributeError:
             # docker-py pre 2.0
             docker_client = docker.Client()
         # Validate that the server is available
         docker_client.ping()
         return docker_client
-    except (docker.errors.APIError, ConnectionError) as unused_ex:
+    except (docker.errors.DockerException, ConnectionError) as unused_ex:
         raise DependencyMissing(
             'Docker Client failed to connect to docker daemon.'
             ' Please verify that docker is installed and running.'
@@ -223,23 +313,73 @@ def get_docker_client():
         )
 
 
-def docker_build(docker_client=None, output_callback=None, **kwargs):
+def get_docker_client():
+    """
+    The process wide docker client. It is created, and the daemon pinged, only
+    once and its pool of connections is shared by all callers (and threads).
+    """
+    global _docker_client
+    with _docker_client_lock:
+        if _docker_client is None:
+            _docker_client = create_docker_client()
+        return _docker_client
+
+
+def set_docker_client(docker_client):
+    """Inject the process wide docker client, or reset it with None."""
+    global _docker_client
+    with _docker_client_lock:
+        _docker_client = docker_client
+
+
+def _reset_docker_client_after_fork():
+    # never share a connection pool with the parent
+    global _docker_client, _docker_client_lock
+    _docker_client = None
+    _docker_client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_docker_client_after_fork)
+
+
+def docker_build(docker_client=None, output_callback=None, event_callback=None, cancelled=None, **kwargs):
+    """
+    Build with the legacy builder, reporting the output stream line by line
+    to output_callback and typed :mod:`build_events` to event_callback.
+
+    Args:
+        cancelled: abandon the build (checked between lines of output) once this event is set
+
+    Returns:
+        the image id, or None if the build failed
+    """
     image_id = None
 
     if not docker_client:
         docker_client = get_docker_client()
     kwargs['decode'] = True
-    for line in docker_client.build(**kwargs):
+    parser = build_events.LegacyBuildParser()
+    stream = docker_client.build(**kwargs)
+    for line in stream:
+        if cancelled is not None and cancelled.is_set():
+            stream.close()  # the daemon stops the build when the client goes away
+            return None
+        events = parser.feed(line)
+        for event in events:
+            if isinstance(event, build_events.ImageBuilt):
+                image_id = event.image_id
+            elif isinstance(event, build_events.BuildError) and output_callback is not None:
+                output_callback(event.message.rstrip())
+            if event_callback is not None:
+                event_callback(event)
         output = line.get('stream', '').rstrip()
         if not output:
-            # print("non stream data", line)
             continue
         if output_callback is not None:
             output_callback(output)
-
-        match = re.match(r'Successfully built ([a-z0-9]{12})', output)
-        if match:
-            image_id = match.group(1)
+    for event in parser.close():
+        if event_callback is not None:
+            event_callback(event)
 
     if image_id:
         return image_id
@@ -248,6 +388,218 @@ def docker_build(docker_client=None, output_callback=None, **kwargs):
         return None
 
 
+def docker_buildkit_build(
+    context, output_callback=None, event_callback=None, tag=None, labels={}, nocache=False, pull=False, cache_dir=None, cancelled=None
+):
+    """
+    Build with BuildKit via ``docker buildx``. The docker SDK only speaks to
+    the legacy builder, so this hands the (tar) build context to the cli on stdin.
+
+    Args:
+        context: file object with the tar build context
+        cache_dir: import / export the layer cache from / to this local directory
+            (requires a buildx builder that supports cache export, e.g. the docker-container driver)
+        cancelled: abandon the build (checked between lines of output) once this event is set
+    """
+    with tempfile.TemporaryDirectory() as td:
+        iidfile = os.path.join(td, 'iid')
+        cmd = ['docker', 'buildx', 'build', '--progress=plain', '--load', '--iidfile', iidfile]
+        if tag is not None:
+            cmd += ['--tag', tag]
+        for k, v in labels.items():
+            cmd += ['--label', f"{k}={v}"]
+        if nocache:
+            cmd.append('--no-cache')
+        if pull:
+            cmd.append('--pull')
+        if cache_dir is not None:
+            cmd += ['--cache-from', f"type=local,src={cache_dir}", '--cache-to', f"type=local,dest={cache_dir},mode=max"]
+        cmd.append('-')
+        try:
+            p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except FileNotFoundError:
+            raise DependencyMissing('The docker cli (with the buildx plugin) is required to build with BuildKit.')
+
+        def feed():
+            try:
+                while True:
+                    chunk = context.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    p.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # the build failed, the error will be in the output
+            finally:
+                p.stdin.close()
+
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        parser = build_events.BuildKitParser()
+        for line in p.stdout:
+            if cancelled is not None and cancelled.is_set():
+                p.kill()
+                break
+            output = line.decode(errors='replace').rstrip()
+            if output and output_callback is not None:
+                output_callback(output)
+            if event_callback is not None:
+                for event in parser.feed(output):
+                    event_callback(event)
+        feeder.join()
+        if p.wait() != 0 or not os.path.exists(iidfile):
+            return None
+        with open(iidfile, 'r') as fh:
+            image_id = fh.read().strip()
+        if event_callback is not None:
+            event_callback(build_events.ImageBuilt(image_id))
+        return image_id
+
+
+def docker_sdk_run(docker_client, image, command, options, output=None, remove=True):
+    """
+    Run a container non-interactively via the api, streaming its (combined)
+    output to a binary file object as it arrives.
+
+    Returns:
+        the exit code of the container
+    """
+    kwargs = options.create_kwargs(docker_client, image, command)
+    container = docker_client.create_container(**kwargs)['Id']
+    try:
+        docker_client.start(container)
+        try:
+            for chunk in docker_client.logs(container, stdout=True, stderr=True, stream=True, follow=True):
+                if output is not None:
+                    output.write(chunk)
+                    output.flush()
+        except KeyboardInterrupt:
+            docker_client.stop(container, timeout=2)
+            raise
+        return docker_client.wait(container).get('StatusCode', 1)
+    finally:
+        if remove:
+            try:
+                docker_client.remove_container(container, force=True)
+            except docker.errors.NotFound:
+                pass
+
+
+def docker_sdk_start(docker_client, container, output=None):
+    """
+    Start a created (or stopped) container non-interactively, streaming its
+    (combined) output to a binary file object. Attached before starting rather
+    than following the logs, which would replay the output of earlier runs.
+
+    Returns:
+        the exit code of the container
+    """
+    stream = docker_client.attach(container, stdout=True, stderr=True, stream=True, logs=False)
+    docker_client.start(container)
+    try:
+        for chunk in stream:
+            if output is not None:
+                output.write(chunk)
+                output.flush()
+    except KeyboardInterrupt:
+        docker_client.stop(container, timeout=2)
+        raise
+    return docker_client.wait(container).get('StatusCode', 1)
+
+
+def find_resumable_container(docker_client, name, image_key):
+    """
+    A stopped container (e.g. from an earlier --persistent run) that can be
+    started again, i.e. it has the name and was created from the same image key.
+
+    Returns:
+        the inspected container, or None if there is no container with the name
+
+    Raises:
+        ResumeError: if the container is running or was created from another image
+    """
+    try:
+        container = docker_client.inspect_container(name)
+    except docker.errors.NotFound:
+        return None
+    container_image_key = (container['Config'].get('Labels') or {}).get(IMAGE_KEY_LABEL)
+    if container_image_key != image_key:
+        raise ResumeError(
+            f"container '{name}' was not created from this image, remove it first (docker rm {name})"
+        )
+    if container['State'].get('Running'):
+        raise ResumeError(f"container '{name}' is already running, docker exec into it instead")
+    return container
+
+
+def cache_mount(cliargs, target, sharing='locked', **options):
+    """
+    A ``RUN --mount=type=cache`` flag for extension snippets, e.g.
+
+    .. code-block:: text
+
+       RUN @(cache_mount(cliargs, '/root/.cache/pip'))pip install foo
+
+    Cache mounts persist directories (e.g. apt and pip caches) across builds.
+    They are only supported by BuildKit, so this is empty for the legacy builder.
+    """
+    if not cliargs.get('buildkit'):
+        return ''
+    options = ''.join(f",{k}={v}" for k, v in options.items())
+    return f"--mount=type=cache,target={target},sharing={sharing}{options} "
+
+
+def compute_image_key(dockerfile, files, base_image_id=None):
+    """
+    Content hash of everything that goes into an image build: the base image,
+    the generated Dockerfile and every file contributed by the extensions.
+    """
+    sha = hashlib.sha256()
+    for chunk in [base_image_id or '', dockerfile]:
+        sha.update(chunk.encode())
+        sha.update(b'\0')
+    for file_name in sorted(files.keys()):
+        sha.update(file_name.encode())
+        sha.update(b'\0')
+        sha.update(files[file_name].encode())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def get_image_id(docker_client, image):
+    """Id of a local image, or None if the daemon does not have it."""
+    try:
+        return docker_client.inspect_image(image)['Id']
+    except docker.errors.NotFound:
+        return None
+
+
+def resolve_image_id(docker_client, image):
+    """
+    Id of an image, pulling it first if the daemon does not have it yet. None if it
+    can't be pulled either (e.g. scratch, or a missing image the build will report).
+    """
+    image_id = get_image_id(docker_client, image)
+    if image_id is None:
+        repository, tag = docker.utils.parse_repository_tag(image)
+        try:
+            docker_client.pull(repository, tag=tag or 'latest')
+        except docker.errors.APIError:
+            return None
+        image_id = get_image_id(docker_client, image)
+    return image_id
+
+
+def find_cached_image(docker_client, image_key):
+    """Id of a local image previously built from the given image key, or None."""
+    images = docker_client.images(filters={'label': f"{IMAGE_KEY_LABEL}={image_key}"}, quiet=True)
+    return images[0] if images else None
+
+
+def tag_image(docker_client, image_id, image_name):
+    repository, tag = docker.utils.parse_repository_tag(image_name)
+    return docker_client.tag(image_id, repository, tag=tag, force=True)
+
+
 class SIGWINCHPassthrough(object):
     def __init__(self, process):
         self.process = process
@@ -297,45 +649,127 @@ class SIGWINCHPassthrough(object):
 
 
 class DockerImageGenerator(object):
-    def __init__(self, active_extensions, cliargs, base_image):
+    def __init__(self, active_extensions, cliargs, base_image, docker_client=None):
         self.built = False
-        self.cliargs = cliargs
+        self._docker_client = docker_client
+        self.cliargs = dict(cliargs)  # a copy, the caller's options are left untouched
         self.cliargs['base_image'] = base_image  # inject base image into arguments for use
         self.active_extensions = active_extensions
 
-        self.dockerfile = generate_dockerfile(active_extensions, self.cliargs, base_image)
+        with tracing.span('generate_dockerfile'):
+            self.dockerfile = generate_dockerfile(active_extensions, self.cliargs, base_image)
         self.image_id = None
+        self.image_key = None
         self.image_name = None
+        self.files = None
+        self.cache_hit = False
+        self.build_report = None
 
-    def build(self, **kwargs):
-        with tempfile.TemporaryDirectory() as td:
-            df = os.path.join(td, 'Dockerfile')
-            with open(df, 'w') as fh:
-                fh.write(self.dockerfile)
-            console.banner(f"Dockerfile ({df})")
+    @property
+    def docker_client(self):
+        if self._docker_client is None:
+            self._docker_client = get_docker_client()
+        return self._docker_client
+
+    def get_image_key(self):
+        """
+        The content hash of everything that goes into the image (computed once). A base
+        image that isn't local yet is pulled first, so the key is that of a later run.
+        """
+        if self.image_key is None:
+            with tracing.span('get_files'):
+                self.files = get_files(self.active_extensions, self.cliargs)
+            with tracing.span('compute_image_key'):
+                self.image_key = compute_image_key(
+                    self.dockerfile, self.files, resolve_image_id(self.docker_client, self.cliargs['base_image'])
+                )
+        return self.image_key
+
+    def use_image(self, image_id, image_name=None):
+        """Use an existing image (e.g. one already built from the same image key) instead of building."""
+        self.image_name = image_name
+        if self.image_name is not None:
+            tag_image(self.docker_client, image_id, self.image_name)
+        self.image_id = image_id
+        self.built = True
+
+    def build(self, verbose=True, cancelled=None, **kwargs):
+        docker_client = self.docker_client
+        self.cache_hit = False
+        if kwargs.get('image_name') is not None:
+            self.image_name = kwargs.get('image_name')
+        try:
+            self.get_image_key()
+            image_id = None
+            if not kwargs.get('nocache', False) and not kwargs.get('pull', False):
+                with tracing.span('find_cached_image'):
+                    image_id = find_cached_image(docker_client, self.image_key)
+        except (docker.errors.DockerException, OSError) as ex:
+            console.error(f"Docker build failed [{str(ex)}]")
+            return 1
+        if image_id:
+            if verbose:
+                console.banner("Docker Build")
+                print(console.green + "Image Cache Hit" + console.reset + ": " + console.yellow + f"{image_id}" + console.reset)
+            self.use_image(image_id, self.image_name)
+            self.cache_hit = True
+            return 0
+        if verbose:
+            console.banner("Dockerfile")
             print(self.dockerfile)
-            write_files(self.active_extensions, self.cliargs, td)
+            for file_name in sorted(self.files.keys()):
+                print('Adding file %s to the build context' % file_name)
+        with tracing.span('create_build_context'):
+            context = create_build_context(self.dockerfile, self.files)
+        with context, tracing.span('docker_build'):
             arguments = {}
-            arguments['path'] = td
+            arguments['fileobj'] = context
+            arguments['custom_context'] = True
             arguments['rm'] = True
             arguments['nocache'] = kwargs.get('nocache', False)
             arguments['pull'] = kwargs.get('pull', False)
-            if kwargs.get('image_name') is not None:
-                arguments['tag'] = kwargs.get('image_name')
-                self.image_name = kwargs.get('image_name')
-            console.banner("Docker Build")
-            print(console.green + "Docker Build Arguments")
-            for k, v in arguments.items():
-                print(console.cyan + f"  {k}" + console.reset + ":" + console.yellow + f" {v}" + console.reset)
-            print(console.reset)
+            arguments['labels'] = {IMAGE_KEY_LABEL: self.image_key}
+            if self.image_name is not None:
+                arguments['tag'] = self.image_name
+            if verbose:
+                console.banner("Docker Build")
+                print(console.green + "Docker Build Arguments")
+                for k, v in arguments.items():
+                    print(console.cyan + f"  {k}" + console.reset + ":" + console.yellow + f" {v}" + console.reset)
+                print(console.reset)
+            if kwargs.get('cache_dir') and not kwargs.get('buildkit'):
+                console.warning("--cache-dir is only supported with --buildkit, ignoring")
+            output_callback = (lambda output: print(console.green + "building > " + console.reset + f"{output}")) if verbose else None
+            self.build_report = build_events.BuildReport(self.dockerfile)
             try:
-                self.image_id = docker_build(
-                    **arguments,
-                    output_callback=lambda output: print(console.green + "building > " + console.reset + f"{output}")
-                )
+                if kwargs.get('buildkit'):
+                    self.image_id = docker_buildkit_build(
+                        context,
+                        output_callback=output_callback,
+                        event_callback=self.build_report.add,
+                        tag=arguments.get('tag'),
+                        labels=arguments['labels'],
+                        nocache=arguments['nocache'],
+                        pull=arguments['pull'],
+                        cache_dir=kwargs.get('cache_dir'),
+                        cancelled=cancelled
+                    )
+                else:
+                    self.image_id = docker_build(
+                        docker_client=docker_client,
+                        **arguments,
+                        output_callback=output_callback,
+                        event_callback=self.build_report.add,
+                        cancelled=cancelled
+                    )
+                if verbose:
+                    self.build_report.print()
                 if self.image_id:
                     self.built = True
                     return 0
+                elif cancelled is not None and cancelled.is_set():
+                    console.warning("Docker build cancelled")
+                    return 1
                 else:
                     return 2
 
@@ -353,17 +787,31 @@ class DockerImageGenerator(object):
             console.warning("No tty detected for stdin forcing non-interactive")
         return operating_mode
 
-    def generate_docker_cmd(self, command='', **kwargs):
+    def get_docker_args(self):
         docker_args = ''
+        for e in self.active_extensions:
+            with tracing.span('get_docker_args', 'extension', extension=e.get_name()):
+                docker_args += e.get_docker_args(self.cliargs)
+        return docker_args
 
+    def get_run_options(self):
+        options = run_options.RunOptions()
         for e in self.active_extensions:
-            docker_args += e.get_docker_args(self.cliargs)
+            with tracing.span('get_run_options', 'extension', extension=e.get_name()):
+                options.merge(e.get_run_options(self.cliargs))
+        return options
+
+    def generate_docker_cmd(self, command='', **kwargs):
+        docker_args = self.get_docker_args()
 
         image = self.image_name if self.image_name is not None else self.image_id
         cmd = "docker run"
         if(not kwargs.get('persistent')):
             # remove container only if --nocleanup is not present
             cmd += " --rm"
+        elif self.image_key is not None:
+            # so it can be resumed (--resume)
+            cmd += f" --label {IMAGE_KEY_LABEL}={self.image_key}"
 
         operating_mode = self.get_operating_mode(kwargs)
         if operating_mode != OPERATIONS_NON_INTERACTIVE:
@@ -372,30 +820,121 @@ class DockerImageGenerator(object):
         cmd += "%(docker_args)s %(image)s %(command)s" % locals()
         return cmd
 
-    def run(self, command='', **kwargs):
-        if not self.built:
-            print("Cannot run if build has not passed.")
-            return 1
+    def check_environment(self, cancelled=None):
+        """
+        Run the extensions' precondition and validate hooks (in order).
 
+        Args:
+            cancelled: stop (between hooks) once this event is set
+
+        Returns:
+            a description of the first failure, or None if the environment is ready (or it was cancelled)
+        """
         for e in self.active_extensions:
+            if cancelled is not None and cancelled.is_set():
+                return None
             try:
-                e.precondition_environment(self.cliargs)
+                with tracing.span('precondition_environment', 'extension', extension=e.get_name()):
+                    e.precondition_environment(self.cliargs)
             except subprocess.CalledProcessError as ex:
-                console.error("Failed to precondition environment for extension '%s' [%s][%s]" % (
-                    e.get_name(), ex.returncode, ex.output)
+                return "Failed to precondition environment for extension '%s' [%s][%s]" % (
+                    e.get_name(), ex.returncode, ex.output
                 )
-                return 1
 
         for extension in self.active_extensions:
+            if cancelled is not None and cancelled.is_set():
+                return None
             try:
-                extension.validate_environment(self.cliargs)
+                with tracing.span('validate_environment', 'extension', extension=extension.get_name()):
+                    extension.validate_environment(self.cliargs)
             except ValidateError as e:
-                console.error("Failed to validate environment for extension '%s' [%s]" % (
-                    extension.get_name(), str(e))
-                )
+                return "Failed to validate environment for extension '%s' [%s]" % (extension.get_name(), str(e))
+        return None
+
+    def run(self, command='', **kwargs):
+        if not self.built:
+            print("Cannot run if build has not passed.")
+            return 1
+
+        error = self.check_environment()
+        if error is not None:
+            console.error(error)
+            return 1
+        return self.run_checked(command, **kwargs)
+
+    def launch(self, command='', **kwargs):
+        """
+        Build and run. The extensions' environment hooks (:meth:`check_environment`) run in a
+        thread alongside the build rather than after it and whichever fails first cancels the
+        other, the hooks between extensions and the build between lines of its output.
+
+        Returns:
+            the exit code of the run, else non-zero if the build or the environment failed
+        """
+        build_failed = threading.Event()
+        environment_failed = threading.Event()
+        errors = []
+        exceptions = []
+
+        def check():
+            try:
+                with tracing.span('check_environment'):
+                    error = self.check_environment(cancelled=build_failed)
+            except BaseException as ex:  # raised below, as run() would have
+                exceptions.append(ex)
+                environment_failed.set()
+                return
+            if error is not None:
+                errors.append(error)
+                environment_failed.set()
+
+        checker = threading.Thread(target=check, name='groot_rocker_check_environment', daemon=True)
+        checker.start()
+        exit_code = None
+        try:
+            with tracing.span('build'):
+                exit_code = self.build(cancelled=environment_failed, **kwargs)
+            cancelled = environment_failed.is_set()
+        finally:
+            if exit_code != 0:
+                build_failed.set()
+            checker.join()
+        if exit_code != 0 and not cancelled:
+            console.error("Build failed exiting")
+        if exceptions:
+            raise exceptions[0]
+        for error in errors:
+            console.error(error)
+        if exit_code != 0 or errors:
+            return exit_code or 1
+        with tracing.span('run'):
+            return self.run_checked(command, **kwargs)
+
+    def run_checked(self, command='', **kwargs):
+        """Run without the environment hooks, i.e. once :meth:`check_environment` has passed."""
+        if kwargs.get('resume'):
+            if not kwargs.get('container_name'):
+                console.error("--resume requires a --container-name")
                 return 1
+            kwargs['persistent'] = True
+            try:
+                container = find_resumable_container(self.docker_client, kwargs['container_name'], self.image_key)
+            except ResumeError as ex:
+                console.error(f"Cannot resume [{str(ex)}]")
+                return 1
+            except docker.errors.DockerException as ex:
+                console.error(f"Docker inspect failed [{str(ex)}]")
+                return 1
+            if container is not None:
+                return self.resume(container, command, **kwargs)
 
-        cmd = self.generate_docker_cmd(command, **kwargs)
+        if kwargs.get('pool'):
+            return self.run_in_pool(command, **kwargs)
+        if kwargs.get('runner') == RUNNER_SDK:
+            return self.run_with_sdk(command, **kwargs)
+
+        with tracing.span('generate_docker_cmd'):
+            cmd = self.generate_docker_cmd(command, **kwargs)
         operating_mode = self.get_operating_mode(kwargs)
 
         #   $DOCKER_OPTS \
@@ -404,9 +943,20 @@ class DockerImageGenerator(object):
             print(cmd + "\n")
             return 0
         elif operating_mode == OPERATIONS_NON_INTERACTIVE:
+            capture = logs.LogCapture.from_options(kwargs)
+            if capture is not None:
+                print(cmd + "\n")
+                sys.stdout.flush()
+                with capture, tracing.span('docker_run', mode=operating_mode):
+                    p = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                    with p.stdout:
+                        logs.capture_stream(p.stdout.fileno(), capture)
+                    returncode = p.wait()
+                return self.report_log(capture, returncode)
             try:
                 print(cmd + "\n")
-                p = subprocess.run(shlex.split(cmd), check=True, stderr=subprocess.STDOUT)
+                with tracing.span('docker_run', mode=operating_mode):
+                    p = subprocess.run(shlex.split(cmd), check=True, stderr=subprocess.STDOUT)
                 return p.returncode
             except subprocess.CalledProcessError as ex:
                 print("Non-interactive Docker run failed\n", ex)
@@ -414,51 +964,216 @@ class DockerImageGenerator(object):
         else:
             try:
                 print(cmd + "\n")
-                p = pexpect.spawn(cmd)
-                with SIGWINCHPassthrough(p):
-                    p.interact()
-                p.close(force=True)
+                with tracing.span('docker_run', mode=operating_mode):
+                    p = pexpect.spawn(cmd)
+                    with SIGWINCHPassthrough(p):
+                        p.interact()
+                    p.close(force=True)
                 return p.exitstatus
             except pexpect.ExceptionPexpect as ex:
                 print("Docker run failed\n", ex)
                 return ex.returncode
 
+    def report_log(self, capture, exit_code):
+        """Summarise a captured (--log-file) run, with the tail of the output if it failed."""
+        files = capture.files()
+        print(console.green + "Log" + console.reset + ": " + console.yellow + f"{', '.join(files)} ({capture.bytes_written} bytes)" + console.reset)
+        if exit_code != 0:
+            tail = capture.tail()
+            console.error(f"Docker run failed with exit code {exit_code}, last {len(tail)} lines of output:")
+            for line in tail:
+                print("  " + line)
+        return exit_code
+
+    def run_with_sdk(self, command='', **kwargs):
+        """
+        Create, start and wait on the container via the api rather than the docker cli. Interactively,
+        the terminal is relayed to the container's tty over an attach socket (see :mod:`groot_rocker.attach`).
+        """
+        try:
+            options = self.get_run_options()
+        except run_options.UnsupportedRunOption as ex:
+            console.error(f"Extension arguments are not supported by the sdk runner [{str(ex)}], use --runner cli")
+            return 1
+        if kwargs.get('persistent') and self.image_key is not None:
+            options.merge(run_options.RunOptions(container={'labels': {IMAGE_KEY_LABEL: self.image_key}}))  # for --resume
+        image = self.image_name if self.image_name is not None else self.image_id
+        console.banner("Docker Run")
+        print(console.green + "Run Options" + console.reset)
+        for k, v in list(options.container.items()) + list(options.host.items()):
+            print(console.cyan + f"  {k}" + console.reset + ":" + console.yellow + f" {v}" + console.reset)
+        print(console.green + "Command" + console.reset + ": " + console.yellow + f"{command}" + console.reset + "\n")
+        operating_mode = self.get_operating_mode(kwargs)
+        if operating_mode == OPERATIONS_DRY_RUN:
+            return 0
+        sys.stdout.flush()
+        try:
+            with tracing.span('docker_run', mode=operating_mode, runner=RUNNER_SDK):
+                if operating_mode == OPERATIONS_INTERACTIVE:
+                    return attach.docker_interactive_run(
+                        self.docker_client, image, shlex.split(command), options, remove=not kwargs.get('persistent')
+                    )
+                capture = logs.LogCapture.from_options(kwargs)
+                if capture is None:
+                    return docker_sdk_run(
+                        self.docker_client, image, shlex.split(command), options,
+                        output=sys.stdout.buffer, remove=not kwargs.get('persistent')
+                    )
+                with capture:
+                    exit_code = docker_sdk_run(
+                        self.docker_client, image, shlex.split(command), options,
+                        output=capture, remove=not kwargs.get('persistent')
+                    )
+                return self.report_log(capture, exit_code)
+        except docker.errors.DockerException as ex:
+            console.error(f"Docker run failed [{str(ex)}]")
+            return 1
 
-def write_files(extensions, args_dict, target_directory):
+    def resume(self, container, command='', **kwargs):
+        """
+        Start a stopped container (see :func:`find_resumable_container`) again and attach to it, via
+        the api whichever the runner. It runs the command it was created with, any other is ignored.
+        """
+        name = kwargs.get('container_name') or container['Id']
+        original = container['Config'].get('Cmd') or []
+        operating_mode = self.get_operating_mode(kwargs)
+        interactive = operating_mode == OPERATIONS_INTERACTIVE and container['Config'].get('Tty')
+        console.banner("Docker Start")
+        print(console.green + "Resuming" + console.reset + ": " + console.yellow + f"{name} [{container['Id'][:12]}]" + console.reset)
+        print(console.green + "Command" + console.reset + ": " + console.yellow + f"{' '.join(original)}" + console.reset + "\n")
+        if command and shlex.split(command) != original:
+            console.warning(f"Resumed containers run their original command, ignoring '{command}'")
+        if operating_mode == OPERATIONS_DRY_RUN:
+            print("docker start -a%s %s\n" % (" -i" if container['Config'].get('Tty') else "", name))
+            return 0
+        sys.stdout.flush()
+        try:
+            with tracing.span('docker_start', mode=operating_mode):
+                if interactive:
+                    return attach.docker_interactive_start(self.docker_client, container['Id'])
+                capture = logs.LogCapture.from_options(kwargs)
+                if capture is None:
+                    return docker_sdk_start(self.docker_client, container['Id'], output=sys.stdout.buffer)
+                with capture:
+                    exit_code = docker_sdk_start(self.docker_client, container['Id'], output=capture)
+                return self.report_log(capture, exit_code)
+        except docker.errors.DockerException as ex:
+            console.error(f"Docker start failed [{str(ex)}]")
+            return 1
+
+    def run_in_pool(self, command='', **kwargs):
+        """Execute the command in a warm container from a pool (see :mod:`groot_rocker.pool`)."""
+        from . import pool  # avoid the import cycle
+        container_pool = pool.ContainerPool(
+            self.image_id,
+            self.get_docker_args(),
+            size=kwargs.get('pool'),
+            max_uses=kwargs.get('pool_max_uses') or pool.DEFAULT_POOL_MAX_USES,
+            idle_ttl=kwargs.get('pool_idle_ttl') or pool.DEFAULT_POOL_IDLE_TTL,
+            docker_client=self.docker_client
+        )
+        operating_mode = self.get_operating_mode(kwargs)
+        console.banner("Docker Exec")
+        if operating_mode == OPERATIONS_DRY_RUN:
+            print(container_pool.dry_run(command) + "\n")
+            return 0
+        capture = logs.LogCapture.from_options(kwargs) if operating_mode != OPERATIONS_INTERACTIVE else None
+        try:
+            if capture is None:
+                exit_code = container_pool.run(command, interactive=(operating_mode == OPERATIONS_INTERACTIVE))
+            else:
+                with capture:
+                    exit_code = container_pool.run(command, output=capture)
+                exit_code = self.report_log(capture, exit_code)
+        except (docker.errors.DockerException, OSError) as ex:
+            console.error(f"Pooled run failed [{str(ex)}]")
+            return 1
+        try:
+            container_pool.maintain()  # after the command, so it doesn't add to the launch latency
+        except docker.errors.DockerException as ex:
+            console.warning(f"Failed to maintain the container pool [{str(ex)}]")
+        return exit_code
+
+
+def get_files(extensions, args_dict):
+    """Collect the files from all extensions that will be written into the build context."""
     all_files = {}
     for active_extension in extensions:
-        for file_name, contents in active_extension.get_files(args_dict).items():
+        with tracing.span('get_files', 'extension', extension=active_extension.get_name()):
+            extension_files = active_extension.get_files(args_dict)
+        for file_name, contents in extension_files.items():
             if os.path.isabs(file_name):
                 print('WARNING!! Path %s from extension %s is absolute'
                       'and cannot be written out, skipping' % (file_name, active_extension.get_name()))
                 continue
-            full_path = os.path.join(target_directory, file_name)
-            with open(full_path, 'w') as fh:
-                print('Writing to file %s' % full_path)
-                fh.write(contents)
+            all_files[file_name] = contents
     return all_files
 
 
+def write_files(extensions, args_dict, target_directory):
+    all_files = get_files(extensions, args_dict)
+    write_file_contents(all_files, target_directory)
+    return all_files
+
+
+def write_file_contents(all_files, target_directory):
+    for file_name, contents in all_files.items():
+        full_path = os.path.join(target_directory, file_name)
+        with open(full_path, 'w') as fh:
+            print('Writing to file %s' % full_path)
+            fh.write(contents)
+
+
+def create_build_context(dockerfile, files, max_memory=BUILD_CONTEXT_MAX_MEMORY):
+    """
+    Archive the Dockerfile and extension files into a tar stream that can be
+    sent directly to the daemon. The archive is held in memory unless it
+    would be larger than max_memory, in which case it is written (once) to an
+    anonymous temporary file.
+    """
+    entries = [('Dockerfile', dockerfile.encode())]
+    entries.extend((file_name, contents.encode()) for file_name, contents in sorted(files.items()))
+    # tar headers and data are padded to blocks, two blocks terminate the archive
+    size = sum(tarfile.BLOCKSIZE + -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE for unused_name, data in entries)
+    size += 2 * tarfile.BLOCKSIZE
+    context = io.BytesIO() if size <= max_memory else tempfile.TemporaryFile()
+    with tarfile.open(fileobj=context, mode='w') as archive:
+        mtime = time.time()
+        for file_name, data in entries:
+            info = tarfile.TarInfo(file_name)
+            info.size = len(data)
+            info.mtime = mtime
+            info.mode = 0o644
+            archive.addfile(info, io.BytesIO(data))
+    context.seek(0)
+    return context
+
+
 def generate_dockerfile(extensions, args_dict, base_image):
+    """
+    The Dockerfile from the image affecting part of the extensions, i.e. their
+    preambles and snippets. Extensions that only contribute to the run (docker
+    args, environment hooks) are left out entirely, so activating or changing
+    them doesn't change the image key and a cached image is used as is.
+    """
     dockerfile_str = ''
     for el in extensions:
-        dockerfile_str += '# Preamble from extension [%s]\n' % el.get_name()
-        dockerfile_str += el.get_preamble(args_dict) + '\n'
+        with tracing.span('get_preamble', 'extension', extension=el.get_name()):
+            preamble = el.get_preamble(args_dict)
+        if preamble.strip():
+            dockerfile_str += '# Preamble from extension [%s]\n' % el.get_name()
+            dockerfile_str += preamble + '\n'
     dockerfile_str += '\nFROM %s\n' % base_image
     dockerfile_str += 'USER root\n'
     for el in extensions:
-        dockerfile_str += '# Snippet from extension [%s]\n' % el.get_name()
-        dockerfile_str += el.get_snippet(args_dict) + '\n'
+        with tracing.span('get_snippet', 'extension', extension=el.get_name()):
+            snippet = el.get_snippet(args_dict)
+        if snippet.strip():
+            dockerfile_str += '# Snippet from extension [%s]\n' % el.get_name()
+            dockerfile_str += snippet + '\n'
     return dockerfile_str
 
 
 def list_plugins(extension_point='groot_rocker.extensions'):
-    for entry_point in pkg_resources.iter_entry_points(extension_point):
-        entry_point.load()
-    unordered_plugins = {
-        entry_point.name: entry_point.load() for entry_point in pkg_resources.iter_entry_points(extension_point)
-    }
-    # Order plugins by extension point name for consistent ordering below
-    plugin_names = list(unordered_plugins.keys())
-    plugin_names.sort()
-    return OrderedDict([(k, unordered_plugins[k]) for k in plugin_names])
+    """Import all plugins, ordered by extension point name for consistent ordering."""
+    return plugins.get_registry(extension_point).load_all()
@@ -19,14 +19,33 @@ import pkgutil
 from pathlib import Path
 import re
 from shlex import quote
+import time
 
+from . import cache
 from .core import get_docker_client
 
+# Seconds the list of docker networks is cached for
+NETWORKS_CACHE_TTL = 60
+_networks_cache = cache.PersistentLRUCache('networks', max_entries=8)
+
 
 def name_to_argument(name):
     return '--%s' % name.replace('_', '-')
 
 from .core import RockerExtension
+from .core import ValidateError
+from .run_options import RunOptions
+
+
+def get_docker_networks(refresh=False, docker_client=None):
+    """Names of the docker networks, cached on disk for a short while."""
+    key = os.environ.get('DOCKER_HOST', 'default')
+    cached = None if refresh else _networks_cache.get(key)
+    if cached is not None and time.time() - cached['timestamp'] < NETWORKS_CACHE_TTL:
+        return cached['names']
+    names = sorted(n['Name'] for n in (docker_client or get_docker_client()).networks())
+    _networks_cache.set(key, {'timestamp': time.time(), 'names': names})
+    return names
 
 class Devices(RockerExtension):
     @staticmethod
@@ -49,6 +68,15 @@ class Devices(RockerExtension):
             args += ' --device %s ' % device
         return args
 
+    def get_run_options(self, cliargs):
+        devices = []
+        for device in cliargs.get('devices', None):
+            if not os.path.exists(device):
+                print("ERROR device %s doesn't exist. Skipping" % device)
+                continue
+            devices.append(device)
+        return RunOptions(host={'devices': devices})
+
     @staticmethod
     def register_arguments(parser, defaults={}):
         parser.add_argument('--devices',
@@ -72,6 +100,10 @@ class ContainerName(RockerExtension):
             args += f' --name {name} '
         return args
 
+    def get_run_options(self, cliargs):
+        name = cliargs.get('container_name', None)
+        return RunOptions(container={'name': name} if name else {})
+
     @staticmethod
     def register_arguments(parser, defaults={}):
         parser.add_argument(
@@ -99,12 +131,25 @@ class Network(RockerExtension):
         args += ' --network %s ' % network
         return args
 
+    def get_run_options(self, cliargs):
+        return RunOptions(host={'network_mode': cliargs.get('network', None)})
+
+    def validate_environment(self, cliargs):
+        # Validated here rather than via argparse choices so the daemon is only
+        # queried when a network is actually requested
+        network = cliargs.get('network', None)
+        if network in get_docker_networks():
+            return
+        networks = get_docker_networks(refresh=True)  # it may have been created recently
+        if network not in networks:
+            raise ValidateError("unknown network '%s', choose from %s" % (network, networks))
+
     @staticmethod
     def register_arguments(parser, defaults={}):
-        client = get_docker_client()
-        parser.add_argument('--network', choices=[n['Name'] for n in client.networks()],
+        parser.add_argument('--network',
             default=defaults.get('network', None),
-            help="What network configuration to use.")
+            metavar="NETWORK",
+            help="What network configuration to use (e.g. bridge, host, none).")
 
 
 class HomeDir(RockerExtension):
@@ -118,6 +163,9 @@ class HomeDir(RockerExtension):
     def get_docker_args(self, cliargs):
         return ' -v %s:%s ' % (Path.home(), Path.home())
 
+    def get_run_options(self, cliargs):
+        return RunOptions(host={'binds': ['%s:%s' % (Path.home(), Path.home())]})
+
     @staticmethod
     def register_arguments(parser, defaults={}):
         parser.add_argument(name_to_argument(HomeDir.get_name()),
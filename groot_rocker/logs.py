@@ -0,0 +1,221 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Bounded memory capture of (non-interactive) container output.
+
+Output is written to a log file that is rotated once it would exceed a
+maximum size, keeping a fixed number of backups (``foo.log.1``, ...), which
+are optionally gzip compressed in the background. The last lines are kept in
+a ring buffer for error reports.
+
+.. code-block:: python
+
+   capture = LogCapture('nightly.log', max_bytes=parse_size('64M'), backups=5, compress=True, tail=100)
+   with capture:
+       exit_code = docker_sdk_run(docker_client, image, command, options, output=capture)
+   if exit_code != 0:
+       print('\\n'.join(capture.tail()))
+
+Memory use is bounded by the read buffer and the ring buffer, regardless of
+the volume of output.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import collections
+import gzip
+import os
+import shutil
+import threading
+import typing
+
+##############################################################################
+# Constants
+##############################################################################
+
+DEFAULT_LOG_MAX_BYTES = 64 << 20
+DEFAULT_LOG_BACKUPS = 5
+DEFAULT_LOG_TAIL = 100
+
+READ_BUFFER_SIZE = 1 << 20
+MAX_LINE_LENGTH = 64 << 10  # longer lines are truncated in the ring buffer
+
+_SIZE_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def parse_size(size: str) -> int:
+    """Bytes from a size with an optional (binary) suffix, e.g. 512, 64K, 100M or 2G."""
+    size = str(size).strip().lower().rstrip('ib')
+    if size and size[-1] in _SIZE_SUFFIXES:
+        return int(float(size[:-1]) * _SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def _compress(path: str):
+    with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb', compresslevel=1) as destination:
+        shutil.copyfileobj(source, destination, READ_BUFFER_SIZE)
+    os.remove(path)
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class LogCapture(object):
+    """
+    A writable (binary) sink for container output, see the module documentation.
+
+    Args:
+        path: log file, None to only keep the tail
+        max_bytes: rotate before the file would exceed this size (0 never rotates)
+        backups: number of rotated files to keep (0 truncates instead)
+        compress: gzip the rotated files
+        tail: number of lines to keep in memory
+    """
+    def __init__(
+        self,
+        path: typing.Optional[str]=None,
+        max_bytes: int=DEFAULT_LOG_MAX_BYTES,
+        backups: int=DEFAULT_LOG_BACKUPS,
+        compress: bool=False,
+        tail: int=DEFAULT_LOG_TAIL
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.bytes_written = 0
+        self._lines = collections.deque(maxlen=tail)
+        self._partial = b''
+        self._size = 0
+        self._file = None
+        self._compressor = None
+        if path is not None:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'wb', buffering=0)
+
+    @classmethod
+    def from_options(cls, options: typing.Dict[str, typing.Any]) -> typing.Optional['LogCapture']:
+        """From the --log-xyz command line options, None if no log file was requested."""
+        if not options.get('log_file'):
+            return None
+        return cls(
+            options['log_file'],
+            max_bytes=options['log_max_bytes'] if options.get('log_max_bytes') is not None else DEFAULT_LOG_MAX_BYTES,
+            backups=options['log_backups'] if options.get('log_backups') is not None else DEFAULT_LOG_BACKUPS,
+            compress=bool(options.get('log_compress')),
+            tail=options['log_tail'] if options.get('log_tail') is not None else DEFAULT_LOG_TAIL
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data) -> int:
+        """Write a chunk (any bytes-like object) of output."""
+        length = len(data)
+        if not length:
+            return 0
+        if self._file is not None:
+            if self.max_bytes and self._size and self._size + length > self.max_bytes:
+                self._rotate()
+            view = memoryview(data)
+            while view:
+                written = self._file.write(view)
+                view = view[written:]
+            self._size += length
+        self.bytes_written += length
+        self._remember(data)
+        return length
+
+    def flush(self):
+        pass  # unbuffered
+
+    def tail(self) -> typing.List[str]:
+        """The last lines of output."""
+        lines = list(self._lines)
+        if self._partial:
+            lines = (lines + [self._partial])[-self._lines.maxlen:] if self._lines.maxlen else []
+        return [line.decode(errors='replace').rstrip('\r') for line in lines]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def files(self) -> typing.List[str]:
+        """The log file and its backups (that exist), newest first."""
+        if self.path is None:
+            return []
+        candidates = [self.path] + [self._backup(index) for index in range(1, self.backups + 1)]
+        return [path for path in candidates if os.path.exists(path)]
+
+    def _backup(self, index: int) -> str:
+        return '%s.%d%s' % (self.path, index, '.gz' if self.compress else '')
+
+    def _rotate(self):
+        self._file.close()
+        if self._compressor is not None:
+            self._compressor.join()  # before shuffling the backups it is writing to
+            self._compressor = None
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(self._backup(index)):
+                    os.replace(self._backup(index), self._backup(index + 1))
+            rotated = '%s.1' % self.path
+            os.replace(self.path, rotated)
+            if self.compress:
+                self._compressor = threading.Thread(target=_compress, args=(rotated,), daemon=True)
+                self._compressor.start()
+        self._file = open(self.path, 'wb', buffering=0)
+        self._size = 0
+
+    def _remember(self, data):
+        """Keep the last lines, only splitting (at most) the end of the chunk into lines."""
+        if not self._lines.maxlen:
+            return
+        view = memoryview(data)
+        window = 8192
+        while True:
+            start = max(0, len(view) - window)
+            chunk = bytes(view[start:])
+            if start == 0 or chunk.count(b'\n') > self._lines.maxlen:
+                break
+            window *= 4
+        lines = chunk.split(b'\n')
+        if start == 0:
+            lines[0] = (self._partial + lines[0])[:MAX_LINE_LENGTH]
+        if len(lines) > 1:
+            self._lines.extend(line[:MAX_LINE_LENGTH] for line in lines[-1 - self._lines.maxlen:-1])
+            self._partial = lines[-1][:MAX_LINE_LENGTH]
+        else:
+            self._partial = lines[0]
+
+
+def capture_stream(fd: int, capture: LogCapture, buffer_size: int=READ_BUFFER_SIZE):
+    """Copy everything read from a file descriptor (e.g. a pipe) to the capture, via a preallocated buffer."""
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        received = os.readv(fd, [view])
+        if not received:
+            return
+        capture.write(view[:received])
@@ -12,12 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import pexpect
+import concurrent.futures
+import hashlib
+import io
+import os
+import re
+import tarfile
+import threading
+
+import docker
 
 from ast import literal_eval
 from io import BytesIO as StringIO
 
-from .core import docker_build, get_docker_client
+from . import cache
+from .core import docker_build, get_docker_client, get_image_id
 
 DETECTION_TEMPLATE="""
 FROM python:3-slim-stretch as detector
@@ -34,69 +43,284 @@ RUN . /tmp/distrovenv/bin/activate && pip install distro pyinstaller==4.0 static
 RUN echo 'import distro; import sys; output = (distro.name(), distro.version(), distro.codename()); print(output) if distro.name() else sys.exit(1)' > /tmp/distrovenv/detect_os.py
 RUN . /tmp/distrovenv/bin/activate && pyinstaller --onefile /tmp/distrovenv/detect_os.py
 RUN . /tmp/distrovenv/bin/activate && staticx /dist/detect_os /dist/detect_os_static && chmod go+xr /dist/detect_os_static
+"""
 
-FROM %(image_name)s
+# The detector is built once per version of the template and shared by all target images
+DETECTOR_VERSION = hashlib.sha256(DETECTION_TEMPLATE.encode()).hexdigest()[:12]
+DETECTOR_IMAGE = "groot:os_detector_%s" % DETECTOR_VERSION
+DETECTOR_BINARY = "/dist/detect_os_static"
+DETECTOR_PATH = "/tmp/detect_os"  # where the detector is copied to in the target container
 
-COPY --from=detector /dist/detect_os_static /tmp/detect_os
-ENTRYPOINT [ "/tmp/detect_os" ]
-CMD [ "" ]
-"""
+# Searched in order, as per https://www.freedesktop.org/software/systemd/man/os-release.html
+OS_RELEASE_PATHS = ['/etc/os-release', '/usr/lib/os-release']
 
+# Results are keyed by image id, not by the (mutable) image name, so
+# they are implicitly invalidated when a tag moves to a new image.
 _detect_os_cache = dict()
+_detect_os_disk_cache = cache.PersistentLRUCache('os_detect', max_entries=512)
+_detector_lock = threading.Lock()
 
 
-def detect_os(image_name, output_callback=None, nocache=False):
+def detect_os(image_name, output_callback=None, nocache=False, docker_client=None):
+    if docker_client is None:
+        docker_client = get_docker_client()
+    image_id = get_image_id(docker_client, image_name)
     # Do not rerun OS detection if there is already a cached result for the given image
-    if image_name in _detect_os_cache:
-        return _detect_os_cache[image_name]
-
-    iof = StringIO((DETECTION_TEMPLATE % locals()).encode())
-    docker_client = get_docker_client()
-    if not nocache:
-        # build and name an intermediate image
-        image_id = docker_build(
-            docker_client=docker_client,
-            fileobj=iof,
-            target="detector",
-            output_callback=output_callback,
-            nocache=nocache,
-            forcerm=True,  # don't leave containers lying around from RUN commands in DETECTION_TEMPLATE
-            tag="groot:" + f"os_detect_builder"
-        )
-        if not image_id:
+    if image_id is not None and not nocache:
+        result = cached_os(image_id)
+        if result is not None:
             if output_callback:
-                output_callback('Failed to build the os detector (intermediate image)')
+                output_callback("cached result for %s [%s]" % (image_name, image_id))
+            return result
+
+    try:
+        result = read_os_release(docker_client, image_name, output_callback)
+    except docker.errors.NotFound as e:
+        if output_callback:
+            output_callback("image not found [%s]" % str(e))
+        return None
+    if result is None:
+        # no os-release file, fall back to the (much slower) distro detector
+        if output_callback:
+            output_callback("no os-release file found, falling back to the os detector image")
+        result = _detect_os(docker_client, image_name, output_callback, nocache)
+    if result is not None:
+        # the image may only have been pulled during detection
+        image_id = image_id or get_image_id(docker_client, image_name)
+        if image_id is not None:
+            cache_os(image_id, result)
+    return result
+
+
+def cached_os(image_id):
+    """The detected os of an image id from the in-memory or persistent cache, or None."""
+    if image_id not in _detect_os_cache:
+        result = _detect_os_disk_cache.get(image_id)
+        if result is None:
             return None
-    image_id = docker_build(
-        docker_client=docker_client,
-        fileobj=iof,
-        output_callback=output_callback,
-        nocache=nocache,
-        forcerm=True,  # don't leave containers lying around from RUN commands in DETECTION_TEMPLATE
-        tag="groot:" + f"os_detect_{image_name}".replace(':', '_').replace('/', '_')
-    )
-    if not image_id:
+        _detect_os_cache[image_id] = tuple(result)
+    return _detect_os_cache[image_id]
+
+
+def cache_os(image_id, result):
+    """Remember the detected os of an image id, in memory and on disk."""
+    _detect_os_cache[image_id] = tuple(result)
+    _detect_os_disk_cache.set(image_id, list(result))
+
+
+def detect_os_batch(image_names, output_callback=None, nocache=False, max_workers=8, docker_client=None):
+    """
+    Detect the os of many images concurrently with a bounded pool of workers
+    sharing a single docker client.
+
+    Returns:
+        a generator of (image_name, result, error) tuples, yielded as each detection finishes
+    """
+    if docker_client is None:
+        docker_client = get_docker_client()
+
+    def detect(image_name):
+        callback = None
         if output_callback:
-            output_callback('Failed to build the os detector runtime image')
+            def callback(*args):
+                output_callback("[%s] %s" % (image_name, " ".join(str(a) for a in args)))
+        return detect_os(image_name, callback, nocache, docker_client)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(detect, image_name): image_name for image_name in image_names}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield (futures[future], future.result(), None)
+            except (docker.errors.DockerException, OSError, ValueError, SyntaxError) as e:
+                yield (futures[future], None, str(e))
+
+
+def list_local_images(docker_client=None):
+    """Names of all tagged local images, or their ids if untagged."""
+    if docker_client is None:
+        docker_client = get_docker_client()
+    image_names = []
+    for image in docker_client.images():
+        tags = [t for t in (image.get('RepoTags') or []) if t != '<none>:<none>']
+        image_names.extend(tags if tags else [image['Id']])
+    return image_names
+
+
+def parse_os_release(content):
+    """Parse the shell compatible key=value assignments of an os-release file into a dict."""
+    info = dict()
+    for line in content.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        info[key.strip()] = value
+    return info
+
+
+def os_release_to_distro(info):
+    """
+    Convert parsed os-release information into the (name, version, codename)
+    tuple, as provided by the :mod:`distro` module for the detector image.
+    """
+    name = info.get('NAME', '')
+    if not name:
         return None
-    if not image_id or nocache:
-        # clean the intermediate builder image, if it exists
-        docker_client.prune_images(filters={"label": "stage=os_detect_builder"})
+    codename = info.get('VERSION_CODENAME') or info.get('UBUNTU_CODENAME')
+    if not codename:
+        # e.g. VERSION="14.04 LTS, Trusty Tahr" or VERSION="29 (Container Image)"
+        match = re.search(r'(\(\D+\))|,(\s+)?\D+', info.get('VERSION', ''))
+        codename = match.group().strip('()').strip(',').strip() if match else ''
+    return (name, info.get('VERSION_ID', ''), codename)
 
-    cmd = "docker run -it --rm %s" % image_id
-    if output_callback:
-        output_callback("running, ", cmd)
-    p = pexpect.spawn(cmd)
-    output = p.read().decode()
+
+def read_os_release(docker_client, image_name, output_callback=None):
+    """
+    Detect the os by reading the os-release file directly from the image's filesystem.
+    This only creates (never starts) a container and is orders of magnitude faster
+    than building and running the detector image.
+
+    Returns:
+        the (name, version, codename) tuple, or None if the image has no os-release file
+
+    Raises:
+        docker.errors.NotFound: if the image could not be found or pulled
+    """
+    try:
+        container = docker_client.create_container(image_name, command=['/bin/true'])
+    except docker.errors.ImageNotFound:
+        if output_callback:
+            output_callback("pulling %s" % image_name)
+        try:
+            docker_client.pull(image_name)
+        except docker.errors.APIError as e:
+            raise docker.errors.NotFound(str(e))
+        container = docker_client.create_container(image_name, command=['/bin/true'])
+    try:
+        for path in OS_RELEASE_PATHS:
+            content = _read_container_file(docker_client, container['Id'], path)
+            if content is not None:
+                if output_callback:
+                    output_callback("read %s from %s" % (path, image_name))
+                return os_release_to_distro(parse_os_release(content))
+        return None
+    finally:
+        docker_client.remove_container(container['Id'], force=True)
+
+
+def _read_container_file(docker_client, container, path, max_symlinks=8):
+    """Read a text file out of a container via the archive api, following symlinks."""
+    for unused_i in range(max_symlinks):
+        try:
+            stream, stat = docker_client.get_archive(container, path)
+        except docker.errors.NotFound:
+            return None
+        content, path = read_archive_file(path, b''.join(stream), stat)
+        if path is None:
+            return content
+    return None
+
+
+def read_archive_file(path, data, stat):
+    """
+    Read the text file out of an archive fetched from a container (``get_archive``).
+
+    Returns:
+        (content, None), (None, None) if it is not a regular file, or (None, target) if
+        it is a symlink to follow
+    """
+    link_target = stat.get('linkTarget')
+    if link_target:
+        return None, os.path.normpath(os.path.join(os.path.dirname(path), link_target))
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        member = archive.next()
+        if member is None or not member.isfile():
+            return None, None
+        return archive.extractfile(member).read().decode('utf-8', errors='replace'), None
+
+
+def get_detector_binary(docker_client, output_callback=None, nocache=False):
+    """
+    Build the static detector binary (once) and extract it to a versioned
+    file in the cache directory so it can be copied into any target container.
+
+    Returns:
+        path to the binary on the host, or None if it could not be built
+    """
+    path = os.path.join(cache.cache_directory(), 'os_detector', DETECTOR_VERSION, 'detect_os')
+    with _detector_lock:
+        if os.path.isfile(path) and not nocache:
+            return path
+        image_id = None if nocache else get_image_id(docker_client, DETECTOR_IMAGE)
+        if image_id is None:
+            image_id = docker_build(
+                docker_client=docker_client,
+                fileobj=StringIO(DETECTION_TEMPLATE.encode()),
+                output_callback=output_callback,
+                nocache=nocache,
+                forcerm=True,  # don't leave containers lying around from RUN commands in DETECTION_TEMPLATE
+                tag=DETECTOR_IMAGE
+            )
+            if not image_id:
+                if output_callback:
+                    output_callback('Failed to build the os detector image')
+                return None
+        container = docker_client.create_container(image_id, command=['/bin/true'])
+        try:
+            stream, unused_stat = docker_client.get_archive(container['Id'], DETECTOR_BINARY)
+            with tarfile.open(fileobj=io.BytesIO(b''.join(stream))) as archive:
+                binary = archive.extractfile(archive.next()).read()
+        finally:
+            docker_client.remove_container(container['Id'], force=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = "%s.%d" % (path, os.getpid())
+        with open(temporary_path, 'wb') as fh:
+            fh.write(binary)
+        os.chmod(temporary_path, 0o755)
+        os.replace(temporary_path, path)
+        return path
+
+
+def _detector_archive(binary):
+    """A tar archive of the detector binary, to be extracted at the root of a container."""
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        info = tar.gettarinfo(binary, arcname=DETECTOR_PATH.lstrip('/'))
+        info.mode = 0o755
+        info.uid = info.gid = 0
+        info.uname = info.gname = 'root'
+        with open(binary, 'rb') as fh:
+            tar.addfile(info, fh)
+    return archive.getvalue()
+
+
+def _detect_os(docker_client, image_name, output_callback=None, nocache=False):
+    binary = get_detector_binary(docker_client, output_callback, nocache)
+    if binary is None:
+        return None
+    # copy (rather than bind mount) the detector into a throwaway container of the target
+    # image, the daemon may not share the client's filesystem (remote hosts, docker desktop)
+    container = docker_client.create_container(image_name, entrypoint=[DETECTOR_PATH], command=[])
+    try:
+        docker_client.put_archive(container['Id'], '/', _detector_archive(binary))
+        if output_callback:
+            output_callback("running %s in %s" % (DETECTOR_PATH, image_name))
+        docker_client.start(container['Id'])
+        exit_code = docker_client.wait(container['Id'])
+        exit_code = exit_code.get('StatusCode', 1) if isinstance(exit_code, dict) else exit_code
+        output = docker_client.logs(container['Id']).decode()
+    finally:
+        docker_client.remove_container(container['Id'], force=True)
     if output_callback:
-        output_callback("output: ", output)
-    p.terminate()
-    if p.exitstatus == 0:
-        _detect_os_cache[image_name] = literal_eval(output.strip())
-        return _detect_os_cache[image_name]
+        output_callback("output: %s" % output)
+    if exit_code == 0:
+        return literal_eval(output.strip())
     else:
         if output_callback:
-            output_callback("/tmp/detect_os failed:")
+            output_callback("%s failed:" % DETECTOR_PATH)
             for l in output.splitlines():
                 output_callback("> %s" % l)
         return None
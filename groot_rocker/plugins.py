@@ -0,0 +1,290 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Discovery of the extensions installed on the ``groot_rocker.extensions``
+entry point.
+
+Importing every extension just to build the command line parser is expensive,
+so the registry keeps a persistent index of each extension's name,
+dependencies and command line arguments. The index is keyed by a fingerprint
+of the installed distributions that provide extensions and rebuilt (by
+importing every extension once) whenever that fingerprint changes. Extensions
+are otherwise only imported when they are activated.
+
+Set ``GROOT_ROCKER_PLUGIN_INDEX=0`` to disable the index, e.g. while
+developing an extension in an editable install.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import collections
+import functools
+import hashlib
+import importlib
+import importlib.metadata
+import os
+import sys
+import typing
+
+from . import cache
+from . import tracing
+
+##############################################################################
+# Constants
+##############################################################################
+
+EXTENSION_POINT = 'groot_rocker.extensions'
+INDEX_FORMAT = 2  # bump to discard indexes recorded by older versions
+
+# Argument types that can be replayed from the index by name
+_REPLAYABLE_TYPES = {'str': str, 'int': int, 'float': float}
+
+_index_cache = cache.PersistentLRUCache('plugins', max_entries=8)
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def find_entry_points(extension_point: str=EXTENSION_POINT) -> typing.Tuple[typing.Dict[str, typing.Any], str]:
+    """
+    Find the entry points registered for the extension point, along with a
+    fingerprint of the distributions that provide them.
+
+    Returns:
+        a (name -> entry point, fingerprint) tuple
+    """
+    entry_points = {}
+    sha = hashlib.sha256()
+    sha.update(("%s:%s:%s:%s" % (INDEX_FORMAT, sys.version, sys.prefix, extension_point)).encode())
+    for dist in importlib.metadata.distributions():
+        dist_entry_points = [ep for ep in dist.entry_points if ep.group == extension_point]
+        if not dist_entry_points:
+            continue
+        path = getattr(dist, '_path', None)
+        try:
+            mtime = os.stat(str(path)).st_mtime if path is not None else 0
+        except OSError:
+            mtime = 0
+        sha.update(("%s:%s:%s:%s" % (dist.metadata['Name'], dist.version, path, mtime)).encode())
+        for ep in dist_entry_points:
+            sha.update(("%s=%s" % (ep.name, ep.value)).encode())
+            entry_points.setdefault(ep.name, ep)  # first on the path wins, as it does for imports
+    return entry_points, sha.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_registry(extension_point: str=EXTENSION_POINT) -> 'PluginRegistry':
+    """The registry for the extension point, built once per process."""
+    return PluginRegistry(extension_point)
+
+##############################################################################
+# Argument Recording
+##############################################################################
+
+
+class NotReplayable(Exception):
+    """The extension does something while registering arguments that can't be indexed."""
+    pass
+
+
+class _DefaultPlaceholder(object):
+    """
+    Stands in for a value looked up via ``defaults.get(key, fallback)``. Only
+    passing it straight to ``add_argument()`` can be replayed, anything computed
+    from it (e.g. ``defaults.get(key) or []``, ``'%s' % defaults.get(key)``)
+    raises :class:`NotReplayable`.
+    """
+    __hash__ = None
+
+    def __init__(self, key, fallback):
+        self.key = key
+        self.fallback = fallback
+
+    def _not_replayable(self, *unused_args, **unused_kwargs):
+        raise NotReplayable("expression on defaults.get('%s')" % self.key)
+
+    def __getattr__(self, name):
+        raise NotReplayable("defaults.get('%s').%s" % (self.key, name))
+
+
+for _name in [
+    'bool', 'str', 'repr', 'format', 'bytes', 'int', 'float', 'index', 'len', 'iter', 'contains', 'getitem', 'call',
+    'eq', 'ne', 'lt', 'le', 'gt', 'ge', 'neg', 'pos', 'abs', 'invert',
+    'add', 'radd', 'sub', 'rsub', 'mul', 'rmul', 'truediv', 'rtruediv', 'floordiv', 'rfloordiv',
+    'mod', 'rmod', 'pow', 'rpow', 'and', 'rand', 'or', 'ror', 'xor', 'rxor'
+]:
+    setattr(_DefaultPlaceholder, '__%s__' % _name, _DefaultPlaceholder._not_replayable)
+del _name
+
+
+class _RecordingDefaults(object):
+    """Substitute for the yaml defaults dict that only supports ``get()``."""
+    def get(self, key, fallback=None):
+        return _DefaultPlaceholder(key, fallback)
+
+    def __getattr__(self, name):
+        raise NotReplayable("defaults.%s" % name)
+
+    def __contains__(self, key):
+        raise NotReplayable("'%s' in defaults" % key)
+
+    def __getitem__(self, key):
+        raise NotReplayable("defaults['%s']" % key)
+
+
+class _RecordingParser(object):
+    """Substitute for the argparse parser that records ``add_argument()`` calls."""
+    def __init__(self):
+        self.arguments = []
+
+    def add_argument(self, *args, **kwargs):
+        self.arguments.append({
+            'args': [_encode(a) for a in args],
+            'kwargs': {k: _encode(v, top_level=True) for k, v in kwargs.items()}
+        })
+
+    def __getattr__(self, name):
+        raise NotReplayable("parser.%s" % name)
+
+
+def _encode(value, top_level=False):
+    if isinstance(value, _DefaultPlaceholder):
+        if not top_level:
+            raise NotReplayable("nested default")
+        return {'__default__': value.key, 'fallback': _encode(value.fallback)}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    for name, replayable_type in _REPLAYABLE_TYPES.items():
+        if value is replayable_type:
+            return {'__type__': name}
+    raise NotReplayable("unsupported argument value %r" % (value,))
+
+
+def _decode(value, defaults):
+    if isinstance(value, dict):
+        if '__default__' in value:
+            return defaults.get(value['__default__'], _decode(value['fallback'], defaults))
+        return _REPLAYABLE_TYPES[value['__type__']]
+    if isinstance(value, list):
+        return [_decode(v, defaults) for v in value]
+    return value
+
+##############################################################################
+# Registry
+##############################################################################
+
+
+class PluginRegistry(object):
+    """
+    Lazily loaded extensions for an extension point.
+
+    Args:
+        extension_point: the entry point group to search
+        index_cache: persistent storage for the index (defaults to the user's cache directory)
+    """
+    def __init__(
+        self,
+        extension_point: str=EXTENSION_POINT,
+        index_cache: typing.Optional[cache.PersistentLRUCache]=None
+    ):
+        self.extension_point = extension_point
+        with tracing.span('find_entry_points'):
+            self.entry_points, self.fingerprint = find_entry_points(extension_point)
+        self.index_cache = index_cache if index_cache is not None else _index_cache
+        if os.environ.get('GROOT_ROCKER_PLUGIN_INDEX', '1') == '0':
+            self.index_cache = None
+        self._classes = {}
+        self._index = None
+
+    def names(self) -> typing.List[str]:
+        """Sorted names of the available extensions (no imports required)."""
+        return sorted(self.entry_points.keys())
+
+    def load(self, name: str) -> typing.Type[typing.Any]:
+        if name not in self._classes:
+            with tracing.span('load_extension', 'extension', extension=name):
+                self._classes[name] = self.entry_points[name].load()
+        return self._classes[name]
+
+    def load_all(self) -> typing.Dict[str, typing.Type[typing.Any]]:
+        """Import all extensions, ordered by name."""
+        return collections.OrderedDict([(name, self.load(name)) for name in self.names()])
+
+    @property
+    def index(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        if self._index is None:
+            if self.index_cache is not None:
+                self._index = self.index_cache.get(self.fingerprint)
+            if self._index is None or set(self._index.keys()) != set(self.names()):
+                with tracing.span('build_plugin_index'):
+                    self._index = {name: self._index_extension(name) for name in self.names()}
+                if self.index_cache is not None:
+                    self.index_cache.set(self.fingerprint, self._index)
+        return self._index
+
+    def _index_extension(self, name: str) -> typing.Dict[str, typing.Any]:
+        from .core import RockerExtension  # avoid the import cycle
+        cls = self.load(name)
+        default_activation = getattr(cls.check_args_for_activation, '__func__', None) is \
+            RockerExtension.check_args_for_activation.__func__
+        entry = {
+            'extension_name': cls.get_name(),
+            'default_activation': default_activation,
+            'desired_extensions': sorted(cls.desired_extensions()),
+            'required_extensions': sorted(cls.required_extensions()),
+            'supports_defaults': True,
+            'arguments': None
+        }
+        parser = _RecordingParser()
+        try:
+            try:
+                cls.register_arguments(parser, _RecordingDefaults())
+            except TypeError:
+                parser = _RecordingParser()
+                cls.register_arguments(parser)
+                entry['supports_defaults'] = False
+            entry['arguments'] = parser.arguments
+        except Exception:  # anything at all, e.g. NotReplayable, means this one is registered live
+            pass
+        return entry
+
+    def register_arguments(self, parser, defaults={}):
+        """Register every extension's arguments, replaying from the index where possible."""
+        for name in self.names():
+            entry = self.index[name]
+            if entry['arguments'] is None:
+                cls = self.load(name)
+                try:
+                    cls.register_arguments(parser, defaults)
+                except TypeError as unused_ex:
+                    print("Extension %s doesn't support default arguments. Please extend it." % cls.get_name())
+                    cls.register_arguments(parser)
+                continue
+            if not entry['supports_defaults']:
+                print("Extension %s doesn't support default arguments. Please extend it." % entry['extension_name'])
+            for argument in entry['arguments']:
+                parser.add_argument(
+                    *[_decode(a, defaults) for a in argument['args']],
+                    **{k: _decode(v, defaults) for k, v in argument['kwargs'].items()}
+                )
+
+    def extension_name(self, name: str) -> str:
+        return self.index[name]['extension_name']
+
+    def check_args_for_activation(self, name: str, cli_args: typing.Dict[str, typing.Any]) -> bool:
+        """Check for activation, only importing the extension if it customises the check."""
+        entry = self.index[name]
+        if entry['default_activation']:
+            return True if cli_args.get(entry['extension_name']) else False
+        return self.load(name).check_args_for_activation(cli_args)
@@ -0,0 +1,286 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Warm pools of pre-started containers that commands are dispatched to with
+``docker exec``, skipping container creation, start and teardown.
+
+Pool containers run a keepalive process, are labelled with the key of the
+pool (a hash of the image id and the docker run arguments) and are recycled
+after a number of uses or when they have been idle too long. Use counts
+and idle times are shared between invocations via the cache directory.
+
+.. code-block:: python
+
+   pool = ContainerPool(image_id, docker_args, size=2)
+   exit_code = pool.run(['colcon', 'list'])
+   pool.maintain()
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import argparse
+import hashlib
+import shlex
+import subprocess
+import sys
+import time
+import typing
+
+import docker
+
+from . import attach
+from . import cache
+from . import console
+from . import tracing
+
+##############################################################################
+# Constants
+##############################################################################
+
+POOL_LABEL = 'groot_rocker.pool'
+POOL_IMAGE_LABEL = 'groot_rocker.pool.image'
+POOL_MAX_USES_LABEL = 'groot_rocker.pool.max_uses'
+POOL_IDLE_TTL_LABEL = 'groot_rocker.pool.idle_ttl'
+
+DEFAULT_POOL_MAX_USES = 100
+DEFAULT_POOL_IDLE_TTL = 600  # seconds
+
+# Keeps the container alive and (with --init) stops promptly
+KEEPALIVE = ['tail', '-f', '/dev/null']
+
+_usage = cache.PersistentLRUCache('pool', max_entries=1024)
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def pool_key(image_id: str, docker_args: str) -> str:
+    sha = hashlib.sha256()
+    sha.update(image_id.encode())
+    sha.update(b'\0')
+    sha.update(' '.join(shlex.split(docker_args)).encode())
+    return sha.hexdigest()[:16]
+
+
+def pool_docker_args(docker_args: str) -> str:
+    """Drop run arguments that can't be shared by several containers (i.e. --name)."""
+    tokens = shlex.split(docker_args)
+    kept = []
+    skip = False
+    for token in tokens:
+        if skip:
+            skip = False
+            continue
+        if token == '--name':
+            skip = True
+            continue
+        if token.startswith('--name='):
+            continue
+        kept.append(token)
+    if len(kept) != len(tokens):
+        console.warning("pooled containers can't share a name, ignoring --name")
+    return ' '.join(shlex.quote(token) for token in kept)
+
+
+def exec_command(image_config: typing.Dict[str, typing.Any], command: typing.List[str]) -> typing.List[str]:
+    """
+    The command to exec in a pool container (started with a keepalive entrypoint) to run
+    what ``docker run image command`` would: the image's entrypoint followed by the command,
+    or the image's cmd if there is no command.
+    """
+    return (image_config.get('Entrypoint') or []) + (list(command) or image_config.get('Cmd') or [])
+
+
+def list_pool_containers(docker_client, key: typing.Optional[str]=None) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Pool containers (running or not), of a single pool if a key is given."""
+    label = POOL_LABEL if key is None else f"{POOL_LABEL}={key}"
+    return docker_client.containers(all=True, filters={'label': label})
+
+
+def prune(docker_client, now: typing.Optional[float]=None, remove_all: bool=False) -> typing.List[str]:
+    """
+    Remove pool containers that have exited, have been used too often or have
+    been idle for longer than their pool's idle ttl (from all pools).
+
+    Returns:
+        the ids of the removed containers
+    """
+    now = time.time() if now is None else now
+    removed = []
+    for container in list_pool_containers(docker_client):
+        labels = container.get('Labels') or {}
+        usage = _usage.get(container['Id']) or {}
+        last_used = usage.get('last_used', container.get('Created', now))
+        idle_ttl = float(labels.get(POOL_IDLE_TTL_LABEL, DEFAULT_POOL_IDLE_TTL))
+        max_uses = int(labels.get(POOL_MAX_USES_LABEL, DEFAULT_POOL_MAX_USES))
+        if remove_all or container.get('State') != 'running' or \
+                usage.get('uses', 0) >= max_uses or now - last_used > idle_ttl:
+            remove_container(docker_client, container['Id'])
+            removed.append(container['Id'])
+    return removed
+
+
+def remove_container(docker_client, container_id: str):
+    try:
+        docker_client.remove_container(container_id, force=True)
+    except docker.errors.NotFound:
+        pass
+    _usage.remove(container_id)
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class ContainerPool(object):
+    """
+    A pool of warm containers for an image and set of docker run arguments.
+
+    Args:
+        image_id: image to run
+        docker_args: additional ``docker run`` arguments (e.g. from the extensions)
+        size: number of containers to keep warm
+        max_uses: recycle a container after this many commands
+        idle_ttl: remove a container after this many seconds without a command
+        docker_client: low level docker api client
+    """
+    def __init__(
+        self,
+        image_id: str,
+        docker_args: str='',
+        size: int=1,
+        max_uses: int=DEFAULT_POOL_MAX_USES,
+        idle_ttl: float=DEFAULT_POOL_IDLE_TTL,
+        docker_client=None
+    ):
+        if docker_client is None:
+            from .core import get_docker_client  # avoid the import cycle
+            docker_client = get_docker_client()
+        self.image_id = image_id
+        self.docker_args = pool_docker_args(docker_args)
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.idle_ttl = idle_ttl
+        self.docker_client = docker_client
+        self.key = pool_key(image_id, self.docker_args)
+        self._image_config = None
+
+    def containers(self) -> typing.List[str]:
+        """Ids of the running containers in the pool, least used first."""
+        running = [c['Id'] for c in list_pool_containers(self.docker_client, self.key) if c.get('State') == 'running']
+        return sorted(running, key=lambda c: (_usage.get(c) or {}).get('uses', 0))
+
+    def warm(self) -> typing.List[str]:
+        """Start containers until the pool is full, returns the running containers."""
+        running = self.containers()
+        missing = self.size - len(running)
+        if missing > 0:
+            with tracing.span('warm_pool', containers=missing):
+                cmd = ['docker', 'run', '--detach', '--init',
+                       '--label', f"{POOL_LABEL}={self.key}",
+                       '--label', f"{POOL_IMAGE_LABEL}={self.image_id}",
+                       '--label', f"{POOL_MAX_USES_LABEL}={self.max_uses}",
+                       '--label', f"{POOL_IDLE_TTL_LABEL}={self.idle_ttl}",
+                       '--entrypoint', KEEPALIVE[0]] + shlex.split(self.docker_args) + [self.image_id] + KEEPALIVE[1:]
+                processes = [
+                    subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                    for unused_i in range(missing)
+                ]
+                for process in processes:
+                    stdout, stderr = process.communicate()
+                    if process.returncode != 0:
+                        raise docker.errors.DockerException(f"failed to start a pool container [{stderr.strip()}]")
+                    _usage.set(stdout.strip(), {'uses': 0, 'last_used': time.time()})
+            running = self.containers()
+        return running
+
+    def acquire(self) -> str:
+        """The least used running container (starting the pool if necessary), marked as used."""
+        running = self.containers() or self.warm()
+        if not running:
+            raise docker.errors.DockerException(f"no running containers in pool {self.key}")
+        container_id = running[0]
+        usage = _usage.get(container_id) or {'uses': 0}
+        _usage.set(container_id, {'uses': usage['uses'] + 1, 'last_used': time.time()})
+        return container_id
+
+    def exec_command(self, command: typing.List[str]) -> typing.List[str]:
+        """The command to exec, see :func:`exec_command`."""
+        if self._image_config is None:
+            self._image_config = self.docker_client.inspect_image(self.image_id).get('Config') or {}
+        return exec_command(self._image_config, command)
+
+    def run(self, command: typing.Union[str, typing.List[str]]='', interactive: bool=False, output=None) -> int:
+        """
+        Execute a command in a warm container, streaming the output to stdout
+        (or a binary file object, if non-interactive).
+
+        Returns:
+            the exit code of the command
+        """
+        command = self.exec_command(shlex.split(command) if isinstance(command, str) else list(command))
+        with tracing.span('pool_acquire'):
+            container_id = self.acquire()
+        if interactive:
+            with tracing.span('pool_exec', mode='interactive'):
+                return attach.docker_interactive_exec(self.docker_client, container_id, command)
+        with tracing.span('pool_exec', mode='non-interactive'):
+            exec_id = self.docker_client.exec_create(container_id, command, stdout=True, stderr=True)['Id']
+            output = sys.stdout.buffer if output is None else output
+            for chunk in self.docker_client.exec_start(exec_id, stream=True):
+                output.write(chunk)
+                output.flush()
+            exit_code = self.docker_client.exec_inspect(exec_id).get('ExitCode')
+            return exit_code if exit_code is not None else 1  # e.g. still running
+
+    def dry_run(self, command: str='') -> str:
+        return "docker exec <warm container of pool %s> %s" % (self.key, command)
+
+    def maintain(self):
+        """Prune recycled and idle containers (of all pools) and top this pool back up."""
+        with tracing.span('pool_maintain'):
+            prune(self.docker_client)
+            self.warm()
+
+    def shutdown(self):
+        """Remove every container in the pool."""
+        for container in list_pool_containers(self.docker_client, self.key):
+            remove_container(self.docker_client, container['Id'])
+
+##############################################################################
+# Main
+##############################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and clean up the warm container pools')
+    parser.add_argument(
+        'action', choices=['list', 'prune', 'stop'],
+        help='list pool containers, prune the recycled/idle ones or stop them all'
+    )
+    args = parser.parse_args()
+    from .core import DependencyMissing, get_docker_client  # avoid the import cycle
+    try:
+        docker_client = get_docker_client()
+    except DependencyMissing as ex:
+        parser.error("DependencyMissing encountered: %s" % ex)
+    if args.action == 'list':
+        for container in list_pool_containers(docker_client):
+            labels = container.get('Labels') or {}
+            usage = _usage.get(container['Id']) or {}
+            idle = time.time() - usage.get('last_used', container.get('Created', time.time()))
+            print(console.cyan + container['Id'][:12] + console.reset + " pool " + console.yellow +
+                  labels.get(POOL_LABEL, '-') + console.reset + f" {container.get('State')}, " +
+                  f"{usage.get('uses', 0)} uses, idle {idle:.0f}s")
+    else:
+        for container_id in prune(docker_client, remove_all=(args.action == 'stop')):
+            print(console.green + "Removed " + console.cyan + container_id[:12] + console.reset)
@@ -0,0 +1,211 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Structured ``docker run`` options for the sdk runner.
+
+Extensions contribute :class:`RunOptions` via
+:meth:`~groot_rocker.core.RockerExtension.get_run_options`. Extensions that
+only implement ``get_docker_args()`` have their arguments parsed by
+:func:`parse_docker_args`, which understands the commonly used subset of the
+``docker run`` flags and raises :class:`UnsupportedRunOption` otherwise.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import shlex
+import typing
+
+import docker
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class UnsupportedRunOption(ValueError):
+    """A docker run flag the sdk runner has no equivalent for."""
+    pass
+
+
+class RunOptions(object):
+    """
+    Keyword arguments for the docker api's ``create_container()`` and
+    ``create_host_config()``, split accordingly.
+
+    Args:
+        container: create_container() keyword arguments, e.g. name, environment
+        host: create_host_config() keyword arguments, e.g. binds, devices, network_mode
+    """
+    def __init__(
+        self,
+        container: typing.Optional[typing.Dict[str, typing.Any]]=None,
+        host: typing.Optional[typing.Dict[str, typing.Any]]=None
+    ):
+        self.container = dict(container or {})
+        self.host = dict(host or {})
+
+    def merge(self, other: 'RunOptions') -> 'RunOptions':
+        """Merge in place, lists are concatenated, dicts updated and anything else replaced."""
+        for mine, theirs in [(self.container, other.container), (self.host, other.host)]:
+            for key, value in theirs.items():
+                if isinstance(value, list) and isinstance(mine.get(key), list):
+                    mine[key] = mine[key] + value
+                elif isinstance(value, dict) and isinstance(mine.get(key), dict):
+                    mine[key] = dict(mine[key], **value)
+                else:
+                    mine[key] = value
+        return self
+
+    def create_kwargs(
+        self,
+        docker_client,
+        image: str,
+        command: typing.Optional[typing.List[str]]=None,
+        tty: bool=False,
+        stdin_open: bool=False
+    ) -> typing.Dict[str, typing.Any]:
+        """The keyword arguments for ``docker_client.create_container()``."""
+        kwargs = dict(self.container)
+        kwargs['image'] = image
+        kwargs['command'] = command or None
+        kwargs['tty'] = tty
+        kwargs['stdin_open'] = stdin_open
+        kwargs['detach'] = not stdin_open
+        host = dict(self.host)
+        if 'binds' in host:
+            # -v /foo is an anonymous volume, not a bind
+            kwargs['volumes'] = [bind.split(':')[1] if ':' in bind else bind for bind in host['binds']]
+            host['binds'] = [bind for bind in host['binds'] if ':' in bind]
+        if 'port_bindings' in host:
+            kwargs['ports'] = list(host['port_bindings'].keys())
+        kwargs['host_config'] = docker_client.create_host_config(**host)
+        return kwargs
+
+    def __eq__(self, other):
+        return isinstance(other, RunOptions) and self.container == other.container and self.host == other.host
+
+    def __repr__(self):
+        return "RunOptions(container=%r, host=%r)" % (self.container, self.host)
+
+##############################################################################
+# Parsing
+##############################################################################
+
+
+def _environment(value: str) -> typing.List[str]:
+    if '=' in value:
+        return [value]
+    # as per the docker cli, a bare name is taken from the environment (if set)
+    return ['%s=%s' % (value, os.environ[value])] if value in os.environ else []
+
+
+def _environment_file(path: str) -> typing.List[str]:
+    environment = []
+    with open(path, 'r') as stream:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                environment.extend(_environment(line))
+    return environment
+
+
+def _publish(value: str) -> typing.Dict[str, typing.Any]:
+    parts = value.split(':')
+    container_port = parts[-1] if '/' in parts[-1] else parts[-1] + '/tcp'
+    if len(parts) == 1:
+        return {container_port: None}
+    if len(parts) == 2:
+        return {container_port: parts[0] or None}
+    return {container_port: (parts[0], int(parts[1])) if parts[1] else (parts[0],)}
+
+
+def _gpus(value: str) -> typing.List[typing.Any]:
+    if value.strip('"\'') != 'all' and not value.isdigit():
+        raise UnsupportedRunOption("--gpus %s" % value)
+    count = -1 if not value.isdigit() else int(value)
+    return [docker.types.DeviceRequest(count=count, capabilities=[['gpu']])]
+
+
+def _key_value(value: str, separator: str='=') -> typing.Dict[str, str]:
+    key, _, value = value.partition(separator)
+    return {key: value}
+
+
+# flag -> (which kwargs, key, converter of the value), a converter of None is a boolean flag
+_FLAGS = {
+    '--name': ('container', 'name', str),
+    '--hostname': ('container', 'hostname', str),
+    '-h': ('container', 'hostname', str),
+    '--user': ('container', 'user', str),
+    '-u': ('container', 'user', str),
+    '--workdir': ('container', 'working_dir', str),
+    '-w': ('container', 'working_dir', str),
+    '--entrypoint': ('container', 'entrypoint', shlex.split),
+    '--env': ('container', 'environment', _environment),
+    '-e': ('container', 'environment', _environment),
+    '--env-file': ('container', 'environment', _environment_file),
+    '--label': ('container', 'labels', _key_value),
+    '-l': ('container', 'labels', _key_value),
+    '--volume': ('host', 'binds', lambda v: [v]),
+    '-v': ('host', 'binds', lambda v: [v]),
+    '--device': ('host', 'devices', lambda v: [v]),
+    '--network': ('host', 'network_mode', str),
+    '--net': ('host', 'network_mode', str),
+    '--ipc': ('host', 'ipc_mode', str),
+    '--pid': ('host', 'pid_mode', str),
+    '--runtime': ('host', 'runtime', str),
+    '--shm-size': ('host', 'shm_size', str),
+    '--cap-add': ('host', 'cap_add', lambda v: [v]),
+    '--cap-drop': ('host', 'cap_drop', lambda v: [v]),
+    '--security-opt': ('host', 'security_opt', lambda v: [v]),
+    '--group-add': ('host', 'group_add', lambda v: [v]),
+    '--add-host': ('host', 'extra_hosts', lambda v: _key_value(v, ':')),
+    '--tmpfs': ('host', 'tmpfs', lambda v: _key_value(v, ':')),
+    '--publish': ('host', 'port_bindings', _publish),
+    '-p': ('host', 'port_bindings', _publish),
+    '--gpus': ('host', 'device_requests', _gpus),
+    '--privileged': ('host', 'privileged', None),
+    '--init': ('host', 'init', None),
+    '--read-only': ('host', 'read_only', None),
+}
+
+
+def parse_docker_args(docker_args: str) -> RunOptions:
+    """
+    Convert a string of ``docker run`` flags (as returned by ``get_docker_args()``) into run options.
+
+    Raises:
+        UnsupportedRunOption: for flags (or values) without a known equivalent
+    """
+    options = RunOptions()
+    tokens = shlex.split(docker_args)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        index += 1
+        flag, separator, value = token.partition('=') if token.startswith('--') else (token, '', '')
+        if flag not in _FLAGS:
+            raise UnsupportedRunOption(token)
+        target, key, converter = _FLAGS[flag]
+        if converter is None:
+            if separator and value not in ['true', 'True', '1']:
+                continue
+            converted = True
+        else:
+            if not separator:
+                if index >= len(tokens):
+                    raise UnsupportedRunOption("%s requires a value" % flag)
+                value = tokens[index]
+                index += 1
+            converted = converter(value)
+        options.merge(RunOptions(**{target: {key: converted}}))
+    return options
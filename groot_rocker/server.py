@@ -0,0 +1,234 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+A resident ``groot-rocker`` (``groot-rocker serve``) that keeps the
+extensions, docker client and caches warm.
+
+Each request from a :mod:`groot_rocker.client` is handled in a forked
+child (its own process group) that adopts the client's terminal, working
+directory and environment, so requests are isolated from each other and
+from the server, yet skip python startup, imports, plugin discovery and
+the connection handshake with the docker daemon.
+
+Restart the server after installing or updating extensions.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import argparse
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+import typing
+
+import docker
+
+from . import cli
+from . import client
+from . import console
+from . import core
+from . import plugins
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+def receive_request(connection: socket.socket) -> typing.Tuple[typing.Dict[str, typing.Any], typing.List[int]]:
+    """Receive a (length prefixed json) request and the file descriptors attached to it."""
+    fds = array.array('i')
+    header, ancillary, unused_flags, unused_address = connection.recvmsg(
+        4, socket.CMSG_SPACE(3 * fds.itemsize)
+    )
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    if len(header) < 4:
+        header += _receive_exactly(connection, 4 - len(header))
+    length, = struct.unpack('!I', header)
+    return json.loads(_receive_exactly(connection, length)), list(fds)
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed mid request")
+        data += chunk
+    return data
+
+
+class Server(object):
+    """
+    Args:
+        path: path of the unix socket to listen on
+    """
+    def __init__(self, path: typing.Optional[str]=None):
+        self.path = path or client.default_socket_path()
+        self.docker_client = None
+        self.listener = None
+
+    def warm(self):
+        """Import the extensions, build the plugin index and connect to the daemon."""
+        registry = plugins.get_registry()
+        registry.load_all()
+        registry.index
+        try:
+            self.docker_client = core.get_docker_client()
+        except core.DependencyMissing as ex:
+            console.warning("docker is not available yet, requests will connect themselves [%s]" % ex)
+
+    def listen(self):
+        if client.connect(self.path) is not None:
+            raise RuntimeError("a server is already listening on %s" % self.path)
+        try:
+            os.unlink(self.path)  # stale
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)  # created private, not chmod'ed after the fact
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.listener.listen(64)
+
+    def serve_forever(self):
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # reap the request handlers automatically
+        try:
+            while True:
+                connection, unused_address = self.listener.accept()
+                if not client.is_same_user(connection):
+                    console.warning("refused a request from uid %s" % client.peer_uid(connection))
+                    connection.close()
+                    continue
+                try:
+                    request, fds = receive_request(connection)
+                except (OSError, ValueError) as ex:
+                    console.warning("dropped a malformed request [%s]" % ex)
+                    connection.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    self.listener.close()
+                    self.handle(connection, request, fds)  # never returns
+                for fd in fds:
+                    os.close(fd)
+                connection.close()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def handle(self, connection: socket.socket, request: typing.Dict[str, typing.Any], fds: typing.List[int]):
+        """Run a request in the (forked) child and report the exit code, this never returns."""
+        exit_code = 1
+        try:
+            # A new session (and process group, for the client's killpg), without the server's controlling
+            # terminal. Just a new process group would be a background group of that terminal (e.g. after
+            # 'groot-rocker serve &') and putting the client's terminal in raw mode would stop it with SIGTTOU.
+            os.setsid()
+            for signal_number in [signal.SIGCHLD, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT, signal.SIGWINCH]:
+                signal.signal(signal_number, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            connection.sendall(client.MESSAGE.pack(client.MESSAGE_PID, os.getpid()))
+            self.adopt(request, fds)
+            exit_code = self.run(request['argv'])
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                connection.sendall(client.MESSAGE.pack(client.MESSAGE_EXIT, exit_code))
+            except BaseException:
+                pass
+            os._exit(0)
+
+    def adopt(self, request: typing.Dict[str, typing.Any], fds: typing.List[int]):
+        """Take over the client's terminal, working directory, environment and docker connection."""
+        for target, fd in zip([0, 1, 2], fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', buffering=1 if os.isatty(1) else -1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+        sys.__stdin__, sys.__stdout__, sys.__stderr__ = sys.stdin, sys.stdout, sys.stderr
+        os.chdir(request['cwd'])
+        docker_host = os.environ.get('DOCKER_HOST')
+        os.environ.clear()
+        os.environ.update(request['env'])
+        if self.docker_client is not None and os.environ.get('DOCKER_HOST') == docker_host:
+            # The pooled connections mustn't be shared with the parent, but the daemon
+            # is known to be up and the api version negotiated, so skip the handshake.
+            core.set_docker_client(docker.APIClient(
+                version=self.docker_client.api_version,
+                timeout=self.docker_client.timeout,
+                max_pool_size=core.DOCKER_CLIENT_POOL_SIZE,
+                **docker.utils.kwargs_from_env(environment=os.environ)
+            ))
+
+    def run(self, argv: typing.List[str]) -> int:
+        sys.argv = ['groot-rocker'] + argv
+        try:
+            cli.main()
+        except SystemExit as ex:
+            if ex.code is None:
+                return 0
+            if isinstance(ex.code, int):
+                return ex.code
+            print(ex.code, file=sys.stderr)
+            return 1
+        return 0
+
+##############################################################################
+# Main
+##############################################################################
+
+
+def main(argv: typing.Optional[typing.List[str]]=None):
+    parser = argparse.ArgumentParser(
+        prog='groot-rocker serve',
+        description='Serve groot-rocker requests from a resident process, keeping extensions, the docker client and caches warm'
+    )
+    parser.add_argument(
+        '--socket', type=str, metavar="PATH", default=None,
+        help="unix socket to listen on (default: %s)" % (client.default_socket_path() or '$GROOT_ROCKER_SOCKET')
+    )
+    args = parser.parse_args(argv)
+    server = Server(args.socket)
+    if server.path is None:
+        parser.error("$XDG_RUNTIME_DIR is not set, choose a private socket with --socket or $GROOT_ROCKER_SOCKET")
+    server.warm()
+    try:
+        server.listen()
+    except (OSError, RuntimeError) as ex:
+        parser.error(str(ex))
+    print(console.green + "Serving on " + console.yellow + server.path + console.reset)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,276 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+A reusable, in-process session for launching many containers.
+
+.. code-block:: python
+
+   session = Session()
+   for index in range(5000):
+       plan = session.plan('job.yaml', container_name='job%d' % index)
+       if session.build(plan) == 0:
+           session.run(plan)
+
+A session holds everything that :func:`groot_rocker.cli.build_and_run` would
+otherwise redo on each call: the extension registry, a docker client (and
+its connection pool), parsed configurations (reparsed only when the file
+changes), plans (keyed by their options) and the images already built for
+an image key. Options are read-only mappings, each call gets its own.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import collections
+import json
+import os
+import threading
+import types
+import typing
+
+from . import cli
+from . import core
+from . import tracing
+
+##############################################################################
+# Constants
+##############################################################################
+
+MAX_TEMPLATES = 64
+MAX_PLANS = 256
+# Options that only affect how (not what) an image is built
+BUILD_OPTIONS = frozenset(['nocache', 'pull', 'image_name', 'buildkit', 'cache_dir'])
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class Plan(object):
+    """
+    The (read-only) options, active extensions and image generator for one configuration.
+
+    Args:
+        options: as per :func:`groot_rocker.cli.load_arguments`
+        active_extensions: in dependency order
+        generator: generates (and builds) the image
+    """
+    def __init__(
+        self,
+        options: typing.Mapping[str, typing.Any],
+        active_extensions: typing.List[core.RockerExtension],
+        generator: core.DockerImageGenerator
+    ):
+        self.options = options
+        self.active_extensions = active_extensions
+        self.generator = generator
+        self.lock = threading.Lock()  # the generator is stateful (built image, image name)
+
+    @property
+    def image_key(self) -> str:
+        return self.generator.get_image_key()
+
+    def __repr__(self):
+        return "Plan(image=%r, extensions=%r)" % (self.options.get('image'), [e.get_name() for e in self.active_extensions])
+
+
+class _LRU(object):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class Session(object):
+    """
+    Plan, build and run many configurations in one process, see the module documentation.
+    Safe to share between threads.
+
+    Args:
+        docker_client: default: the process wide client (:func:`groot_rocker.core.get_docker_client`)
+        verbose: print the build and run banners, as the cli does
+    """
+    def __init__(self, docker_client=None, verbose: bool=False):
+        self.extension_manager = core.RockerExtensionManager()
+        self.verbose = verbose
+        self._docker_client = docker_client
+        self._templates = _LRU(MAX_TEMPLATES)  # (path, mtime, size, args) -> options
+        self._plans = _LRU(MAX_PLANS)  # options (as json) -> plan
+        self._images = {}  # image key -> image id
+        self._lock = threading.RLock()
+
+    @property
+    def docker_client(self):
+        if self._docker_client is None:
+            self._docker_client = core.get_docker_client()
+        return self._docker_client
+
+    @property
+    def registry(self):
+        return self.extension_manager.registry
+
+    def options(
+        self,
+        config: typing.Optional[str]=None,
+        args: typing.Sequence[str]=(),
+        **overrides
+    ) -> typing.Mapping[str, typing.Any]:
+        """
+        Options for a yaml configuration (and/or command line arguments), as per
+        ``groot-rocker -c config args...``, updated with the overrides (e.g. ``network='host'``).
+        Parsing is cached until the configuration file changes.
+
+        Returns:
+            a read-only mapping
+        """
+        key = (tuple(args),)
+        if config is not None:
+            config = os.path.abspath(config)
+            status = os.stat(config)
+            key = (config, status.st_mtime_ns, status.st_size) + key
+        with self._lock:
+            template = self._templates.get(key)
+        if template is None:
+            with tracing.span('load_arguments'):
+                template = types.MappingProxyType(cli.load_arguments((['-c', config] if config else []) + list(args)))
+            with self._lock:
+                self._templates.set(key, template)
+        if not overrides:
+            return template
+        unknown = set(overrides) - set(template)
+        if unknown:
+            raise TypeError("unknown options %s" % sorted(unknown))
+        return types.MappingProxyType(dict(template, **overrides))
+
+    def plan(
+        self,
+        config: typing.Union[str, typing.Mapping[str, typing.Any], None]=None,
+        args: typing.Sequence[str]=(),
+        **overrides
+    ) -> Plan:
+        """
+        Resolve the active extensions and generate the image for a configuration. Plans are cached
+        by their options, i.e. planning the same configuration again is (almost) free.
+
+        Args:
+            config: a yaml configuration or options (e.g. from :meth:`options`)
+            args: command line arguments (with a yaml configuration)
+            overrides: options to replace
+
+        Raises:
+            RequiredExtensionMissingError: if an active extension requires an inactive one
+        """
+        if config is None or isinstance(config, str):
+            options = self.options(config, args, **overrides)
+        else:
+            unknown = set(overrides) - set(config)
+            if unknown:
+                raise TypeError("unknown options %s" % sorted(unknown))
+            options = types.MappingProxyType(dict(config, **overrides))
+        key = json.dumps(dict(options), sort_keys=True, default=str)
+        with self._lock:
+            plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        with tracing.span('get_active_extensions'):
+            active_extensions = self.extension_manager.get_active_extensions(options)
+        generator = core.DockerImageGenerator(active_extensions, options, options['image'], docker_client=self.docker_client)
+        plan = Plan(options, active_extensions, generator)
+        with self._lock:
+            self._plans.set(key, plan)
+        return plan
+
+    def build(self, plan: Plan, **overrides) -> int:
+        """
+        Build the image for a plan, once per image key for the life of the session
+        (see :meth:`forget_images` if images are removed behind its back).
+
+        Args:
+            overrides: build options to replace (see :data:`BUILD_OPTIONS`), e.g. ``nocache=True``
+
+        Returns:
+            0 on success, as per :meth:`groot_rocker.core.DockerImageGenerator.build`
+
+        Raises:
+            TypeError: for any other override, plan with it instead
+        """
+        unknown = set(overrides) - BUILD_OPTIONS
+        if unknown:
+            raise TypeError("%s are not build options, plan with them instead" % sorted(unknown))
+        options = dict(plan.options, **overrides)
+        with plan.lock:
+            image_key = plan.image_key
+            with self._lock:
+                image_id = None if options.get('nocache') or options.get('pull') else self._images.get(image_key)
+            if image_id is not None:
+                if plan.generator.image_id != image_id or not plan.generator.built:
+                    plan.generator.use_image(image_id, options.get('image_name'))
+                return 0
+            with tracing.span('build'):
+                exit_code = plan.generator.build(verbose=self.verbose, **options)
+            if exit_code == 0:
+                with self._lock:
+                    self._images[image_key] = plan.generator.image_id
+            return exit_code
+
+    def run(self, plan: Plan, command: typing.Optional[str]=None, **overrides) -> int:
+        """
+        Run a built plan, as per :meth:`groot_rocker.core.DockerImageGenerator.run`.
+
+        Args:
+            command: default: the plan's command
+            overrides: options to replace, e.g. ``mode='non-interactive', network='host'``, the
+                plan for them is looked up (and built if necessary) first
+
+        Returns:
+            the exit code
+        """
+        if overrides:
+            # extension arguments come from the plan's generator, not the run options
+            plan = self.plan(plan.options, **overrides)
+            if not plan.generator.built:
+                exit_code = self.build(plan)
+                if exit_code != 0:
+                    return exit_code
+        options = dict(plan.options)
+        if command is not None:
+            options['command'] = command
+        with tracing.span('run'):
+            return plan.generator.run(**options)
+
+    def launch(self, config=None, args: typing.Sequence[str]=(), **overrides) -> int:
+        """Plan, build and run, the equivalent of :func:`groot_rocker.cli.build_and_run`."""
+        plan = self.plan(config, args, **overrides)
+        exit_code = self.build(plan)
+        if exit_code != 0:
+            return exit_code
+        return self.run(plan)
+
+    def forget_images(self):
+        with self._lock:
+            self._images.clear()
+
+    def clear(self):
+        """Drop all cached configurations, plans and images."""
+        with self._lock:
+            self._templates = _LRU(MAX_TEMPLATES)
+            self._plans = _LRU(MAX_PLANS)
+            self._images.clear()
@@ -0,0 +1,143 @@
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+##############################################################################
+# Documentation
+##############################################################################
+
+"""
+Lightweight, opt-in timing of the phases of an invocation.
+
+Spans are recorded as chrome trace events (load the output in
+``chrome://tracing`` or https://ui.perfetto.dev). When tracing is not
+enabled, :func:`span` is a no-op.
+
+.. code-block:: python
+
+   with tracing.span('generate_dockerfile'):
+       ...
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+
+from . import console
+
+##############################################################################
+# Classes
+##############################################################################
+
+
+class Tracer(object):
+    """Collects complete ('X') trace events, thread safe."""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float, category: str='groot_rocker', **args):
+        """Record a span from perf_counter() start and end times."""
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = {k: str(v) for k, v in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str='groot_rocker', **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), category, **args)
+
+    def write(self, path: str):
+        with open(path, 'w') as fh:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, fh)
+
+    def summary(self) -> typing.List[typing.Tuple[str, int, float, float]]:
+        """(name, count, total ms, max ms) for each span name, slowest first."""
+        totals = {}
+        for event in self.events:
+            count, total, maximum = totals.get(event['name'], (0, 0.0, 0.0))
+            duration = event['dur'] / 1000.0
+            totals[event['name']] = (count + 1, total + duration, max(maximum, duration))
+        return sorted(
+            [(name, count, total, maximum) for name, (count, total, maximum) in totals.items()],
+            key=lambda row: row[2], reverse=True
+        )
+
+    def print_summary(self):
+        console.banner("Trace Summary")
+        rows = self.summary()
+        width = max([len(row[0]) for row in rows] + [4])
+        print(console.cyan + "name".ljust(width) + "  count   total (ms)     max (ms)" + console.reset)
+        for name, count, total, maximum in rows:
+            print(console.green + name.ljust(width) + console.reset + console.yellow +
+                  f"  {count:5d} {total:12.2f} {maximum:12.2f}" + console.reset)
+
+##############################################################################
+# Methods
+##############################################################################
+
+
+_tracer = None
+
+
+def enable() -> Tracer:
+    """Start tracing (for the remainder of the process)."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> typing.Optional[Tracer]:
+    """Stop tracing, returning the tracer (if any) with the events recorded so far."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer() -> typing.Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, category: str='groot_rocker', **args):
+    """Context manager that times the enclosed block if tracing is enabled."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, category, **args)
+
+
+def record(name: str, start: float, end: float, category: str='groot_rocker', **args):
+    """Record a span measured with time.perf_counter(), if tracing is enabled."""
+    if _tracer is not None:
+        _tracer.record(name, start, end, category, **args)
+
+
+def finish(path: str):
+    """Stop tracing, write the trace to path and print a summary."""
+    tracer = disable()
+    if tracer is None:
+        return
+    tracer.write(path)
+    tracer.print_summary()
+    print(console.green + "Trace written to " + console.yellow + path + console.reset)
@@ -14,11 +14,11 @@ Versioning information.
 # Imports
 ##############################################################################
 
-import pkg_resources
+import importlib.metadata
 
 ##############################################################################
 # Version
 ##############################################################################
 
 # When changing, also update setup.py
-__version__ = pkg_resources.require('groot_rocker')[0].version
+__version__ = importlib.metadata.version('groot_rocker')
@@ -44,7 +44,9 @@ kwargs = {
     'package_data': {'groot_rocker': ['templates/*.em']},
     'entry_points': {
         'console_scripts': [
-            'groot-rocker = groot_rocker.cli:main',
+            'groot-rocker = groot_rocker.client:main',
+            'groot-rocker-batch = groot_rocker.batch:main',
+            'groot-rocker-pool = groot_rocker.pool:main',
             'detect_docker_image_os = groot_rocker.cli:detect_image_os'
         ],
         'groot_rocker.extensions': [
@@ -66,7 +68,7 @@ kwargs = {
     'description': 'A tool to run docker containers with customized extras',
     'long_description': 'A tool to run docker containers with customized extra added like git gui support overlayed.',
     'license': 'Apache License 2.0',
-    'python_requires': '>=3.0',
+    'python_requires': '>=3.8',
 
     'install_requires': install_requires,
     'extras_require':  extras_require,
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+"""
+A stand-in for the docker engine api, served on a local unix socket.
+
+It answers just enough of the api (ping, version, networks, images,
+builds, containers and archives) for groot_rocker to exercise its docker
+code paths hermetically, with configurable latencies per endpoint.
+
+.. code-block:: python
+
+   with FakeDockerDaemon(latencies={'build': 0.1}) as daemon:
+       docker_client = daemon.client()
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import base64
+import hashlib
+import http.server
+import io
+import itertools
+import json
+import os
+import re
+import socketserver
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import docker
+
+##############################################################################
+# Server
+##############################################################################
+
+API_VERSION = '1.41'
+
+OS_RELEASE = """NAME="Ubuntu"
+VERSION="18.04.5 LTS (Bionic Beaver)"
+ID=ubuntu
+VERSION_ID="18.04"
+VERSION_CODENAME=bionic
+"""
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 512  # bursts of concurrent connections, e.g. from the asyncio api
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+    def _dispatch(self, method):
+        url = urllib.parse.urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        body = self._read_body()
+        fake = self.server.fake
+        fake.requests.append((method, path))
+        for pattern, endpoint, handler in fake.routes:
+            if pattern[0] != method:
+                continue
+            match = re.fullmatch(pattern[1], path)
+            if match:
+                time.sleep(fake.latencies.get(endpoint, 0.0))
+                handler(self, query, body, *match.groups())
+                return
+        self.send_json({'message': 'page not found: %s %s' % (method, path)}, status=404)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_data(self, data, content_type='application/json', status=200, headers={}):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def send_json(self, obj, status=200):
+        self.send_data(json.dumps(obj).encode(), status=status)
+
+    def send_hijacked(self, output, echo=False, ready=None):
+        """Upgrade to a raw stream (as per attach and exec), write the output and optionally echo the input until it closes."""
+        self.send_response(101)
+        self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Upgrade', 'tcp')
+        self.end_headers()
+        # docker-py reads the hijacked stream from the raw socket, anything that
+        # arrives with the headers is lost in http.client's buffer
+        time.sleep(0.002)
+        if ready is not None:
+            ready.wait(10.0)
+        self.wfile.write(output)
+        while echo:
+            data = self.rfile.read1(65536)
+            if not data:
+                break
+            self.wfile.write(data)
+        self.close_connection = True
+
+    def send_stream(self, chunks, content_type='application/json', delay=0.0, gate=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                if delay:
+                    time.sleep(delay)
+                if gate is not None:
+                    gate()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client went away, e.g. a cancelled build
+
+
+class FakeDockerDaemon(object):
+    """
+    Args:
+        latencies: seconds to delay each endpoint by, keyed by endpoint name
+            (ping, version, networks, images, inspect_image, tag, build, build_step,
+            pull, create, start, wait, logs, attach, resize, remove, archive, containers,
+            exec_create, exec_start, exec_inspect)
+        files: contents of files in every image, e.g. for the archive api
+
+    Tests can also block endpoints with gates, callables run before serving each
+    step of an endpoint (build_step), e.g. waiting on an event.
+    """
+    def __init__(self, latencies={}, files={'/etc/os-release': OS_RELEASE}):
+        self.latencies = dict(latencies)
+        self.gates = {}
+        self.files = dict(files)
+        self.images = {}  # name or id -> {'Id': ..., 'Labels': ..., 'RepoTags': ...}
+        self.containers = {}
+        self.networks = ['bridge', 'host', 'none']
+        self.requests = []
+        self.exit_codes = {}  # command -> exit code
+        self.outputs = {}  # command -> output (bytes), else 'output of <command>'
+        self._ids = itertools.count(1)
+        self._directory = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self._directory.name, 'docker.sock')
+        self.base_url = 'unix://' + self.socket
+        self.routes = [
+            (('GET', r'/_ping'), 'ping', lambda h, q, b: h.send_data(b'OK', 'text/plain', headers={'API-Version': API_VERSION})),
+            (('HEAD', r'/_ping'), 'ping', lambda h, q, b: h.send_data(b'', 'text/plain', headers={'API-Version': API_VERSION})),
+            (('GET', r'/version'), 'version', lambda h, q, b: h.send_json({'ApiVersion': API_VERSION, 'Version': '20.10.0'})),
+            (('GET', r'/networks'), 'networks', lambda h, q, b: h.send_json([{'Name': n} for n in self.networks])),
+            (('GET', r'/images/json'), 'images', self._images),
+            (('POST', r'/images/create'), 'pull', self._pull),
+            (('GET', r'/images/(.+)/json'), 'inspect_image', self._inspect_image),
+            (('POST', r'/images/(.+)/tag'), 'tag', self._tag),
+            (('POST', r'/build'), 'build', self._build),
+            (('POST', r'/containers/create'), 'create', self._create),
+            (('GET', r'/containers/json'), 'containers', self._containers),
+            (('GET', r'/containers/([^/]+)/json'), 'inspect_container', self._inspect_container),
+            (('POST', r'/containers/([^/]+)/start'), 'start', self._start),
+            (('POST', r'/containers/([^/]+)/wait'), 'wait', self._wait),
+            (('GET', r'/containers/([^/]+)/logs'), 'logs', self._logs),
+            (('POST', r'/containers/([^/]+)/attach'), 'attach', self._attach),
+            (('POST', r'/containers/([^/]+)/resize'), 'resize', self._resize),
+            (('GET', r'/containers/([^/]+)/archive'), 'archive', self._archive),
+            (('HEAD', r'/containers/([^/]+)/archive'), 'archive', self._archive),
+            (('PUT', r'/containers/([^/]+)/archive'), 'put_archive', self._put_archive),
+            (('DELETE', r'/containers/([^/]+)'), 'remove', self._remove),
+            (('POST', r'/containers/([^/]+)/exec'), 'exec_create', self._exec_create),
+            (('POST', r'/exec/([^/]+)/start'), 'exec_start', self._exec_start),
+            (('GET', r'/exec/([^/]+)/json'), 'exec_inspect', self._exec_inspect),
+            (('POST', r'/exec/([^/]+)/resize'), 'resize', self._exec_resize),
+        ]
+        self.execs = {}
+        self.uploads = {}  # container id -> {path: (mode, contents)} copied in via the archive api
+        self._started = {}  # container id -> threading.Event
+        self.add_image('ubuntu:18.04')
+        self.add_image('ubuntu:bionic')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._server = _Server(self.socket, _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._directory.cleanup()
+
+    def client(self, **kwargs):
+        """A low level docker api client connected to this daemon."""
+        return docker.APIClient(base_url=self.base_url, version=API_VERSION, **kwargs)
+
+    def environment(self):
+        """Environment variables directing docker clients (and the cli) to this daemon."""
+        environment = dict(os.environ)
+        environment['DOCKER_HOST'] = self.base_url
+        return environment
+
+    def add_image(self, name, labels={}, entrypoint=None):
+        image_id = 'sha256:' + hashlib.sha256(('%s%s' % (name, next(self._ids))).encode()).hexdigest()
+        image = {'Id': image_id, 'Labels': dict(labels), 'RepoTags': [name] if name else [], 'Entrypoint': entrypoint}
+        self.images[image_id] = image
+        if name:
+            self.images[name] = image
+        return image_id
+
+    def add_container(self, image, labels={}, running=True, name=''):
+        """Create a container directly, e.g. a pool container started with the docker cli."""
+        container_id = hashlib.sha256(('container%d' % next(self._ids)).encode()).hexdigest()
+        self.containers[container_id] = {
+            'Id': container_id, 'Name': name, 'Image': self._find_image(image)['Id'], 'Created': int(time.time()),
+            'Config': {'Image': image, 'Labels': dict(labels)},
+            'State': {'Status': 'running' if running else 'exited', 'Running': running, 'ExitCode': 0}
+        }
+        return container_id
+
+    def output(self, command):
+        return self.outputs.get(command, ('output of %s\n' % command).encode())
+
+    def count(self, method, path_pattern):
+        """Number of requests received for a method and path (regex)."""
+        return len([r for r in self.requests if r[0] == method and re.fullmatch(path_pattern, r[1])])
+
+    # Images
+
+    def _find_image(self, name):
+        if name in self.images:
+            return self.images[name]
+        if ':' not in name and name + ':latest' in self.images:
+            return self.images[name + ':latest']
+        for image in self.images.values():
+            if image['Id'].startswith(name) or image['Id'][len('sha256:'):].startswith(name):
+                return image
+        return None
+
+    def _images(self, handler, query, body):
+        filters = json.loads(query.get('filters', '{}'))
+        labels = filters.get('label', [])
+        if isinstance(labels, dict):
+            labels = list(labels.keys())
+        images = {image['Id']: image for image in self.images.values()}.values()
+        results = []
+        for image in images:
+            if all(image['Labels'].get(l.split('=', 1)[0]) == l.split('=', 1)[-1] for l in labels):
+                results.append({'Id': image['Id'], 'RepoTags': image['RepoTags'], 'Labels': image['Labels']})
+        handler.send_json(results)
+
+    def _inspect_image(self, handler, query, body, name):
+        image = self._find_image(urllib.parse.unquote(name))
+        if image is None:
+            handler.send_json({'message': 'No such image: %s' % name}, status=404)
+        else:
+            handler.send_json({'Id': image['Id'], 'RepoTags': image['RepoTags'], 'Config': {
+                'Labels': image['Labels'], 'Entrypoint': image.get('Entrypoint'), 'Cmd': ['bash']
+            }})
+
+    def _tag(self, handler, query, body, name):
+        image = self._find_image(urllib.parse.unquote(name))
+        if image is None:
+            handler.send_json({'message': 'No such image: %s' % name}, status=404)
+            return
+        tag = '%s:%s' % (query['repo'], query.get('tag') or 'latest')
+        image['RepoTags'].append(tag)
+        self.images[tag] = image
+        handler.send_data(b'', status=201)
+
+    def _pull(self, handler, query, body):
+        name = '%s:%s' % (query['fromImage'], query.get('tag') or 'latest')
+        if 'does_not_exist' in name or name.startswith('scratch'):
+            handler.send_json({'message': 'manifest for %s not found' % name}, status=404)
+            return
+        if self._find_image(name) is None:
+            self.add_image(name)
+        handler.send_stream([json.dumps({'status': 'Pulling from %s' % name}).encode() + b'\r\n'])
+
+    def _build(self, handler, query, body):
+        with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+            dockerfile = archive.extractfile(query.get('dockerfile') or 'Dockerfile').read().decode()
+        instructions = [l for l in dockerfile.splitlines() if l.strip() and not l.strip().startswith('#')]
+        stream = []
+        for index, instruction in enumerate(instructions):
+            stream.append({'stream': 'Step %d/%d : %s\n' % (index + 1, len(instructions), instruction)})
+            if instruction.startswith('RUN'):
+                command = instruction[len('RUN'):].strip()
+                stream.append({'stream': ' ---> Running in %012x\n' % index})
+                stream.append({'stream': 'output of %s\n' % instruction})
+                if self.exit_codes.get(command):  # the build fails
+                    message = "The command '/bin/sh -c %s' returned a non-zero code: %d" % (command, self.exit_codes[command])
+                    stream.append({'errorDetail': {'code': self.exit_codes[command], 'message': message}, 'error': message})
+                    break
+                stream.append({'stream': 'Removing intermediate container %012x\n' % index})
+            stream.append({'stream': ' ---> %012x\n' % (index + 1)})
+        else:
+            image_id = self.add_image(None, json.loads(query.get('labels', '{}')))
+            stream.append({'aux': {'ID': image_id}})
+            stream.append({'stream': 'Successfully built %s\n' % image_id[len('sha256:'):len('sha256:') + 12]})
+            if query.get('t'):
+                self.images[query['t']] = self.images[image_id]
+                self.images[image_id]['RepoTags'].append(query['t'])
+                stream.append({'stream': 'Successfully tagged %s\n' % query['t']})
+        handler.send_stream(
+            [json.dumps(line).encode() + b'\r\n' for line in stream],
+            delay=self.latencies.get('build_step', 0.0), gate=self.gates.get('build_step')
+        )
+
+    # Containers
+
+    def _create(self, handler, query, body):
+        config = json.loads(body or b'{}')
+        image = self._find_image(config.get('Image', ''))
+        if image is None:
+            handler.send_json({'message': 'No such image: %s' % config.get('Image')}, status=404)
+            return
+        if query.get('name') and any(c['Name'] == query['name'] for c in self.containers.values()):
+            handler.send_json({'message': 'Conflict. The container name "/%s" is already in use' % query['name']}, status=409)
+            return
+        container_id = hashlib.sha256(('container%d' % next(self._ids)).encode()).hexdigest()
+        self.containers[container_id] = {
+            'Id': container_id, 'Name': query.get('name', ''), 'Image': image['Id'], 'Config': config,
+            'Created': int(time.time()),
+            'State': {'Status': 'created', 'Running': False, 'ExitCode': 0}
+        }
+        handler.send_json({'Id': container_id, 'Warnings': []}, status=201)
+
+    def _command(self, container):
+        config = container['Config']
+        return ' '.join((config.get('Entrypoint') or []) + (config.get('Cmd') or []))
+
+    def _find_container(self, handler, name):
+        for container in self.containers.values():
+            if container['Id'].startswith(name) or container['Name'] == name:
+                return container
+        handler.send_json({'message': 'No such container: %s' % name}, status=404)
+        return None
+
+    def _containers(self, handler, query, body):
+        filters = json.loads(query.get('filters', '{}'))
+        labels = filters.get('label', [])
+        if isinstance(labels, dict):
+            labels = list(labels.keys())
+
+        def matches(container):
+            container_labels = container['Config'].get('Labels') or {}
+            for label in labels:
+                key, _, value = label.partition('=')
+                if key not in container_labels or ('=' in label and container_labels[key] != value):
+                    return False
+            return query.get('all') in ['1', 'true', 'True'] or container['State']['Running']
+
+        handler.send_json([
+            {'Id': c['Id'], 'Names': ['/' + c['Name']], 'Image': c['Image'], 'State': c['State']['Status'],
+             'Created': c['Created'], 'Labels': c['Config'].get('Labels') or {}}
+            for c in list(self.containers.values()) if matches(c)
+        ])
+
+    def _inspect_container(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            handler.send_json(container)
+
+    def _start(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            command = self._command(container)
+            container['State'] = {'Status': 'exited', 'Running': False, 'ExitCode': self.exit_codes.get(command, 0)}
+            self._started.setdefault(container['Id'], threading.Event()).set()
+            handler.send_data(b'', status=204)
+
+    def _wait(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            handler.send_json({'StatusCode': container['State']['ExitCode']})
+
+    def _logs(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            output = self.output(self._command(container))
+            if container['Config'].get('Tty'):
+                handler.send_data(output, 'application/vnd.docker.raw-stream')
+            else:
+                frame = bytes([1, 0, 0, 0]) + len(output).to_bytes(4, 'big') + output
+                handler.send_data(frame, 'application/vnd.docker.multiplexed-stream')
+
+    def _attach(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            # output only once started (typically attached beforehand), input is echoed as per a tty
+            output = self.output(self._command(container))
+            if not container['Config'].get('Tty'):
+                output = bytes([1, 0, 0, 0]) + len(output).to_bytes(4, 'big') + output
+            handler.send_hijacked(
+                output,
+                echo=query.get('stdin') in ['1', 'true', 'True'] and container['Config'].get('OpenStdin'),
+                ready=self._started.setdefault(container['Id'], threading.Event())
+            )
+
+    def _resize(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            container['Size'] = [int(query['h']), int(query['w'])]
+            handler.send_data(b'', 'text/plain')
+
+    def _archive(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is None:
+            return
+        path = query.get('path', '')
+        if path not in self.files:
+            handler.send_json({'message': 'Could not find the file %s in container %s' % (path, name)}, status=404)
+            return
+        data = self.files[path].encode()
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            info = tarfile.TarInfo(os.path.basename(path))
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        stat = base64.b64encode(json.dumps({'name': os.path.basename(path), 'size': len(data), 'mode': 420, 'linkTarget': ''}).encode())
+        handler.send_data(archive.getvalue(), 'application/x-tar', headers={'X-Docker-Container-Path-Stat': stat.decode()})
+
+    def _put_archive(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            uploads = self.uploads.setdefault(container['Id'], {})
+            with tarfile.open(fileobj=io.BytesIO(body)) as archive:
+                for member in archive.getmembers():
+                    path = os.path.normpath(os.path.join(query.get('path', '/'), member.name))
+                    uploads[path] = (member.mode, archive.extractfile(member).read() if member.isfile() else None)
+            handler.send_data(b'', 'text/plain')
+
+    def _exec_create(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is None:
+            return
+        if not container['State']['Running']:
+            handler.send_json({'message': 'Container %s is not running' % name}, status=409)
+            return
+        exec_id = '%064x' % next(self._ids)
+        self.execs[exec_id] = {'Config': json.loads(body or b'{}'), 'Container': container['Id'], 'ExitCode': None}
+        handler.send_json({'Id': exec_id}, status=201)
+
+    def _exec_start(self, handler, query, body, exec_id):
+        if exec_id not in self.execs:
+            handler.send_json({'message': 'No such exec instance: %s' % exec_id}, status=404)
+            return
+        instance = self.execs[exec_id]
+        command = ' '.join(instance['Config'].get('Cmd') or [])
+        instance['ExitCode'] = self.exit_codes.get(command, 0)
+        output = self.output(command)
+        if not instance['Config'].get('Tty'):
+            output = bytes([1, 0, 0, 0]) + len(output).to_bytes(4, 'big') + output
+        handler.send_hijacked(output, echo=instance['Config'].get('AttachStdin'))
+
+    def _exec_resize(self, handler, query, body, exec_id):
+        if exec_id not in self.execs:
+            handler.send_json({'message': 'No such exec instance: %s' % exec_id}, status=404)
+            return
+        self.execs[exec_id]['Size'] = [int(query['h']), int(query['w'])]
+        handler.send_data(b'', 'text/plain')
+
+    def _exec_inspect(self, handler, query, body, exec_id):
+        if exec_id not in self.execs:
+            handler.send_json({'message': 'No such exec instance: %s' % exec_id}, status=404)
+            return
+        instance = self.execs[exec_id]
+        handler.send_json({'ID': exec_id, 'Running': False, 'ExitCode': instance['ExitCode'], 'ContainerID': instance['Container']})
+
+    def _remove(self, handler, query, body, name):
+        container = self._find_container(handler, name)
+        if container is not None:
+            del self.containers[container['Id']]
+            handler.send_data(b'', status=204)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import asyncio
+import io
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import docker
+
+from groot_rocker import aio
+from groot_rocker import cli
+from groot_rocker import os_detector
+from groot_rocker import pool
+from groot_rocker.cache import PersistentLRUCache
+from groot_rocker.core import set_docker_client
+from groot_rocker.run_options import parse_docker_args
+
+from . import fake_docker
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class AsyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        set_docker_client(self.daemon.client())
+
+    def tearDown(self):
+        set_docker_client(None)
+        self.daemon.stop()
+
+    def run_async(self, coroutine_function):
+        async def wrapper():
+            async with aio.AsyncDockerClient(self.daemon.base_url) as client:
+                return await coroutine_function(client)
+        return asyncio.run(wrapper())
+
+    def test_run_image(self):
+        self.daemon.outputs['make'] = b''.join(b'line %d\n' % i for i in range(50))
+        self.daemon.exit_codes['make'] = 2
+        output = io.BytesIO()
+
+        async def run(client):
+            self.assertTrue(await client.ping())
+            return await aio.run_image(
+                'ubuntu:18.04', 'make', parse_docker_args('--network host -e FOO=bar'), output=output, tail=2, client=client
+            )
+
+        result = self.run_async(run)
+        self.assertEqual((result.exit_code, result.ok, result.tail), (2, False, ['line 48', 'line 49']))
+        self.assertEqual(result.output_bytes, len(self.daemon.outputs['make']))
+        self.assertEqual(output.getvalue(), self.daemon.outputs['make'])
+        self.assertEqual(self.daemon.containers, {})
+
+        async def missing(client):
+            return await aio.run_image('missing:latest', 'true', client=client)
+
+        with self.assertRaises(docker.errors.ImageNotFound):
+            self.run_async(missing)
+
+    def test_concurrent(self):
+        async def run(client):
+            return await asyncio.gather(*[aio.run_image('ubuntu:18.04', ['echo', str(i)], client=client) for i in range(200)])
+
+        results = self.run_async(run)
+        self.assertEqual([r.tail for r in results], [['output of echo %d' % i] for i in range(200)])
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 200)
+        self.assertEqual(self.daemon.containers, {})
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith('groot_rocker_aio')])  # no blocking work
+
+    def test_cancel(self):
+        self.daemon.latencies['logs'] = 5.0
+
+        async def cancel(client):
+            task = asyncio.ensure_future(aio.run_image('ubuntu:18.04', 'sleep', client=client))
+            while not self.daemon.count('POST', r'/containers/[^/]+/start'):
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.run_async(cancel)
+        self.assertEqual(self.daemon.containers, {})
+
+    def test_launch(self):
+        options = cli.load_arguments(['--env', 'FOO=bar', '--network', 'host', 'ubuntu:18.04', 'make', 'all'])
+        original = dict(options)
+
+        async def launch(client):
+            return await aio.launch(options, client=client)
+
+        result = self.run_async(launch)
+        self.assertEqual(options, original)  # not mutated
+        self.assertTrue(result.ok, result)
+        self.assertTrue(result.build.ok)
+        self.assertEqual(result.tail, ['output of make all'])
+        self.assertEqual(self.daemon.count('POST', r'/build'), 1)
+
+        async def again(client):
+            return await aio.build(options)
+
+        self.assertTrue(self.run_async(again).cache_hit)
+
+    def test_detect(self):
+        async def detect(client):
+            return await aio.detect_many(['ubuntu:18.04', 'ubuntu:bionic'], client=client)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                unittest.mock.patch.object(os_detector, '_detect_os_cache', {}), \
+                unittest.mock.patch.object(os_detector, '_detect_os_disk_cache', PersistentLRUCache('os_detect', directory=directory)):
+            results = self.run_async(detect)
+            self.assertEqual([r.os for r in results], [('Ubuntu', '18.04', 'bionic')] * 2)
+            self.assertEqual(self.daemon.containers, {})
+            image_id = self.daemon.client().inspect_image('ubuntu:18.04')['Id']
+            self.assertEqual(os_detector._detect_os_disk_cache.get(image_id), ['Ubuntu', '18.04', 'bionic'])
+            os_detector._detect_os_cache.clear()
+            self.daemon.requests.clear()
+            self.assertEqual([r.os for r in self.run_async(detect)], [('Ubuntu', '18.04', 'bionic')] * 2)
+            self.assertEqual(self.daemon.count('POST', r'/containers/create'), 0)  # from the persistent cache
+            self.assertEqual(os_detector.detect_os('ubuntu:bionic', docker_client=self.daemon.client()), ('Ubuntu', '18.04', 'bionic'))
+            self.assertEqual(self.daemon.count('POST', r'/containers/create'), 0)  # shared with the blocking detector
+
+    def test_version(self):
+        async def ping(client):
+            self.assertEqual(client.version, 'auto')
+            await asyncio.gather(client.ping(), client.ping())
+            return client.version
+
+        self.assertEqual(self.run_async(ping), fake_docker.API_VERSION)
+        self.assertEqual(self.daemon.count('GET', r'/_ping'), 3)  # negotiated once
+        self.assertEqual(self.daemon.count('GET', r'/version'), 0)
+
+        async def fixed(client):
+            client.version = '1.40'
+            return await client.ping()
+
+        self.daemon.requests.clear()
+        self.assertTrue(self.run_async(fixed))
+        self.assertEqual(self.daemon.count('GET', r'/_ping'), 1)
+
+        async def init(client):
+            self.assertEqual(client.version, 'auto')
+            return await aio.run_image('ubuntu:18.04', 'true', parse_docker_args('--init --pid host'), client=client)
+
+        self.assertEqual(self.run_async(init).exit_code, 0)  # host config options that depend on the version
+
+    def test_pool_run(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                unittest.mock.patch.object(pool, '_usage', PersistentLRUCache('pool', directory=directory)):
+            docker_client = self.daemon.client()
+            container_pool = pool.ContainerPool(docker_client.inspect_image('ubuntu:18.04')['Id'], docker_client=docker_client)
+            container = self.daemon.add_container('ubuntu:18.04', labels={pool.POOL_LABEL: container_pool.key})
+            self.daemon.exit_codes['false'] = 1
+
+            async def run(client):
+                return await asyncio.gather(aio.pool_run(container_pool, 'true', client=client), aio.pool_run(container_pool, 'false', client=client))
+
+            results = self.run_async(run)
+        self.assertEqual([(r.exit_code, r.container_id, r.tail) for r in results], [
+            (0, container, ['output of true']), (1, container, ['output of false'])
+        ])
+
+    def test_pool_run_entrypoint(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                unittest.mock.patch.object(pool, '_usage', PersistentLRUCache('pool', directory=directory)):
+            image_id = self.daemon.add_image('ros:noetic', entrypoint=['/ros_entrypoint.sh'])
+            container_pool = pool.ContainerPool(image_id, docker_client=self.daemon.client())
+            self.daemon.add_container('ros:noetic', labels={pool.POOL_LABEL: container_pool.key})
+
+            async def run(client):
+                return await aio.pool_run(container_pool, 'rostopic list', client=client)
+
+            result = self.run_async(run)
+        self.assertEqual(result.tail, ['output of /ros_entrypoint.sh rostopic list'])
+
+
+if __name__ == '__main__':
+    unittest.main()
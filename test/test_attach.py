@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import fcntl
+import os
+import pty
+import socket
+import struct
+import tempfile
+import termios
+import threading
+import time
+import unittest
+
+from groot_rocker.attach import docker_interactive_exec
+from groot_rocker.attach import docker_interactive_run
+from groot_rocker.attach import terminal_size
+from groot_rocker.attach import TerminalRelay
+from groot_rocker.run_options import RunOptions
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Helpers
+##############################################################################
+
+
+def pipe_with_input(data):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, data)
+    os.close(write_fd)
+    return read_fd
+
+
+def read_all(fd):
+    data = b''
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return data
+        data += chunk
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class RelayTestCase(unittest.TestCase):
+
+    def test_relay(self):
+        local, remote = socket.socketpair()
+
+        def echo():
+            with remote:
+                remote.sendall(b'banner\n')
+                while True:
+                    data = remote.recv(4096)
+                    if not data:
+                        return
+                    remote.sendall(data)
+
+        thread = threading.Thread(target=echo)
+        thread.start()
+        stdin_file = tempfile.TemporaryFile()  # always readable, i.e. not pollable
+        stdin_file.write(b'x' * 100000)
+        stdin_file.seek(0)
+        stdin = stdin_file.fileno()
+        output_read, output_write = os.pipe()
+        resizes = []
+        relay = TerminalRelay(local, stdin, output_write, on_resize=lambda: resizes.append(True), buffer_size=4096)
+        relay.resize()
+        relay.resize()
+        reader = threading.Thread(target=lambda: resizes.append(read_all(output_read)))
+        reader.start()
+        relay.run()
+        relay.close()
+        os.close(output_write)
+        reader.join()
+        thread.join()
+        os.close(output_read)
+        stdin_file.close()
+        local.close()
+        self.assertEqual(resizes[0], True)  # coalesced
+        self.assertEqual(resizes[-1], b'banner\n' + b'x' * 100000)
+        self.assertEqual((relay.bytes_in, relay.bytes_out), (100000, 100007))
+
+    def test_backpressure(self):
+        local, remote = socket.socketpair()
+        local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        remote.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        data = os.urandom(1000000)
+        received = []
+
+        def slow_reader():
+            with remote:
+                time.sleep(0.2)  # the relay's input backs up
+                while True:
+                    chunk = remote.recv(1024)
+                    if not chunk:
+                        return
+                    received.append(chunk)
+
+        stdin, stdin_write = os.pipe()  # pollable
+
+        def feed():
+            try:
+                with open(stdin_write, 'wb') as stream:
+                    stream.write(data)
+            except BrokenPipeError:
+                pass
+
+        writer = threading.Thread(target=feed)
+        reader = threading.Thread(target=slow_reader)
+        writer.start()
+        reader.start()
+        output_read, output_write = os.pipe()
+        relay = TerminalRelay(local, stdin, output_write, buffer_size=65536)  # many partial sends per read
+        try:
+            relay.run()
+        finally:
+            relay.close()
+            for fd in [stdin, output_read, output_write]:
+                os.close(fd)
+            local.close()
+            writer.join()
+            reader.join()
+        self.assertEqual(b''.join(received), data)
+        self.assertEqual(relay.bytes_in, len(data))
+
+
+class InteractiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+
+    def tearDown(self):
+        self.docker_client.close()
+        self.daemon.stop()
+
+    def test_run(self):
+        stdin = pipe_with_input(b'hello\n')
+        master, slave = pty.openpty()
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', 40, 120, 0, 0))
+        self.assertEqual(terminal_size(slave), (40, 120))
+        self.daemon.exit_codes['bash'] = 3
+        exit_code = docker_interactive_run(
+            self.docker_client, 'ubuntu:18.04', ['bash'], RunOptions(container={'environment': ['FOO=bar']}),
+            remove=False, stdin=stdin, stdout=slave
+        )
+        self.assertEqual(exit_code, 3)
+        output = os.read(master, 4096).replace(b'\r\n', b'\n')
+        self.assertEqual(output, b'output of bash\nhello\n')
+        container, = self.daemon.containers.values()
+        self.assertEqual(container['Size'], [40, 120])
+        self.assertTrue(container['Config']['Tty'] and container['Config']['OpenStdin'])
+        self.assertEqual(container['Config']['Env'], ['FOO=bar'])
+        self.assertEqual(terminal_size(stdin), None)
+        for fd in [stdin, master, slave]:
+            os.close(fd)
+
+    def test_exec(self):
+        container = self.daemon.add_container('ubuntu:18.04')
+        stdin = pipe_with_input(b'ls\n')
+        output_read, output_write = os.pipe()
+        self.assertEqual(docker_interactive_exec(self.docker_client, container, ['bash'], stdin=stdin, stdout=output_write), 0)
+        os.close(output_write)
+        self.assertEqual(read_all(output_read), b'output of bash\nls\n')
+        for fd in [stdin, output_read]:
+            os.close(fd)
+
+
+if __name__ == '__main__':
+    unittest.main()
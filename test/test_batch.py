@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from groot_rocker import batch
+from groot_rocker.core import set_docker_client
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def write_manifest(self, directory):
+        with open(os.path.join(directory, 'config.yaml'), 'w') as fh:
+            fh.write('image: ubuntu:18.04\ncommand: "true"\n')
+        manifest = os.path.join(directory, 'manifest.yaml')
+        with open(manifest, 'w') as fh:
+            fh.write('jobs: 2\nconfigs:\n  - config.yaml\n  - config: config.yaml\n    args: ["--env", "FOO=bar"]\n')
+        return manifest
+
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as td:
+            jobs, max_workers = batch.load_manifest(self.write_manifest(td))
+            self.assertEqual(max_workers, 2)
+            self.assertEqual(len(jobs), 2)
+            self.assertEqual(jobs[0].config, os.path.join(td, 'config.yaml'))
+            self.assertEqual(jobs[0].args, [])
+            self.assertEqual(jobs[1].args, ['--env', 'FOO=bar'])
+
+    def test_run_batch(self):
+        with tempfile.TemporaryDirectory() as td, FakeDockerDaemon() as daemon:
+            daemon.exit_codes['false'] = 3
+            set_docker_client(daemon.client())
+            try:
+                for name, config in [
+                    ('bionic.yaml', 'image: ubuntu:18.04\nrunner: sdk\ncommand: "true"\n'),
+                    ('failing.yaml', 'image: ubuntu:18.04\nrunner: sdk\ncommand: "false"\n'),
+                    ('other.yaml', 'image: ubuntu:bionic\nrunner: sdk\ncommand: "true"\n'),
+                ]:
+                    with open(os.path.join(td, name), 'w') as fh:
+                        fh.write(config)
+                manifest = os.path.join(td, 'manifest.yaml')
+                with open(manifest, 'w') as fh:
+                    fh.write('jobs: 2\nconfigs:\n  - bionic.yaml\n  - config: bionic.yaml\n    args: ["--env", "FOO=bar"]\n'
+                             '  - failing.yaml\n  - other.yaml\n')
+                jobs, max_workers = batch.load_manifest(manifest)
+                with unittest.mock.patch('builtins.print'):
+                    batch.run_batch(jobs, max_workers=max_workers)
+                    batch.print_summary(jobs)
+            finally:
+                set_docker_client(None)
+            self.assertEqual([job.exit_code for job in jobs], [0, 0, 3, 0])
+            self.assertEqual([job.build_status for job in jobs], ['built', 'shared', 'shared', 'built'])
+            self.assertEqual(jobs[0].image_key, jobs[2].image_key)
+            self.assertNotEqual(jobs[0].image_key, jobs[3].image_key)
+            self.assertEqual(daemon.count('POST', r'/build'), 2)  # once per unique image
+            self.assertEqual(daemon.count('POST', r'/containers/create'), 4)
+            self.assertEqual(daemon.containers, {})  # all removed
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+"""
+Benchmarks of the hot paths, run against a fake docker daemon (no real
+daemon required). By default only their results are checked, wall clock
+timings depend too much on the machine to fail the regular test suite on.
+
+Environment variables:
+
+ * GROOT_ROCKER_BENCHMARK=1: also compare the timings with the baselines in benchmarks.json
+ * GROOT_ROCKER_BENCHMARK_UPDATE=1: record new baselines instead of comparing
+ * GROOT_ROCKER_BENCHMARK_TOLERANCE=<factor>: allowed slowdown (default: 3.0)
+ * GROOT_ROCKER_BENCHMARK_DOCKER=1: also compare against a real daemon and ``docker run -t``
+
+A small absolute allowance is added on top so that sub-millisecond
+benchmarks don't fail on scheduler noise alone.
+"""
+
+##############################################################################
+# Imports
+##############################################################################
+
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+import docker
+
+import groot_rocker.console as console
+from groot_rocker import aio
+from groot_rocker import attach
+from groot_rocker import cli
+from groot_rocker import core
+from groot_rocker import logs
+from groot_rocker import pool
+from groot_rocker import run_options
+from groot_rocker import session
+from groot_rocker.build_events import BuildReport
+from groot_rocker.cache import PersistentLRUCache
+
+from .fake_docker import FakeDockerDaemon
+from .utilities import assert_details
+from .utilities import GROOT_ROCKER
+from .utilities import start_server
+
+##############################################################################
+# Helpers
+##############################################################################
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks.json')
+COMPARE = os.environ.get('GROOT_ROCKER_BENCHMARK', '0') == '1'
+UPDATE = os.environ.get('GROOT_ROCKER_BENCHMARK_UPDATE', '0') == '1'
+TOLERANCE = float(os.environ.get('GROOT_ROCKER_BENCHMARK_TOLERANCE', '3.0'))
+NOISE_FLOOR = 0.002  # seconds
+ATTACH_BYTES = 32 << 20
+LOG_BYTES = 128 << 20
+
+
+def measure(function, repeat=5, warmup=1):
+    """Median wall time (seconds) of several calls."""
+    for unused_i in range(warmup):
+        function()
+    timings = []
+    for unused_i in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def generate_extensions(count, seed=0):
+    """A random (but repeatable) dependency graph of extensions, each desiring up to 3 of the previous 50."""
+    generator = random.Random(seed)
+    names = ['extension_%d' % i for i in range(count)]
+    extensions = {}
+    for i, name in enumerate(names):
+        desired = set(generator.sample(names[max(0, i - 50):i], min(i, generator.randint(0, 3))))
+        if generator.random() < 0.05:
+            desired.add('user')
+        extensions[name] = type(name, (core.RockerExtension,), {
+            'desired_extensions': staticmethod(lambda desired=frozenset(desired): set(desired))
+        })
+    extensions['user'] = type('user', (core.RockerExtension,), {})
+    items = list(extensions.items())
+    generator.shuffle(items)
+    return dict(items)
+
+
+def load_baselines():
+    try:
+        with open(BASELINES, 'r') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.daemon = FakeDockerDaemon()
+        cls.daemon.start()
+        core.set_docker_client(cls.daemon.client())
+        cls.baselines = load_baselines()
+        cls.results = {}
+        console.banner("Benchmarks")
+
+    @classmethod
+    def tearDownClass(cls):
+        core.set_docker_client(None)
+        cls.daemon.stop()
+        if UPDATE:
+            baselines = load_baselines()
+            baselines.update({name: round(seconds, 6) for name, seconds in cls.results.items()})
+            with open(BASELINES, 'w') as stream:
+                json.dump(baselines, stream, indent=2, sort_keys=True)
+                stream.write('\n')
+
+    def check(self, name, seconds):
+        self.results[name] = seconds
+        baseline = self.baselines.get(name)
+        assert_details(name, "%.2fms" % (1000 * seconds), "baseline %s" % (
+            "%.2fms" % (1000 * baseline) if baseline is not None else "-"))
+        if UPDATE or not COMPARE or baseline is None:
+            return
+        self.assertLessEqual(
+            seconds, baseline * TOLERANCE + NOISE_FLOOR,
+            "%s regressed: %.2fms vs a baseline of %.2fms" % (name, 1000 * seconds, 1000 * baseline)
+        )
+
+    def run_cli(self, *args):
+        subprocess.run(
+            [sys.executable, '-c', 'from groot_rocker.cli import main; main()'] + list(args),
+            env=self.daemon.environment(), check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def test_cli_cold_start(self):
+        self.check('cli_cold_start', measure(lambda: self.run_cli('--version'), repeat=3))
+
+    def test_cli_dry_run(self):
+        self.check('cli_dry_run', measure(
+            lambda: self.run_cli('--mode', 'dry-run', '--nocache', 'ubuntu:18.04', 'true'), repeat=3
+        ))
+
+    def test_cli_served(self):
+        with tempfile.TemporaryDirectory() as directory:
+            environment = self.daemon.environment()
+            environment['GROOT_ROCKER_SOCKET'] = os.path.join(directory, 'server.sock')
+            server = start_server(environment)
+            try:
+                def run_cli(*args):
+                    subprocess.run(
+                        GROOT_ROCKER + list(args),
+                        env=environment, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                    )
+                version = measure(lambda: run_cli('--version'), repeat=3)
+                dry_run = measure(lambda: run_cli('--mode', 'dry-run', '--nocache', 'ubuntu:18.04', 'true'), repeat=3)
+            finally:
+                server.terminate()
+                server.wait()
+        self.check('cli_served_cold_start', version)
+        self.check('cli_served_dry_run', dry_run)
+
+    def test_load_arguments(self):
+        arguments = ['--home', '--env', 'FOO=bar', '--network', 'host', '--mode', 'dry-run', 'ubuntu:18.04', 'true']
+        self.check('load_arguments', measure(lambda: cli.load_arguments(arguments), repeat=10))
+
+    def test_generate_dockerfile(self):
+        options = cli.load_arguments(['--home', '--env', 'FOO=bar', '--container-name', 'foo', 'ubuntu:18.04'])
+        active_extensions = core.RockerExtensionManager().get_active_extensions(options)
+        self.check('generate_dockerfile', measure(
+            lambda: core.generate_dockerfile(active_extensions, options, options['image']), repeat=20
+        ))
+
+    def test_build_stream(self):
+        dockerfile = 'FROM ubuntu:18.04\n' + ''.join('RUN echo %d\n' % i for i in range(100))
+        context = core.create_build_context(dockerfile, {})
+        report = BuildReport(dockerfile)
+
+        def build():
+            context.seek(0)
+            image_id = core.docker_build(
+                fileobj=context, custom_context=True, rm=True, decode=True, nocache=True,
+                output_callback=lambda output: None, event_callback=report.add
+            )
+            self.assertIsNotNone(image_id)
+
+        self.check('build_stream', measure(build, repeat=5))
+
+    def test_generate_docker_cmd(self):
+        options = cli.load_arguments(['--home', '--env', 'FOO=bar', '--network', 'host', '--mode', 'dry-run', 'ubuntu:18.04', 'true'])
+        active_extensions = core.RockerExtensionManager().get_active_extensions(options)
+        generator = core.DockerImageGenerator(active_extensions, options, options['image'])
+        self.assertEqual(generator.build(verbose=False, **options), 0)
+        self.check('generate_docker_cmd', measure(lambda: generator.generate_docker_cmd(**options), repeat=20))
+
+    def test_sdk_run(self):
+        options = run_options.parse_docker_args('--network host -e FOO=bar -v /tmp:/tmp')
+        docker_client = self.daemon.client()
+        self.check('sdk_run', measure(
+            lambda: core.docker_sdk_run(docker_client, 'ubuntu:18.04', ['true'], options), repeat=10
+        ))
+
+    def test_pool_exec(self):
+        docker_client = self.daemon.client()
+        image_id = docker_client.inspect_image('ubuntu:18.04')['Id']
+        with tempfile.TemporaryDirectory() as directory, \
+                unittest.mock.patch.object(pool, '_usage', PersistentLRUCache('pool', directory=directory)), \
+                unittest.mock.patch('sys.stdout', open(os.devnull, 'w')):
+            container_pool = pool.ContainerPool(image_id, size=1, docker_client=docker_client)
+            self.daemon.add_container('ubuntu:18.04', labels={pool.POOL_LABEL: container_pool.key})
+            seconds = measure(lambda: container_pool.run('true'), repeat=10)
+        self.check('pool_exec', seconds)
+
+    def attach_throughput(self, docker_client, image, command):
+        """Seconds to relay a container's (tty) output to /dev/null via the attach api."""
+        with open(os.devnull, 'r+b') as devnull:
+            return measure(lambda: attach.docker_interactive_run(
+                docker_client, image, command, run_options.RunOptions(), stdin=devnull.fileno(), stdout=devnull.fileno()
+            ), repeat=3)
+
+    def test_attach_throughput(self):
+        self.daemon.outputs['cat large'] = b'x' * ATTACH_BYTES
+        self.check('attach_throughput_%dmb' % (ATTACH_BYTES >> 20), self.attach_throughput(
+            self.daemon.client(), 'ubuntu:18.04', ['cat', 'large']
+        ))
+
+    @unittest.skipUnless(os.environ.get('GROOT_ROCKER_BENCHMARK_DOCKER') == '1', "requires GROOT_ROCKER_BENCHMARK_DOCKER=1 and a docker daemon")
+    def test_attach_throughput_versus_docker_cli(self):
+        # not recorded, the daemon's own overheads vary far too much from machine to machine
+        image = 'ubuntu:18.04'
+        command = ['head', '-c', str(ATTACH_BYTES), '/dev/zero']
+        relayed = self.attach_throughput(docker.APIClient(), image, command)
+        docker_cli = measure(lambda: subprocess.run(
+            ['docker', 'run', '--rm', '-t', image] + command, check=True, stdout=subprocess.DEVNULL
+        ), repeat=3)
+        assert_details('attach_throughput_docker', "%.2fms" % (1000 * relayed), "docker run -t %.2fms" % (1000 * docker_cli))
+        self.assertLessEqual(relayed, docker_cli * TOLERANCE)
+
+    def test_aio_concurrent_runs(self):
+        async def runs():
+            async with aio.AsyncDockerClient(self.daemon.base_url) as client:
+                results = await asyncio.gather(*[aio.run_image('ubuntu:18.04', 'true', client=client) for unused_i in range(200)])
+            self.assertTrue(all(result.ok for result in results))
+
+        self.check('aio_concurrent_runs_200', measure(lambda: asyncio.run(runs()), repeat=3))
+
+    def test_log_capture(self):
+        chunk = b''.join(b'[%6d] building target foo with some flags\n' % i for i in range(20000))[:1 << 20]
+        with tempfile.TemporaryDirectory() as directory:
+            def capture():
+                with logs.LogCapture(os.path.join(directory, 'run.log'), max_bytes=16 << 20, backups=2) as log:
+                    for unused_i in range(LOG_BYTES >> 20):
+                        log.write(chunk)
+            self.check('log_capture_%dmb' % (LOG_BYTES >> 20), measure(capture, repeat=3))
+
+    def test_session_launches(self):
+        with tempfile.TemporaryDirectory() as directory, unittest.mock.patch('sys.stdout', open(os.devnull, 'w')):
+            config = os.path.join(directory, 'job.yaml')
+            with open(config, 'w') as stream:
+                stream.write("image: ubuntu:18.04\nnetwork: host\nmode: non-interactive\nrunner: sdk\ncommand: 'true'\n")
+            launcher = session.Session(docker_client=self.daemon.client())
+
+            def launches():
+                for index in range(100):
+                    self.assertEqual(launcher.launch(config, container_name='job%d' % index), 0)
+
+            self.check('session_launches_100', measure(launches, repeat=3))
+
+    def test_resolve_extensions(self):
+        timings = {}
+        for count in [10, 100, 1000, 5000]:
+            extensions = tuple(generate_extensions(count).items())
+            order = core.resolve_extension_order.__wrapped__(extensions)  # not memoised
+            self.assertEqual(len(order), count + 1)
+            position = {name: i for i, name in enumerate(order)}
+            classes = dict(extensions)
+            user_tier = {name for name, cls in extensions if name == 'user' or 'user' in cls.desired_extensions()}
+            for name, cls in extensions:
+                for dependency in cls.desired_extensions():
+                    if (dependency in user_tier) == (name in user_tier):
+                        self.assertLess(position[dependency], position[name])
+                    elif name in user_tier:
+                        self.assertIn(dependency, classes)  # root tier extensions come first anyway
+                        self.assertLess(position[dependency], position[name])
+            timings[count] = measure(lambda: core.resolve_extension_order.__wrapped__(extensions), repeat=5)
+            self.check('resolve_extensions_%d' % count, timings[count])
+        if COMPARE:
+            # linear, with plenty of room for noise
+            self.assertLess(timings[5000] / timings[1000], 5 * 3)
+
+    def test_resolve_extensions_memoised(self):
+        extensions = generate_extensions(1000)
+        core.RockerExtensionManager.sort_extensions(extensions)
+        self.check('resolve_extensions_memoised_1000', measure(
+            lambda: core.RockerExtensionManager.sort_extensions(extensions), repeat=10
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
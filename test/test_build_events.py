@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import unittest
+
+from groot_rocker import build_events
+
+##############################################################################
+# Helpers
+##############################################################################
+
+DOCKERFILE = """# Preamble from extension [home]
+
+
+FROM ubuntu:bionic
+USER root
+# Snippet from extension [apt]
+RUN apt-get update && \\
+    apt-get install -y git
+# Snippet from extension [user]
+RUN useradd foo
+"""
+
+LEGACY_STREAM = [
+    {'stream': 'Step 1/4 : FROM ubuntu:bionic\n'},
+    {'status': 'Pulling from library/ubuntu'},
+    {'stream': ' ---> 7698f282e524\n'},
+    {'stream': 'Step 2/4 : USER root\n'},
+    {'stream': ' ---> Using cache\n'},
+    {'stream': ' ---> 3ed8b8a3e9c1\n'},
+    {'stream': 'Step 3/4 : RUN apt-get update &&     apt-get install -y git\n'},
+    {'stream': ' ---> Using cache\n'},
+    {'stream': ' ---> 0c6f5b0de1b2\n'},
+    {'stream': 'Step 4/4 : RUN useradd foo\n'},
+    {'stream': ' ---> Running in 5c0c9a3ec4e2\n'},
+    {'stream': 'Removing intermediate container 5c0c9a3ec4e2\n'},
+    {'stream': ' ---> 1b1ec7f8d2b4\n'},
+    {'aux': {'ID': 'sha256:1b1ec7f8d2b4c2e5d3a8b4c6e7f8a9b0c1d2e3f4a5b6c7d8e9f0a1b2c3d4e5f6'}},
+    {'stream': 'Successfully built 1b1ec7f8d2b4\n'},
+]
+
+BUILDKIT_OUTPUT = """#1 [internal] load build definition from Dockerfile
+#1 DONE 0.0s
+#5 [1/3] FROM docker.io/library/ubuntu:bionic
+#5 CACHED
+#6 [2/3] RUN apt-get update &&     apt-get install -y git
+#6 CACHED
+#7 [3/3] RUN useradd foo
+#7 0.512 some output
+#7 DONE 1.2s
+"""
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class BuildEventsTestCase(unittest.TestCase):
+
+    def test_legacy(self):
+        parser = build_events.LegacyBuildParser()
+        report = build_events.BuildReport(DOCKERFILE)
+        events = []
+        for line in LEGACY_STREAM:
+            events.extend(parser.feed(line))
+        events.extend(parser.close())
+        for event in events:
+            report.add(event)
+        self.assertEqual(len([e for e in events if isinstance(e, build_events.StepStarted)]), 4)
+        self.assertEqual(len([e for e in events if isinstance(e, build_events.Status)]), 1)
+        self.assertEqual([s.step for s in report.cached_steps], ['2/4', '3/4'])
+        self.assertEqual([s.step for s in report.rebuilt_steps], ['4/4'])
+        self.assertEqual(report.extension(report.rebuilt_steps[0]), 'user')
+        self.assertEqual(report.extension(report.cached_steps[1]), 'apt')
+        self.assertTrue(report.image_id.startswith('sha256:1b1ec7f8d2b4'))
+        self.assertEqual(report.errors, [])
+        report.print()
+
+    def test_legacy_error(self):
+        parser = build_events.LegacyBuildParser()
+        events = parser.feed({'stream': 'Step 1/1 : RUN false\n'})
+        events += parser.feed({'error': "The command '/bin/sh -c false' returned a non-zero code: 1", 'errorDetail': {'code': 1}})
+        self.assertIsInstance(events[-2], build_events.StepFinished)
+        self.assertIsInstance(events[-1], build_events.BuildError)
+        self.assertEqual(parser.close(), [])
+
+    def test_old_daemon_image_id(self):
+        events = build_events.LegacyBuildParser().feed({'stream': 'Successfully built 1b1ec7f8d2b4\n'})
+        self.assertEqual(events[0].image_id, '1b1ec7f8d2b4')
+
+    def test_buildkit(self):
+        parser = build_events.BuildKitParser()
+        report = build_events.BuildReport(DOCKERFILE)
+        for line in BUILDKIT_OUTPUT.splitlines():
+            for event in parser.feed(line):
+                report.add(event)
+        self.assertEqual(len(report.cached_steps), 2)
+        self.assertEqual([s.instruction for s in report.rebuilt_steps], ['RUN useradd foo'])
+        self.assertEqual(report.slowest_steps(1)[0].duration, 1.2)
+        self.assertEqual(report.extension(report.rebuilt_steps[0]), 'user')
+        self.assertEqual(parser.feed('#7 ERROR: process "/bin/sh -c useradd foo" did not complete')[0].message,
+                         'process "/bin/sh -c useradd foo" did not complete')
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import tempfile
+import unittest
+
+from groot_rocker.cache import PersistentLRUCache
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class PersistentLRUCacheTestCase(unittest.TestCase):
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as td:
+            PersistentLRUCache('foo', directory=td).set('sha256:1234', ['Ubuntu', '18.04', 'bionic'])
+            cache = PersistentLRUCache('foo', directory=td)
+            self.assertEqual(cache.get('sha256:1234'), ['Ubuntu', '18.04', 'bionic'])
+            self.assertIsNone(cache.get('sha256:5678'))
+            cache.remove('sha256:1234')
+            self.assertNotIn('sha256:1234', PersistentLRUCache('foo', directory=td))
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as td:
+            cache = PersistentLRUCache('foo', max_entries=2, directory=td)
+            cache.set('a', 1)
+            cache.set('b', 2)
+            self.assertEqual(cache.get('a'), 1)  # 'b' is now least recently used
+            cache.set('c', 3)
+            self.assertEqual(len(cache), 2)
+            self.assertIn('a', cache)
+            self.assertNotIn('b', cache)
+            self.assertIn('c', cache)
+
+    def test_hits_are_not_rewritten(self):
+        with tempfile.TemporaryDirectory() as td:
+            cache = PersistentLRUCache('foo', directory=td)
+            cache.set('a', 1)
+            cache.set('b', 2)
+            inode = os.stat(cache.path).st_ino
+            for unused_i in range(3):
+                self.assertEqual(cache.get('b'), 2)  # already the most recently used
+            self.assertEqual(os.stat(cache.path).st_ino, inode)
+            self.assertEqual(cache.get('a'), 1)
+            self.assertNotEqual(os.stat(cache.path).st_ino, inode)
+            self.assertEqual(list(cache._load().keys()), ['b', 'a'])
+
+    def test_corrupt_file(self):
+        with tempfile.TemporaryDirectory() as td:
+            with open(os.path.join(td, 'foo.json'), 'w') as fh:
+                fh.write('{not json')
+            cache = PersistentLRUCache('foo', directory=td)
+            self.assertIsNone(cache.get('a'))
+            cache.set('a', 1)
+            self.assertEqual(PersistentLRUCache('foo', directory=td).get('a'), 1)
@@ -22,10 +22,16 @@ import unittest
 from itertools import chain
 
 import groot_rocker
+from groot_rocker.core import cache_mount
+from groot_rocker.core import compute_image_key
+from groot_rocker.core import CyclicDependencyError
 from groot_rocker.core import DockerImageGenerator
+from groot_rocker.core import generate_dockerfile
 from groot_rocker.core import list_plugins
+from groot_rocker.core import RockerExtension
 from groot_rocker.core import get_docker_client
 from groot_rocker.core import RockerExtensionManager
+from groot_rocker.core import set_docker_client
 
 class RockerCoreTest(unittest.TestCase):
 
@@ -53,6 +59,18 @@ class RockerCoreTest(unittest.TestCase):
             # Check that it can be cast to an int
             i = int(p)
 
+    def test_shared_docker_client(self):
+        self.assertIs(get_docker_client(), get_docker_client())
+
+    def test_inject_docker_client(self):
+        docker_client = object()
+        set_docker_client(docker_client)
+        try:
+            self.assertIs(get_docker_client(), docker_client)
+            self.assertIs(DockerImageGenerator([], {}, 'ubuntu:bionic').docker_client, docker_client)
+        finally:
+            set_docker_client(None)
+
     def test_run_before_build(self):
         dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
         self.assertEqual(dig.run('true'), 1)
@@ -74,6 +92,60 @@ class RockerCoreTest(unittest.TestCase):
         self.assertEqual(dig.run('true'), 0)
         self.assertEqual(dig.run('false'), 1)
 
+    def test_image_cache(self):
+        dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
+        self.assertEqual(dig.build(), 0)
+        first_image_id = dig.image_id
+        dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
+        self.assertEqual(dig.build(), 0)
+        self.assertTrue(first_image_id in dig.image_id)
+        self.assertEqual(dig.run('true'), 0)
+
+    def test_image_key(self):
+        key = compute_image_key('FROM ubuntu:bionic\n', {'foo.txt': 'foo'})
+        self.assertEqual(key, compute_image_key('FROM ubuntu:bionic\n', {'foo.txt': 'foo'}))
+        self.assertNotEqual(key, compute_image_key('FROM ubuntu:focal\n', {'foo.txt': 'foo'}))
+        self.assertNotEqual(key, compute_image_key('FROM ubuntu:bionic\n', {'foo.txt': 'bar'}))
+        self.assertNotEqual(key, compute_image_key('FROM ubuntu:bionic\n', {'bar.txt': 'foo'}))
+        self.assertNotEqual(key, compute_image_key('FROM ubuntu:bionic\n', {'foo.txt': 'foo'}, 'sha256:1234'))
+
+    def test_run_only_extensions(self):
+        plugins = list_plugins()
+        run_only = [plugins[name]() for name in ['container_name', 'devices', 'env', 'home', 'network']]
+        cliargs = {'container_name': 'foo', 'devices': [], 'env': [['FOO=bar']], 'network': 'host'}
+        dockerfile = generate_dockerfile([], {}, 'ubuntu:bionic')
+        self.assertEqual(generate_dockerfile(run_only, cliargs, 'ubuntu:bionic'), dockerfile)
+
+        class Snippet(RockerExtension):
+            @classmethod
+            def get_name(cls):
+                return 'snippet'
+
+            def get_snippet(self, cliargs):
+                return 'RUN true'
+
+        self.assertEqual(
+            generate_dockerfile(run_only + [Snippet()], cliargs, 'ubuntu:bionic'),
+            dockerfile + '# Snippet from extension [snippet]\nRUN true\n'
+        )
+
+    def test_cache_mount(self):
+        self.assertEqual(cache_mount({}, '/root/.cache/pip'), '')
+        self.assertEqual(cache_mount({'buildkit': False}, '/root/.cache/pip'), '')
+        self.assertEqual(
+            cache_mount({'buildkit': True}, '/var/cache/apt'),
+            '--mount=type=cache,target=/var/cache/apt,sharing=locked '
+        )
+        self.assertEqual(
+            cache_mount({'buildkit': True}, '/root/.cache/pip', sharing='shared', id='pip'),
+            '--mount=type=cache,target=/root/.cache/pip,sharing=shared,id=pip '
+        )
+
+    def test_buildkit(self):
+        dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
+        self.assertEqual(dig.build(buildkit=True, nocache=True), 0)
+        self.assertEqual(dig.run('true'), 0)
+
     def test_noexecute(self):
         dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
         self.assertEqual(dig.build(), 0)
@@ -138,6 +210,38 @@ class RockerCoreTest(unittest.TestCase):
         self.assertEqual(sorted_extensions[0].get_name(), "foo")
         self.assertEqual(sorted_extensions[1].get_name(), "bar")
 
+    def test_extension_sorting_tiers(self):
+        def extension(name, desired=set(), required=set()):
+            return type(name, (groot_rocker.core.RockerExtension,), {
+                'desired_extensions': staticmethod(lambda: set(desired)),
+                'required_extensions': staticmethod(lambda: set(required))
+            })
+        extensions = {
+            'home': extension('home', desired={'user'}),
+            'user': extension('user'),
+            'git': extension('git', desired={'ssh'}),
+            'ssh': extension('ssh', desired={'not_active'}),
+            'env': extension('env', required={'user'}),
+            'devices': extension('devices'),
+        }
+        order = [e.__class__.__name__ for e in RockerExtensionManager.sort_extensions(extensions)]
+        self.assertEqual(order, ['ssh', 'devices', 'git', 'user', 'home', 'env'])
+
+    def test_extension_cycle(self):
+        def extension(name, desired):
+            return type(name, (groot_rocker.core.RockerExtension,), {'desired_extensions': staticmethod(lambda: set(desired))})
+        extensions = {
+            'a': extension('a', {'b'}),
+            'b': extension('b', {'c'}),
+            'c': extension('c', {'a'}),
+            'd': extension('d', {'a'}),
+        }
+        with self.assertRaises(CyclicDependencyError) as context:
+            RockerExtensionManager.sort_extensions(extensions)
+        self.assertEqual(context.exception.cycle, ['a', 'b', 'c', 'a'])
+        self.assertIn('a -> b -> c -> a', str(context.exception))
+        self.assertIsInstance(context.exception, ValueError)
+
     def test_docker_cmd_interactive(self):
         dig = DockerImageGenerator([], {}, 'ubuntu:bionic')
 
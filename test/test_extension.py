@@ -25,6 +25,7 @@ import pwd
 
 
 from groot_rocker.core import list_plugins
+from groot_rocker.core import ValidateError
 from groot_rocker.extensions import name_to_argument
 
 
@@ -141,6 +142,12 @@ class NetworkExtensionTest(unittest.TestCase):
         args = p.get_docker_args(mock_cliargs)
         self.assertTrue('--network host' in args)
 
+    def test_network_validation(self):
+        p = list_plugins()['network']()
+        p.validate_environment({'network': 'host'})
+        with self.assertRaises(ValidateError):
+            p.validate_environment({'network': 'does_not_exist'})
+
 
 class ContainerNameExtensionTest(unittest.TestCase):
 
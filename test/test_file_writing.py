@@ -23,9 +23,12 @@ import unittest
 from pathlib import Path
 import pwd
 import shlex
+import tarfile
 from tempfile import TemporaryDirectory
 
 from groot_rocker.core import list_plugins
+from groot_rocker.core import create_build_context
+from groot_rocker.core import get_files
 from groot_rocker.core import write_files
 from groot_rocker.extensions import name_to_argument
 from groot_rocker.extensions import RockerExtension
@@ -88,3 +91,18 @@ class FileInjectionExtensionTest(unittest.TestCase):
                 self.assertIn('test_value', content)
 
             self.assertFalse(os.path.exists('/absolute.txt'))
+
+    def test_build_context(self):
+        extensions = [TestFileInjection()]
+        mock_cliargs = {'test_key': 'test_value'}
+        files = get_files(extensions, mock_cliargs)
+        self.assertNotIn('/absolute.txt', files)
+
+        for max_memory in [64 * 1024 * 1024, 0]:  # in memory and spooled to disk
+            with create_build_context('FROM ubuntu:bionic\n', files, max_memory=max_memory) as context:
+                with tarfile.open(fileobj=context) as archive:
+                    self.assertEqual(archive.getnames(), ['Dockerfile', 'test_file.txt'])
+                    self.assertEqual(archive.extractfile('Dockerfile').read(), b'FROM ubuntu:bionic\n')
+                    content = archive.extractfile('test_file.txt').read().decode()
+                    self.assertIn('quick brown', content)
+                    self.assertIn('test_value', content)
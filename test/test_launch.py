@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import docker
+
+from groot_rocker import console
+from groot_rocker.core import compute_image_key
+from groot_rocker.core import DockerImageGenerator
+from groot_rocker.core import RockerExtension
+from groot_rocker.core import set_docker_client
+from groot_rocker.core import ValidateError
+
+from . import fake_docker
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Helpers
+##############################################################################
+
+
+class Hooks(RockerExtension):
+    """Records its hooks, which optionally wait (on a callable) and fail."""
+    def __init__(self, name, calls, wait=None, error=None, snippet=''):
+        self.name = name
+        self.calls = calls
+        self.wait = wait
+        self.error = error
+        self.snippet = snippet
+
+    def get_name(self):
+        return self.name
+
+    def get_snippet(self, cliargs):
+        return self.snippet
+
+    def precondition_environment(self, cliargs):
+        self.calls.append(('precondition', self.name))
+
+    def validate_environment(self, cliargs):
+        self.calls.append(('validate', self.name))
+        if self.wait is not None:
+            self.wait()
+        if isinstance(self.error, Exception):
+            raise self.error
+        if self.error is not None:
+            raise ValidateError(self.error)
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class LaunchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+        set_docker_client(self.docker_client)
+        self.calls = []
+        # the build streams its first step, the rest only once the gate is set (or after a timeout)
+        self.build_started = threading.Event()
+        self.build_released = threading.Event()
+        self.build_gate = self.build_released
+        self.build_steps = []
+        self.build_waits = []
+        self.daemon.gates['build_step'] = self.build_step
+
+    def tearDown(self):
+        self.build_released.set()
+        set_docker_client(None)
+        self.daemon.stop()
+
+    def build_step(self):
+        self.build_steps.append(True)
+        self.build_started.set()
+        if len(self.build_steps) > 1 and not self.build_gate.is_set():
+            self.build_waits.append(self.build_gate.wait(10.0))
+
+    def release_build(self):
+        """A hook's wait: until the build is underway, then let it continue."""
+        self.build_waits.append(self.build_started.wait(10.0))
+        self.build_released.set()
+
+    def launch(self, extensions, until_cancelled=False):
+        """Launch, optionally holding the build after its first step until it is cancelled."""
+        self.generator = DockerImageGenerator(extensions, {}, 'ubuntu:18.04', docker_client=self.docker_client)
+        build = self.generator.build
+        check_environment = self.generator.check_environment
+
+        def build_until_cancelled(cancelled=None, **kwargs):
+            self.build_gate = cancelled
+            return build(cancelled=cancelled, **kwargs)
+
+        def check_environment_recording_cancel(cancelled=None):
+            self.build_failed = cancelled
+            return check_environment(cancelled=cancelled)
+
+        with unittest.mock.patch.object(console, 'error') as error, \
+                unittest.mock.patch.object(console, 'warning') as self.warning, \
+                unittest.mock.patch.object(self.generator, 'build', build_until_cancelled if until_cancelled else build), \
+                unittest.mock.patch.object(self.generator, 'check_environment', check_environment_recording_cancel), \
+                unittest.mock.patch('builtins.print'):
+            exit_code = self.generator.launch('true', verbose=False, mode='non-interactive', runner='sdk')
+        return exit_code, [call.args[0] for call in error.call_args_list]
+
+    def assert_cancelled(self):
+        self.assertEqual(self.build_waits, [True] * len(self.build_waits))
+        self.assertIn(unittest.mock.call("Docker build cancelled"), self.warning.call_args_list)
+        self.assertFalse(self.generator.built)
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 0)
+
+    def test_overlap(self):
+        exit_code, errors = self.launch([
+            Hooks('a', self.calls, wait=self.release_build, snippet='RUN make a'), Hooks('b', self.calls)
+        ])
+        self.assertEqual((exit_code, errors), (0, []))
+        # the hook ran once the build had started and the build only finished once the hook had run
+        self.assertEqual(self.build_waits, [True] * len(self.build_waits))
+        self.assertEqual(self.calls, [('precondition', 'a'), ('precondition', 'b'), ('validate', 'a'), ('validate', 'b')])
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 1)
+
+    def test_validation_failure(self):
+        exit_code, errors = self.launch(
+            [Hooks('a', self.calls, wait=self.release_build, error='no gpu', snippet='RUN make a')], until_cancelled=True
+        )
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(errors, ["Failed to validate environment for extension 'a' [no gpu]"])
+        self.assert_cancelled()
+
+    def test_build_failure(self):
+        self.daemon.exit_codes['make a'] = 2
+        self.build_released.set()
+
+        def until_the_build_failed():
+            self.build_waits.append(self.build_failed.wait(10.0))
+
+        exit_code, errors = self.launch([
+            Hooks('a', self.calls, wait=until_the_build_failed, error='no gpu', snippet='RUN make a'), Hooks('b', self.calls)
+        ])
+        self.assertEqual(self.build_waits, [True])
+        self.assertNotEqual(exit_code, 0)
+        self.assertEqual(errors, ["Build failed exiting", "Failed to validate environment for extension 'a' [no gpu]"])
+        self.assertNotIn(('validate', 'b'), self.calls)  # stopped after the build failed
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 0)
+
+    def test_hook_exception(self):
+        with self.assertRaises(KeyError):
+            self.launch(
+                [Hooks('a', self.calls, wait=self.release_build, error=KeyError('gpu'), snippet='RUN make a')], until_cancelled=True
+            )
+        self.assert_cancelled()
+
+
+class BuildTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+
+    def tearDown(self):
+        self.daemon.stop()
+
+    def build(self, base_image, docker_client=None):
+        generator = DockerImageGenerator([], {}, base_image, docker_client=docker_client or self.docker_client)
+        with unittest.mock.patch.object(console, 'error') as error:
+            exit_code = generator.build(verbose=False)
+        return generator, exit_code, [call.args[0] for call in error.call_args_list]
+
+    def test_base_not_pulled(self):
+        generator, exit_code, errors = self.build('ubuntu:20.04')
+        self.assertEqual((exit_code, errors), (0, []))
+        self.assertEqual(self.daemon.count('POST', r'/images/create'), 1)  # pulled before keying
+        base_image_id = self.docker_client.inspect_image('ubuntu:20.04')['Id']
+        self.assertEqual(generator.image_key, compute_image_key(generator.dockerfile, generator.files, base_image_id))
+        generator, exit_code, errors = self.build('ubuntu:20.04')
+        self.assertEqual((exit_code, generator.cache_hit), (0, True))
+        self.assertEqual(self.daemon.count('POST', r'/build'), 1)
+
+    def test_unreachable_daemon(self):
+        with tempfile.TemporaryDirectory() as directory:
+            docker_client = docker.APIClient(base_url='unix://' + os.path.join(directory, 'missing.sock'), version=fake_docker.API_VERSION)
+            generator, exit_code, errors = self.build('ubuntu:18.04', docker_client)
+        self.assertEqual(exit_code, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("Docker build failed ["))
+        self.assertFalse(generator.built)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import gzip
+import os
+import random
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from groot_rocker.cli import load_arguments
+from groot_rocker.core import DockerImageGenerator
+from groot_rocker.core import set_docker_client
+from groot_rocker.logs import capture_stream
+from groot_rocker.logs import LogCapture
+from groot_rocker.logs import MAX_LINE_LENGTH
+from groot_rocker.logs import parse_size
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class LogCaptureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'logs', 'run.log')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_size(self):
+        self.assertEqual([parse_size(s) for s in ['512', '64K', '100M', '2g', '1.5MiB', 0]], [512, 65536, 100 << 20, 2 << 30, 3 << 19, 0])
+        self.assertEqual(load_arguments(['--log-max-bytes', '64M', 'ubuntu:18.04'])['log_max_bytes'], 64 << 20)
+
+    def test_tail(self):
+        generator = random.Random(0)
+        lines = [('line %d ' % i + 'x' * generator.randint(0, 200)).encode() for i in range(5000)]
+        data = b'\n'.join(lines)  # no trailing newline
+        capture = LogCapture(tail=10)
+        position = 0
+        while position < len(data):
+            size = generator.choice([1, 7, 100, 4096, 100000])
+            capture.write(data[position:position + size])
+            position += size
+        self.assertEqual(capture.tail(), [line.decode() for line in lines[-10:]])
+        self.assertEqual(capture.bytes_written, len(data))
+        self.assertEqual(LogCapture(tail=0).tail(), [])
+
+    def test_long_lines(self):
+        capture = LogCapture(tail=3)
+        capture.write(b'first\n' + b'x' * (4 * MAX_LINE_LENGTH) + b'\nlast\npartial')  # e.g. a minified line
+        self.assertEqual([len(line) for line in capture._lines], [len('first'), MAX_LINE_LENGTH, len('last')])
+        self.assertEqual(capture.tail(), ['x' * MAX_LINE_LENGTH, 'last', 'partial'])
+
+    def test_rotation(self):
+        with LogCapture(self.path, max_bytes=100, backups=2) as capture:
+            for i in range(10):
+                capture.write(b'%d' % i * 40)
+        self.assertEqual(capture.files(), [self.path, self.path + '.1', self.path + '.2'])
+        contents = []
+        for path in capture.files():
+            with open(path, 'rb') as stream:
+                contents.append(stream.read())
+        self.assertEqual(contents, [b'8' * 40 + b'9' * 40, b'6' * 40 + b'7' * 40, b'4' * 40 + b'5' * 40])
+
+    def test_compression(self):
+        with LogCapture(self.path, max_bytes=1000, backups=3, compress=True) as capture:
+            for i in range(10):
+                capture.write(b'%d\n' % i * 400)
+        self.assertEqual(capture.files(), [self.path, self.path + '.1.gz', self.path + '.2.gz', self.path + '.3.gz'])
+        with gzip.open(self.path + '.3.gz', 'rb') as stream:
+            self.assertEqual(stream.read(), b'6\n' * 400)
+        self.assertEqual(capture.tail()[-1], '9')
+
+    def test_capture_stream(self):
+        read_fd, write_fd = os.pipe()
+        data = b'hello world\n' * 100000
+
+        def writer():
+            with os.fdopen(write_fd, 'wb') as stream:
+                stream.write(data)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        with LogCapture(self.path, max_bytes=0) as capture:
+            capture_stream(read_fd, capture, buffer_size=65536)
+        thread.join()
+        os.close(read_fd)
+        with open(self.path, 'rb') as stream:
+            self.assertEqual(stream.read(), data)
+        self.assertEqual(capture.tail(), ['hello world'] * 100)
+
+
+class LogRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+        set_docker_client(self.docker_client)
+
+    def tearDown(self):
+        set_docker_client(None)
+        self.daemon.stop()
+        self.directory.cleanup()
+
+    def test_sdk_run(self):
+        path = os.path.join(self.directory.name, 'run.log')
+        self.daemon.outputs['make'] = b''.join(b'line %d\n' % i for i in range(1000))
+        self.daemon.exit_codes['make'] = 2
+        generator = DockerImageGenerator([], {}, 'ubuntu:18.04', docker_client=self.docker_client)
+        self.assertEqual(generator.build(verbose=False), 0)
+        with unittest.mock.patch('builtins.print') as printed:
+            exit_code = generator.run('make', mode='non-interactive', runner='sdk', log_file=path, log_tail=3)
+        self.assertEqual(exit_code, 2)
+        with open(path, 'rb') as stream:
+            self.assertEqual(stream.read(), self.daemon.outputs['make'])
+        printed_lines = [str(call.args[0]) if call.args else '' for call in printed.call_args_list]
+        self.assertEqual(printed_lines[-3:], ['  line 997', '  line 998', '  line 999'])
+
+
+if __name__ == '__main__':
+    unittest.main()
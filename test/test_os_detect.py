@@ -16,10 +16,20 @@
 # under the License.
 
 import docker
+import os
+import tempfile
 import unittest
+import unittest.mock
 
+from groot_rocker import os_detector
+from groot_rocker.cache import PersistentLRUCache
 
 from groot_rocker.os_detector import detect_os
+from groot_rocker.os_detector import detect_os_batch
+from groot_rocker.os_detector import os_release_to_distro
+from groot_rocker.os_detector import parse_os_release
+
+from .fake_docker import FakeDockerDaemon
 
 class RockerOSDetectorTest(unittest.TestCase):
 
@@ -42,6 +52,12 @@ class RockerOSDetectorTest(unittest.TestCase):
         self.assertEqual(result[0], 'Ubuntu')
         self.assertEqual(result[1], '20.04')
 
+    def test_batch(self):
+        results = {image: (result, error) for image, result, error in detect_os_batch(["ubuntu:bionic", "fedora:29", "osrf/ros:does_not_exist"])}
+        self.assertEqual(results["ubuntu:bionic"][0][1], '18.04')
+        self.assertEqual(results["fedora:29"][0][1], '29')
+        self.assertEqual(results["osrf/ros:does_not_exist"][0], None)
+
     def test_fedora(self):
         result = detect_os("fedora:29")
         self.assertEqual(result[0], 'Fedora')
@@ -55,3 +71,49 @@ class RockerOSDetectorTest(unittest.TestCase):
         # Test with output callback too get coverage of error reporting
         result = detect_os("scratch", output_callback=print)
         self.assertEqual(result, None)
+
+
+class OSReleaseTest(unittest.TestCase):
+
+    def test_ubuntu(self):
+        info = parse_os_release("""NAME="Ubuntu"
+VERSION="18.04.5 LTS (Bionic Beaver)"
+ID=ubuntu
+ID_LIKE=debian
+PRETTY_NAME="Ubuntu 18.04.5 LTS"
+VERSION_ID="18.04"
+# comments and blank lines are ignored
+
+VERSION_CODENAME=bionic
+UBUNTU_CODENAME=bionic
+""")
+        self.assertEqual(info['ID_LIKE'], 'debian')
+        self.assertEqual(os_release_to_distro(info), ('Ubuntu', '18.04', 'bionic'))
+
+    def test_codename_from_version(self):
+        info = parse_os_release('NAME="Ubuntu"\nVERSION="14.04.6 LTS, Trusty Tahr"\nVERSION_ID="14.04"\n')
+        self.assertEqual(os_release_to_distro(info), ('Ubuntu', '14.04', 'Trusty Tahr'))
+        info = parse_os_release("NAME=Fedora\nVERSION='29 (Container Image)'\nVERSION_ID=29\n")
+        self.assertEqual(os_release_to_distro(info), ('Fedora', '29', 'Container Image'))
+
+    def test_no_name(self):
+        self.assertIsNone(os_release_to_distro(parse_os_release('ID=foo\n')))
+
+
+class DetectorImageTest(unittest.TestCase):
+
+    def test_detector_is_copied(self):
+        binary = b'\x7fELF detector'
+        with tempfile.TemporaryDirectory() as directory, \
+                FakeDockerDaemon(files={os_detector.DETECTOR_BINARY: binary.decode()}) as daemon, \
+                unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': directory}), \
+                unittest.mock.patch.object(os_detector, '_detect_os_cache', {}), \
+                unittest.mock.patch.object(os_detector, '_detect_os_disk_cache', PersistentLRUCache('os_detect', directory=directory)):
+            daemon.add_image('alpine:3.14')
+            daemon.outputs[os_detector.DETECTOR_PATH] = b"('Alpine Linux', '3.14.0', '')\n"
+            result = detect_os('alpine:3.14', docker_client=daemon.client())
+            self.assertEqual(result, ('Alpine Linux', '3.14.0', ''))
+            self.assertEqual(daemon.count('POST', r'/build'), 1)
+            self.assertEqual(daemon.count('PUT', r'/containers/.+/archive'), 1)
+            self.assertEqual(list(daemon.uploads.values()), [{os_detector.DETECTOR_PATH: (0o755, binary)}])
+            self.assertEqual(daemon.containers, {})
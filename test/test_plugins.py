@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import argparse
+import tempfile
+import unittest
+
+from groot_rocker.cache import PersistentLRUCache
+from groot_rocker.core import RockerExtension
+from groot_rocker.plugins import PluginRegistry
+
+##############################################################################
+# Helpers
+##############################################################################
+
+
+class Replayable(RockerExtension):
+    @classmethod
+    def get_name(cls):
+        return 'replayable'
+
+    @staticmethod
+    def desired_extensions():
+        return {'grouped'}
+
+    @staticmethod
+    def register_arguments(parser, defaults={}):
+        parser.add_argument('--replayable', type=int, nargs='*', default=defaults.get('replayable', [1]), help="replay me")
+
+
+class Grouped(RockerExtension):
+    @classmethod
+    def get_name(cls):
+        return 'grouped'
+
+    @classmethod
+    def check_args_for_activation(cls, cli_args):
+        return cli_args.get('grouped_a') or cli_args.get('grouped_b')
+
+    @staticmethod
+    def register_arguments(parser, defaults={}):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--grouped-a', action='store_true', default=defaults.get('grouped_a', False))
+        group.add_argument('--grouped-b', action='store_true', default=defaults.get('grouped_b', False))
+
+
+class Computed(RockerExtension):
+    @classmethod
+    def get_name(cls):
+        return 'computed'
+
+    @staticmethod
+    def register_arguments(parser, defaults={}):
+        parser.add_argument('--computed-list', nargs='*', default=defaults.get('computed_list') or [])
+        parser.add_argument('--computed-help', help="(default: %s)" % defaults.get('computed_help', 'x'))
+
+
+class EntryPoint(object):
+    def __init__(self, cls):
+        self.cls = cls
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.cls
+
+
+def create_registry(directory, entry_points):
+    registry = PluginRegistry(index_cache=PersistentLRUCache('plugins', directory=directory))
+    registry.entry_points = entry_points
+    registry.fingerprint = 'test'
+    return registry
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class PluginRegistryTestCase(unittest.TestCase):
+
+    def test_builtin_plugins(self):
+        with tempfile.TemporaryDirectory() as td:
+            registry = PluginRegistry(index_cache=PersistentLRUCache('plugins', directory=td))
+            self.assertIn('home', registry.names())
+            self.assertEqual(registry.load('home').get_name(), 'home')
+            self.assertEqual(list(registry.load_all().keys()), sorted(registry.names()))
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as td:
+            create_registry(td, {'grouped': EntryPoint(Grouped), 'replayable': EntryPoint(Replayable)}).index  # warm the index
+            entry_points = {'grouped': EntryPoint(Grouped), 'replayable': EntryPoint(Replayable)}
+            registry = create_registry(td, entry_points)
+
+            parser = argparse.ArgumentParser()
+            registry.register_arguments(parser, {'replayable': [2, 3]})
+            self.assertEqual(entry_points['replayable'].loads, 0)  # replayed from the index
+            self.assertEqual(entry_points['grouped'].loads, 1)  # not replayable, registered live
+            self.assertIn('replay me', parser.format_help())
+            args = vars(parser.parse_args([]))
+            self.assertEqual(args['replayable'], [2, 3])
+            args = vars(parser.parse_args(['--replayable', '4', '--grouped-a']))
+            self.assertEqual(args['replayable'], [4])
+
+            self.assertTrue(registry.check_args_for_activation('replayable', args))
+            self.assertTrue(registry.check_args_for_activation('grouped', args))
+            self.assertEqual(entry_points['replayable'].loads, 0)
+            self.assertEqual(registry.index['replayable']['desired_extensions'], ['grouped'])
+
+    def test_computed_defaults(self):
+        with tempfile.TemporaryDirectory() as td:
+            create_registry(td, {'computed': EntryPoint(Computed)}).index  # warm the index
+            entry_points = {'computed': EntryPoint(Computed)}
+            registry = create_registry(td, entry_points)
+            self.assertIsNone(registry.index['computed']['arguments'])  # not replayable
+            parser = argparse.ArgumentParser()
+            registry.register_arguments(parser, {'computed_help': 'y'})
+            self.assertEqual(entry_points['computed'].loads, 1)  # registered live
+            self.assertEqual(vars(parser.parse_args([]))['computed_list'], [])
+            self.assertIn('(default: y)', parser.format_help())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import io
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from groot_rocker import pool
+from groot_rocker.cache import PersistentLRUCache
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class ContainerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.usage = unittest.mock.patch.object(pool, '_usage', PersistentLRUCache('pool', directory=self.directory.name))
+        self.usage.start()
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+        self.image_id = self.docker_client.inspect_image('ubuntu:18.04')['Id']
+
+    def tearDown(self):
+        self.daemon.stop()
+        self.usage.stop()
+        self.directory.cleanup()
+
+    def add_container(self, container_pool, running=True):
+        """Stand in for a container started by ContainerPool.warm() (via the docker cli)."""
+        return self.daemon.add_container('ubuntu:18.04', running=running, labels={
+            pool.POOL_LABEL: container_pool.key,
+            pool.POOL_MAX_USES_LABEL: str(container_pool.max_uses),
+            pool.POOL_IDLE_TTL_LABEL: str(container_pool.idle_ttl),
+        })
+
+    def test_pool_key(self):
+        self.assertEqual(pool.pool_key('sha256:1', ' -e FOO=bar '), pool.pool_key('sha256:1', '-e  FOO=bar'))
+        self.assertNotEqual(pool.pool_key('sha256:1', '-e FOO=bar'), pool.pool_key('sha256:2', '-e FOO=bar'))
+        self.assertNotEqual(pool.pool_key('sha256:1', '-e FOO=bar'), pool.pool_key('sha256:1', '-e FOO=baz'))
+        self.assertEqual(pool.pool_docker_args(' --name foo --network host -e "A=b c"'), "--network host -e 'A=b c'")
+
+    def test_run(self):
+        container_pool = pool.ContainerPool(self.image_id, ' --network host ', size=2, docker_client=self.docker_client)
+        first = self.add_container(container_pool)
+        second = self.add_container(container_pool)
+        self.add_container(pool.ContainerPool(self.image_id, '', docker_client=self.docker_client))  # another pool
+        self.daemon.exit_codes['false'] = 1
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with unittest.mock.patch('sys.stdout', stdout):
+            self.assertEqual(container_pool.run('echo hello'), 0)
+            self.assertEqual(container_pool.run(['false']), 1)
+            self.assertEqual(container_pool.run(), 0)  # the image's command
+        stdout.seek(0)
+        self.assertEqual(stdout.buffer.getvalue(), b'output of echo hello\noutput of false\noutput of bash\n')
+        # commands are spread over the least used containers
+        self.assertEqual(pool._usage.get(first)['uses'] + pool._usage.get(second)['uses'], 3)
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 0)
+        unknown = {'Running': True, 'ExitCode': None}
+        with unittest.mock.patch('sys.stdout', io.TextIOWrapper(io.BytesIO())), \
+                unittest.mock.patch.object(self.docker_client, 'exec_inspect', return_value=unknown):
+            self.assertEqual(container_pool.run('true'), 1)  # not a success
+
+    def test_entrypoint(self):
+        image_id = self.daemon.add_image('ros:noetic', entrypoint=['/ros_entrypoint.sh'])
+        container_pool = pool.ContainerPool(image_id, docker_client=self.docker_client)
+        self.add_container(container_pool)
+        with unittest.mock.patch('sys.stdout', io.TextIOWrapper(io.BytesIO())):
+            self.assertEqual(container_pool.run('rostopic list'), 0)
+            self.assertEqual(container_pool.run(), 0)
+        self.assertEqual([e['Config']['Cmd'] for e in self.daemon.execs.values()], [
+            ['/ros_entrypoint.sh', 'rostopic', 'list'], ['/ros_entrypoint.sh', 'bash']
+        ])
+        self.assertEqual(self.daemon.count('GET', r'/images/.+/json'), 2)  # once per pool, + setUp
+
+    def test_recycle(self):
+        container_pool = pool.ContainerPool(self.image_id, size=1, max_uses=2, idle_ttl=60, docker_client=self.docker_client)
+        container = self.add_container(container_pool)
+        exited = self.add_container(container_pool, running=False)
+        self.assertEqual(container_pool.containers(), [container])
+        for unused_i in range(2):
+            self.assertEqual(container_pool.acquire(), container)
+        self.assertEqual(sorted(pool.prune(self.docker_client)), sorted([container, exited]))
+        self.assertEqual(container_pool.containers(), [])
+        self.assertNotIn(container, pool._usage)
+
+    def test_idle(self):
+        container_pool = pool.ContainerPool(self.image_id, size=1, idle_ttl=60, docker_client=self.docker_client)
+        container = self.add_container(container_pool)
+        container_pool.acquire()
+        self.assertEqual(pool.prune(self.docker_client, now=time.time() + 30), [])
+        self.assertEqual(pool.prune(self.docker_client, now=time.time() + 90), [container])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import io
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from groot_rocker.core import docker_sdk_run
+from groot_rocker.core import docker_sdk_start
+from groot_rocker.core import DockerImageGenerator
+from groot_rocker.core import find_resumable_container
+from groot_rocker.core import IMAGE_KEY_LABEL
+from groot_rocker.core import ResumeError
+from groot_rocker.core import set_docker_client
+from groot_rocker.extensions import ContainerName, HomeDir, Network
+from groot_rocker.run_options import parse_docker_args
+from groot_rocker.run_options import RunOptions
+from groot_rocker.run_options import UnsupportedRunOption
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class RunOptionsTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        os.environ['GROOT_ROCKER_TEST_VARIABLE'] = 'foo'
+        options = parse_docker_args(
+            " --name bar -v /tmp:/tmp:ro -v /cache --network=host -e A='b c' -e GROOT_ROCKER_TEST_VARIABLE"
+            " -e GROOT_ROCKER_UNSET_VARIABLE --privileged --device /dev/dri -p 8080:80 --cap-add SYS_PTRACE"
+        )
+        self.assertEqual(options.container, {'name': 'bar', 'environment': ['A=b c', 'GROOT_ROCKER_TEST_VARIABLE=foo']})
+        self.assertEqual(options.host, {
+            'binds': ['/tmp:/tmp:ro', '/cache'], 'network_mode': 'host', 'privileged': True,
+            'devices': ['/dev/dri'], 'port_bindings': {'80/tcp': '8080'}, 'cap_add': ['SYS_PTRACE']
+        })
+        with tempfile.NamedTemporaryFile('w', suffix='.env') as env_file:
+            env_file.write("# comment\nFOO=bar\n\nBAR=baz\n")
+            env_file.flush()
+            self.assertEqual(parse_docker_args('--env-file ' + env_file.name).container['environment'], ['FOO=bar', 'BAR=baz'])
+        for unsupported in ['--ulimit nofile=1024', '-it', '--network']:
+            with self.assertRaises(UnsupportedRunOption):
+                parse_docker_args(unsupported)
+
+    def test_merge(self):
+        options = RunOptions(container={'environment': ['A=1']}, host={'binds': ['/a:/a'], 'network_mode': 'bridge'})
+        options.merge(RunOptions(container={'environment': ['B=2'], 'labels': {'a': 'b'}}, host={'network_mode': 'host'}))
+        options.merge(RunOptions(container={'labels': {'c': 'd'}}))
+        self.assertEqual(options, RunOptions(
+            container={'environment': ['A=1', 'B=2'], 'labels': {'a': 'b', 'c': 'd'}},
+            host={'binds': ['/a:/a'], 'network_mode': 'host'}
+        ))
+
+    def test_extensions(self):
+        # the structured options match what the docker args parse to
+        cliargs = {'container_name': 'foo', 'network': 'host'}
+        for extension in [ContainerName(), HomeDir(), Network()]:
+            self.assertEqual(
+                extension.get_run_options(cliargs),
+                parse_docker_args(extension.get_docker_args(cliargs)),
+                extension.get_name()
+            )
+        self.assertEqual(HomeDir().get_run_options({}).host['binds'], ['%s:%s' % (Path.home(), Path.home())])
+
+
+class SDKRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+        set_docker_client(self.docker_client)
+
+    def tearDown(self):
+        set_docker_client(None)
+        self.daemon.stop()
+
+    def test_run(self):
+        output = io.BytesIO()
+        options = parse_docker_args('--network host -e FOO=bar -v /tmp:/tmp')
+        self.daemon.exit_codes['false'] = 1
+        self.assertEqual(docker_sdk_run(self.docker_client, 'ubuntu:18.04', ['echo', 'hello'], options, output=output), 0)
+        self.assertEqual(output.getvalue(), b'output of echo hello\n')
+        self.assertEqual(docker_sdk_run(self.docker_client, 'ubuntu:18.04', ['false'], options), 1)
+        self.assertEqual(self.daemon.containers, {})  # removed
+        self.assertEqual(docker_sdk_run(self.docker_client, 'ubuntu:18.04', ['true'], options, remove=False), 0)
+        container, = self.daemon.containers.values()
+        self.assertEqual(container['Config']['Env'], ['FOO=bar'])
+        self.assertEqual(container['Config']['HostConfig']['NetworkMode'], 'host')
+        self.assertEqual(container['Config']['HostConfig']['Binds'], ['/tmp:/tmp'])
+
+    def test_generator(self):
+        generator = DockerImageGenerator([Network()], {'network': 'host'}, 'ubuntu:18.04', docker_client=self.docker_client)
+        self.assertEqual(generator.build(verbose=False), 0)
+        self.assertEqual(generator.run('true', mode='non-interactive', runner='sdk'), 0)
+        self.assertEqual(generator.run('true', mode='dry-run', runner='sdk'), 0)
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 1)
+
+    def test_resume(self):
+        generator = DockerImageGenerator([ContainerName()], {'container_name': 'dev'}, 'ubuntu:18.04', docker_client=self.docker_client)
+        self.assertEqual(generator.build(verbose=False), 0)
+        self.assertIn('--label %s=%s' % (IMAGE_KEY_LABEL, generator.image_key), generator.generate_docker_cmd('make', persistent=True))
+        self.daemon.exit_codes['make'] = 2
+        options = {'mode': 'non-interactive', 'runner': 'sdk', 'container_name': 'dev', 'resume': True}
+        self.assertEqual(generator.run('make', **options), 2)
+        container, = self.daemon.containers.values()
+        self.assertEqual(container['Config']['Labels'], {IMAGE_KEY_LABEL: generator.image_key})
+        for unused_i in range(3):
+            self.assertEqual(generator.run('make', **options), 2)
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 1)
+        self.assertEqual(self.daemon.count('POST', r'/containers/[^/]+/start'), 4)
+        self.assertEqual(generator.run('make', **dict(options, mode='dry-run')), 0)
+        output = io.BytesIO()
+        self.assertEqual(docker_sdk_start(self.docker_client, container['Id'], output=output), 2)
+        self.assertEqual(output.getvalue(), b'output of make\n')
+        self.assertEqual(generator.run('make', **dict(options, container_name=None)), 1)
+        # not resumable
+        self.daemon.add_container('ubuntu:18.04', running=False, name='other')
+        self.assertEqual(generator.run('make', **dict(options, container_name='other')), 1)
+        self.daemon.add_container('ubuntu:18.04', labels={IMAGE_KEY_LABEL: generator.image_key}, name='running')
+        with self.assertRaises(ResumeError):
+            find_resumable_container(self.docker_client, 'running', generator.image_key)
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import socket
+import stat
+import subprocess
+import tempfile
+import unittest
+import unittest.mock
+
+from groot_rocker import client
+from groot_rocker import server
+
+from .fake_docker import FakeDockerDaemon
+from .utilities import GROOT_ROCKER
+from .utilities import start_server
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class ServerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.daemon = FakeDockerDaemon()
+        cls.daemon.start()
+        cls.environment = cls.daemon.environment()
+        cls.environment['XDG_CACHE_HOME'] = cls.directory.name
+        cls.environment['GROOT_ROCKER_SOCKET'] = os.path.join(cls.directory.name, 'server.sock')
+        cls.server = start_server(cls.environment)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.daemon.stop()
+        cls.directory.cleanup()
+
+    def groot_rocker(self, *args):
+        return subprocess.run(
+            GROOT_ROCKER + list(args), env=self.environment, cwd=self.directory.name,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+
+    def test_served(self):
+        pings = self.daemon.count('GET', r'/_ping')
+        result = self.groot_rocker('--mode', 'dry-run', '--network', 'host', 'ubuntu:18.04', 'true')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('docker run --rm -it --network host', result.stdout)
+        self.assertEqual(self.daemon.count('GET', r'/_ping'), pings)  # connected, but no handshake
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'trace.json')))
+        result = self.groot_rocker('--trace', 'trace.json', '--mode', 'dry-run', 'ubuntu:18.04', 'true')
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'trace.json')))  # relative to the client
+
+    def test_exit_codes(self):
+        result = self.groot_rocker('--version')
+        self.assertEqual(result.returncode, 0)
+        self.assertRegex(result.stdout, r'^groot-rocker \d+\.\d+\.\d+')
+        result = self.groot_rocker('--mode', 'foo', 'ubuntu:18.04')
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("invalid choice: 'foo'", result.stderr)
+
+    def test_fallback(self):
+        environment = dict(self.environment, GROOT_ROCKER_SOCKET=os.path.join(self.directory.name, 'missing.sock'))
+        result = subprocess.run(GROOT_ROCKER + ['--version'], env=environment, stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertRegex(result.stdout, r'\d+\.\d+\.\d+')
+
+
+class SocketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'server.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def connect(self):
+        with unittest.mock.patch('builtins.print'):
+            connection = client.connect(self.path)
+        if connection is not None:
+            connection.close()
+        return connection is not None
+
+    def test_private(self):
+        listener = server.Server(self.path)
+        listener.listen()
+        try:
+            self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode) & 0o077, 0)  # private from the start
+            self.assertTrue(self.connect())
+            with unittest.mock.patch.object(client, 'peer_uid', return_value=os.getuid() + 1):
+                self.assertFalse(self.connect())  # served by another user
+        finally:
+            listener.close()
+
+    def test_refused(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(self.path)
+            listener.listen(1)
+            os.chmod(self.path, 0o666)
+            self.assertFalse(self.connect())  # not private
+            os.chmod(self.path, 0o600)
+            self.assertTrue(self.connect())
+            if os.getuid() == 0:
+                os.chown(self.path, 65534, -1)
+                self.assertFalse(self.connect())  # owned by another user
+
+    def test_no_runtime_directory(self):
+        environment = {k: v for k, v in os.environ.items() if k not in ['GROOT_ROCKER_SOCKET', 'XDG_RUNTIME_DIR']}
+        with unittest.mock.patch.dict(os.environ, environment, clear=True):
+            self.assertIsNone(client.default_socket_path())
+            self.assertIsNone(client.connect())
+
+
+if __name__ == '__main__':
+    unittest.main()
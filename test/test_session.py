@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from groot_rocker import cli
+from groot_rocker.core import set_docker_client
+from groot_rocker.session import Session
+
+from .fake_docker import FakeDockerDaemon
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = os.path.join(self.directory.name, 'job.yaml')
+        with open(self.config, 'w') as stream:
+            stream.write("image: ubuntu:18.04\nnetwork: host\nmode: non-interactive\nrunner: sdk\ncommand: make all\n")
+        self.daemon = FakeDockerDaemon()
+        self.daemon.start()
+        self.docker_client = self.daemon.client()
+        set_docker_client(self.docker_client)
+        self.session = Session(docker_client=self.docker_client)
+
+    def tearDown(self):
+        set_docker_client(None)
+        self.daemon.stop()
+        self.directory.cleanup()
+
+    def test_options(self):
+        options = self.session.options(self.config)
+        self.assertIs(self.session.options(self.config), options)  # parsed once
+        self.assertEqual((options['image'], options['network'], options['command']), ('ubuntu:18.04', 'host', 'make all'))
+        with self.assertRaises(TypeError):
+            options['network'] = 'bridge'
+        overridden = self.session.options(self.config, container_name='foo')
+        self.assertEqual((overridden['container_name'], options['container_name']), ('foo', None))
+        with self.assertRaises(TypeError):
+            self.session.options(self.config, no_such_option=True)
+        self.assertEqual(self.session.options(self.config, ['--env', 'FOO=bar'])['env'], [['FOO=bar']])
+        with open(self.config, 'a') as stream:
+            stream.write("nocache: true\n")
+        self.assertTrue(self.session.options(self.config)['nocache'])  # reparsed
+
+    def test_plan(self):
+        plan = self.session.plan(self.config)
+        self.assertIs(self.session.plan(self.config), plan)
+        self.assertEqual([e.get_name() for e in plan.active_extensions], ['network'])
+        other = self.session.plan(self.config, nocache=True)
+        self.assertIsNot(other, plan)
+        self.assertEqual(other.image_key, plan.image_key)
+        self.assertEqual(self.session.plan(self.config, container_name='foo').image_key, plan.image_key)  # run only
+        options = dict(cli.load_arguments(['ubuntu:18.04']))
+        original = dict(options)
+        self.assertEqual(self.session.plan(options, network='host').image_key, plan.image_key)
+        self.assertEqual(options, original)
+
+    def test_launch(self):
+        for index in range(20):
+            self.assertEqual(self.session.launch(self.config, container_name='job%d' % index), 0)
+        self.assertEqual(self.session.launch(self.config, env=[['FOO=bar']], network='bridge'), 0)
+        self.assertEqual(self.daemon.count('POST', r'/build'), 1)
+        self.assertEqual(self.daemon.count('GET', r'/images/json'), 1)  # looked up in the image cache once
+        self.daemon.requests.clear()
+        self.assertEqual(Session(docker_client=self.docker_client).launch(self.config, env=[['FOO=baz']]), 0)
+        self.assertEqual(self.daemon.count('POST', r'/build'), 0)  # only run options changed, the image is cached
+        self.assertEqual(self.daemon.count('POST', r'/containers/create'), 1)
+        self.assertEqual(self.daemon.count('GET', r'/_ping'), 0)
+        self.daemon.exit_codes['false'] = 3
+        plan = self.session.plan(self.config, container_name='job0')
+        with unittest.mock.patch('builtins.print'):
+            self.assertEqual(self.session.run(plan, command='false'), 3)
+        with unittest.mock.patch('builtins.print') as printed:
+            self.assertEqual(self.session.run(plan, mode='dry-run', runner='cli', network='bridge', container_name='foo'), 0)
+        docker_cmd = [call.args[0] for call in printed.call_args_list if call.args and str(call.args[0]).startswith('docker run')][0]
+        self.assertIn('--network bridge', docker_cmd)
+        self.assertIn('--name foo', docker_cmd)
+        with self.assertRaises(TypeError):
+            self.session.run(plan, no_such_option=True)
+        with self.assertRaises(TypeError):
+            self.session.build(plan, network='bridge')
+
+
+if __name__ == '__main__':
+    unittest.main()
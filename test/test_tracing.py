@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# License: BSD
+#   https://raw.githubusercontent.com/stonier/groot_rocker/devel/LICENSE
+#
+
+##############################################################################
+# Imports
+##############################################################################
+
+import json
+import os
+import tempfile
+import unittest
+
+import groot_rocker
+from groot_rocker import tracing
+
+##############################################################################
+# Tests
+##############################################################################
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.disable()
+
+    def test_disabled(self):
+        with tracing.span('foo'):
+            pass
+        self.assertIsNone(tracing.get_tracer())
+
+    def test_spans(self):
+        tracer = tracing.enable()
+        with tracing.span('outer'):
+            with tracing.span('inner', 'extension', extension='foo'):
+                pass
+            with tracing.span('inner', 'extension', extension='bar'):
+                pass
+        names = [e['name'] for e in tracer.events]
+        self.assertEqual(names, ['inner', 'inner', 'outer'])
+        outer = tracer.events[-1]
+        for inner in tracer.events[:2]:
+            self.assertGreaterEqual(inner['ts'], outer['ts'])
+            self.assertLessEqual(inner['ts'] + inner['dur'], outer['ts'] + outer['dur'])
+        self.assertEqual(tracer.events[0]['args'], {'extension': 'foo'})
+        summary = {row[0]: row for row in tracer.summary()}
+        self.assertEqual(summary['inner'][1], 2)
+        self.assertEqual(summary['outer'][1], 1)
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, 'trace.json')
+            tracing.finish(path)
+            with open(path) as fh:
+                self.assertEqual(len(json.load(fh)['traceEvents']), 3)
+        self.assertIsNone(tracing.get_tracer())
+
+    def test_load_arguments(self):
+        options = groot_rocker.cli.load_arguments(['--trace', 'trace.json', 'ubuntu:18.04'])
+        self.assertEqual(options['trace'], 'trace.json')
+        names = [e['name'] for e in tracing.get_tracer().events]
+        for name in ['extend_cli_parser', 'parse_args', 'load_arguments']:
+            self.assertIn(name, names)
@@ -9,7 +9,18 @@
 # Imports
 ##############################################################################
 
+import subprocess
+import sys
+import time
+
 import groot_rocker.console as console
+from groot_rocker import client
+
+##############################################################################
+# Constants
+##############################################################################
+
+GROOT_ROCKER = [sys.executable, '-c', 'from groot_rocker.client import main; main()']
 
 ##############################################################################
 # Helper Methods
@@ -22,3 +33,17 @@ def assert_details(text, expected, result):
           console.cyan + "{}".format(expected) +
           console.yellow + " [{}]".format(result) +
           console.reset)
+
+
+def start_server(environment):
+    """Start ``groot-rocker serve`` (on ``GROOT_ROCKER_SOCKET``), returning once it accepts connections."""
+    server = subprocess.Popen(
+        GROOT_ROCKER + ['serve'], env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while client.connect(environment['GROOT_ROCKER_SOCKET']) is None:
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError("the server failed to start")
+        time.sleep(0.05)
+    return server